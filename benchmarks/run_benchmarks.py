@@ -0,0 +1,287 @@
+"""
+Times loading, validating and rolling on synthetic workbooks generated by
+benchmarks.synthetic, and compares the timings with a stored JSON baseline.
+Any benchmark slower than its baseline by more than the tolerance is reported
+and the exit status is 1, so a regression cannot go unnoticed.
+
+Example:
+    python -m benchmarks.run_benchmarks --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from entities import (WORKBOOK_CACHE, COMPILED_TABLES, Character, build_surge_lull_index,
+                      load_configuration_tables, load_roster_store, run_store_event,
+                      sheet_availability, simulate_encounters, validate_combat_table)
+
+from .synthetic import DEFAULT_SCALE, add_scale_arguments, generate, scale_names
+
+DEFAULT_REPEAT = 5
+DEFAULT_EVENTS = 10
+DEFAULT_TOLERANCE = 0.25
+# Effects looked up per repetition of the surge and lull benchmark.
+LOOKUPS = 100000
+# Encounters of MONTE_CARLO_ROUNDS rounds per repetition of the Monte Carlo
+# benchmark, run in this process so the timing does not depend on the cores.
+MONTE_CARLO_ENCOUNTERS = 100
+MONTE_CARLO_ROUNDS = 10
+BASELINE_VERSION = 1
+# Each timed sample runs the benchmark enough times to last at least this long,
+# so timer resolution and scheduling noise are small next to what is measured.
+MIN_SAMPLE_SECONDS = 0.1
+# Differences from the baseline smaller than this are never regressions,
+# whatever the tolerance, as they are within the noise of a busy machine.
+NOISE_FLOOR_SECONDS = 0.002
+# Name of the fixed workload timed at the start and end of every run. Baseline
+# times are scaled by how much slower or faster it was than in the baseline, so
+# a machine that is slower as a whole does not report every benchmark.
+CALIBRATION = 'calibration'
+
+
+def best_time(function, repeat):
+    """This function times function repeat times and returns the fastest time in
+    seconds for one call along with the median, which shows how noisy the machine
+    was. Functions quicker than MIN_SAMPLE_SECONDS are called several times in each
+    sample, and the sample's time is divided between the calls."""
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    loops = max(1, math.ceil(MIN_SAMPLE_SECONDS / elapsed)) if elapsed > 0 else 1
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        times.append((time.perf_counter() - start) / loops)
+    return min(times), statistics.median(times)
+
+
+def calibration_workload():
+    # Plain Python and numpy work that does not depend on the repository's code.
+    sum(i * i for i in range(200000))
+    np.sort(np.random.default_rng(0).random(200000))
+
+
+def sample_character(names, combat_tables_filepath, role_variant=None):
+    return Character(name="Benchmark", combat_role=names['roles'][0],
+                     combat_stance=names['stances'][0], difficulty='A',
+                     combat_tables_filepath=combat_tables_filepath,
+                     role_variant=role_variant, individual_level='Elite', lazy=True)
+
+
+def run_benchmarks(output_dir, scale, repeat=DEFAULT_REPEAT, events=DEFAULT_EVENTS):
+    """
+    This function generates the workbooks for scale in output_dir and times each
+    benchmark. It returns a dict of benchmark name to a dict with the fastest and
+    median time in seconds.
+    :param output_dir: str, required
+    :param scale: dict of int, required, see benchmarks.synthetic.DEFAULT_SCALE
+    :param repeat: int, optional, defaults to DEFAULT_REPEAT
+    :param events: int, optional, defaults to DEFAULT_EVENTS, for the headless run
+    :return: dict of dict of float
+    """
+    config_filepath, combat_tables_filepath, roster_filepath = generate(output_dir, scale)
+    names = scale_names({**DEFAULT_SCALE, **scale})
+    character = sample_character(names, combat_tables_filepath)
+    table_name = character.combat_action_table_name
+    results = {}
+
+    def record(name, function):
+        fastest, median = best_time(function, repeat)
+        results[name] = {'seconds': fastest, 'median_seconds': median}
+
+    calibration = [best_time(calibration_workload, repeat)]
+
+    def load_workbook():
+        # Every worksheet, parsed from the .xlsx file rather than the sidecar.
+        WORKBOOK_CACHE.clear()
+        WORKBOOK_CACHE.use_sidecar = False
+        try:
+            for sheet_name in WORKBOOK_CACHE.get_sheet_names(combat_tables_filepath):
+                WORKBOOK_CACHE.get_sheet(combat_tables_filepath, sheet_name)
+        finally:
+            WORKBOOK_CACHE.use_sidecar = True
+            WORKBOOK_CACHE.clear()
+
+    record('load_workbook_xlsx', load_workbook)
+
+    def load_workbook_sidecar():
+        WORKBOOK_CACHE.clear()
+        for sheet_name in WORKBOOK_CACHE.get_sheet_names(combat_tables_filepath):
+            WORKBOOK_CACHE.get_sheet(combat_tables_filepath, sheet_name)
+
+    # The first call writes the sidecar, so it is not counted.
+    load_workbook_sidecar()
+    record('load_workbook_sidecar', load_workbook_sidecar)
+    record('load_table_cached_1000',
+           lambda: [character.load_table(table_name) for _ in range(1000)])
+    record('load_table_missing_1000',
+           lambda: [character.load_table(f"{table_name} Missing") for _ in range(1000)])
+
+    def build_availability():
+        WORKBOOK_CACHE.clear()
+        sheet_availability(combat_tables_filepath, names['roles'], names['variants'],
+                           names['stances'])
+
+    record('sheet_availability', build_availability)
+
+    tables = [WORKBOOK_CACHE.get_sheet(combat_tables_filepath, sheet_name)
+              for sheet_name in WORKBOOK_CACHE.get_sheet_names(combat_tables_filepath)]
+    record('validate_all_tables', lambda: [validate_combat_table(table) for table in tables])
+
+    def resolve_tables():
+        # Validation and compiled tables are cached per worksheet, so each
+        # repetition starts from a fresh workbook version.
+        WORKBOOK_CACHE.clear()
+        COMPILED_TABLES.clear()
+        sample_character(names, combat_tables_filepath).resolve_tables()
+
+    record('resolve_tables', resolve_tables)
+
+    character.resolve_tables()
+    table = character.combat_action_table
+    filtered_table = table[table['A'] != '-'][['A', 'Outcome']]
+    record('determine_result_from_table_1000',
+           lambda: [character.determine_result_from_table(filtered_table, 'A')
+                    for _ in range(1000)])
+    record('compiled_roll_1000',
+           lambda: [character.compiled_action_table.roll('A', character.rng)
+                    for _ in range(1000)])
+
+    required_config_dfs, optional_config_dfs = load_configuration_tables(config_filepath)
+    record('build_surge_lull_index',
+           lambda: build_surge_lull_index(required_config_dfs, optional_config_dfs))
+    index = build_surge_lull_index(required_config_dfs, optional_config_dfs)
+    column = character.compiled_action_table.columns['A']
+    outcome_ids = column.outcome_ids[column.sample(LOOKUPS, np.random.default_rng(0))]
+    outcome_ids = outcome_ids.tolist()
+    record(f'surge_lull_lookup_{LOOKUPS}',
+           lambda: [index.lookup_id(outcome_id, 'Elite') for outcome_id in outcome_ids])
+
+    def headless_run():
+        # A whole run from the sidecar, including resolving every table.
+        WORKBOOK_CACHE.clear()
+        COMPILED_TABLES.clear()
+        store = load_roster_store(roster_filepath, combat_tables_filepath, seed=0)
+        for _ in range(events):
+            run_store_event(store, index)
+
+    record('headless_run', headless_run)
+
+    store = load_roster_store(roster_filepath, combat_tables_filepath, seed=0)
+    record(f'monte_carlo_{MONTE_CARLO_ENCOUNTERS}x{MONTE_CARLO_ROUNDS}',
+           lambda: simulate_encounters(store, MONTE_CARLO_ENCOUNTERS, MONTE_CARLO_ROUNDS,
+                                       max_workers=1))
+    calibration.append(best_time(calibration_workload, repeat))
+    fastest, median = min(calibration)
+    results[CALIBRATION] = {'seconds': fastest, 'median_seconds': median}
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """This function returns a message for every benchmark in results that is
+    slower than the baseline by more than tolerance, a fraction of the baseline
+    time, and by more than NOISE_FLOOR_SECONDS. Baseline times are first scaled
+    by machine_speed(). Benchmarks missing from either side are skipped."""
+    speed = machine_speed(results, baseline)
+    regressions = []
+    for name, result in results.items():
+        expected = baseline['results'].get(name)
+        if expected is None or name == CALIBRATION:
+            continue
+        seconds = expected['seconds'] * speed
+        limit = max(seconds * (1 + tolerance), seconds + NOISE_FLOOR_SECONDS)
+        if result['seconds'] > limit:
+            regressions.append(f"{name}: {result['seconds']:.4f} s, baseline "
+                               f"{expected['seconds']:.4f} s scaled to {seconds:.4f} s "
+                               f"(+{tolerance:.0%} allowed).")
+    return regressions
+
+
+def machine_speed(results, baseline):
+    """This function returns how many times longer the calibration workload took
+    in results than in the baseline, or 1.0 if either side did not time it."""
+    current = results.get(CALIBRATION)
+    expected = baseline['results'].get(CALIBRATION)
+    if current is None or expected is None or expected['seconds'] <= 0:
+        return 1.0
+    return current['seconds'] / expected['seconds']
+
+
+def format_results(results, baseline=None):
+    lines = []
+    for name, result in results.items():
+        line = (f"{name:<36} {result['seconds']:>10.4f} s  "
+                f"(median {result['median_seconds']:.4f} s)")
+        if baseline is not None and name in baseline['results']:
+            ratio = result['seconds'] / baseline['results'][name]['seconds']
+            line += f"  {ratio:.2f}x baseline"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loading and rolling on "
+                                                 "synthetic workbooks.")
+    add_scale_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"Times to run each benchmark. Defaults to {DEFAULT_REPEAT}.")
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS,
+                        help=f"Events in the headless run. Defaults to {DEFAULT_EVENTS}.")
+    parser.add_argument('--output-dir', default=None,
+                        help="Folder for the synthetic workbooks. Defaults to a "
+                             "temporary folder.")
+    parser.add_argument('--baseline', default=None,
+                        help="JSON baseline to compare with.")
+    parser.add_argument('--save-baseline', default=None,
+                        help="Write the results to this JSON file as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Fraction slower than the baseline that is allowed. "
+                             f"Defaults to {DEFAULT_TOLERANCE}.")
+    args = parser.parse_args(argv)
+    scale = {key: getattr(args, key) for key in DEFAULT_SCALE}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != scale or baseline.get('events') != args.events:
+            parser.error(f"{args.baseline} was recorded with scale {baseline.get('scale')} "
+                         f"and {baseline.get('events')} events. Run with the same options.")
+
+    if args.output_dir:
+        results = run_benchmarks(args.output_dir, scale, args.repeat, args.events)
+    else:
+        with tempfile.TemporaryDirectory() as output_dir:
+            results = run_benchmarks(output_dir, scale, args.repeat, args.events)
+    print(format_results(results, baseline))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'version': BASELINE_VERSION, 'scale': scale, 'events': args.events,
+                       'python': platform.python_version(), 'machine': platform.machine(),
+                       'cpus': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}.")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("REGRESSIONS:", file=sys.stderr)
+            for regression in regressions:
+                print(f"    {regression}", file=sys.stderr)
+            return 1
+        print(f"No benchmark is more than {args.tolerance:.0%} slower than the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
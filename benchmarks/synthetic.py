@@ -0,0 +1,173 @@
+"""
+Generates synthetic configuration and combat tables workbooks, and a matching
+roster, at any scale, for benchmarking. The workbooks follow the formats
+described in the ReadMe, so every program that reads the real ones can read
+these.
+
+Example:
+    python -m benchmarks.synthetic --output-dir /tmp/scaled --roles 20 --stances 6
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+
+import pandas as pd
+
+DIFFICULTY_VARIATIONS = ['A', 'B', 'C', 'D']
+INDIVIDUAL_LEVEL = ['Low', 'Moderate', 'Advanced', 'Elite']
+EFFECT_LEVELS = ['Minor', 'Major']
+ROSTER_COLUMNS = ['name', 'role', 'variant', 'stance', 'difficulty', 'level']
+CONFIGURATION_FILENAME = 'configuration-tables.xlsx'
+COMBAT_TABLES_FILENAME = 'combat-tables.xlsx'
+ROSTER_FILENAME = 'roster.csv'
+# Names are kept short so that table names stay within Excel's 31 characters.
+DEFAULT_SCALE = {'roles': 4, 'variants': 2, 'stances': 3, 'rows': 12, 'outcomes': 8,
+                 'combatants': 1000, 'seed': 0}
+
+
+def scale_names(scale):
+    """This function returns the role, variant, stance and outcome names used for a
+    scale, as a dict of lists of str."""
+    return {'roles': [f"R{i:03d}" for i in range(scale['roles'])],
+            'variants': [f"V{i:02d}" for i in range(scale['variants'])],
+            'stances': [f"S{i:02d}" for i in range(scale['stances'])],
+            'outcomes': [f"Outcome {i:03d}" for i in range(scale['outcomes'])]}
+
+
+def table_names(names):
+    """This function returns the name of every action and targeting table for the
+    roles, variants and stances in names, including the tables without a variant."""
+    result = []
+    for role in names['roles']:
+        for variant in [None] + names['variants']:
+            for stance in names['stances']:
+                prefix = f"{role} {variant} {stance}" if variant else f"{role} {stance}"
+                result.extend([f"{prefix} Action", f"{prefix} Targeting"])
+    return result
+
+
+def item(low, high):
+    """This function returns a table item for the range low to high, written the
+    way the workbooks do: two digits, 100 as 00 and a single value on its own."""
+    def digits(value):
+        return '00' if value == 100 else f"{value:02d}"
+    return digits(low) if low == high else f"{digits(low)}-{digits(high)}"
+
+
+def combat_table(rng, rows, outcomes):
+    """This function returns one valid combat table of rows rows, splitting 1 to
+    100 at random points in each difficulty column. Some columns are left as
+    dashes, which the workbooks use for difficulties a table does not use."""
+    table = {}
+    for difficulty in DIFFICULTY_VARIATIONS:
+        cuts = sorted(rng.sample(range(1, 100), rows - 1)) + [100]
+        lows = [1] + [cut + 1 for cut in cuts[:-1]]
+        table[difficulty] = [item(low, high) for low, high in zip(lows, cuts)]
+    table['Outcome'] = [rng.choice(outcomes) for _ in range(rows)]
+    return pd.DataFrame(table)
+
+
+def write_configuration_tables(filepath, names):
+    """This function writes a configuration workbook with every required and
+    optional worksheet for names, including surges and lulls for every outcome."""
+    def described(column, values):
+        return pd.DataFrame({column: values,
+                             'Description': [f"Synthetic {value}." for value in values]})
+
+    effects = {'Outcome': names['outcomes']}
+    for effect_level in EFFECT_LEVELS:
+        for level in INDIVIDUAL_LEVEL:
+            effects[f"{effect_level} {level}"] = [f"{effect_level} {level} effect of {outcome}"
+                                                  for outcome in names['outcomes']]
+    sheets = {'Combat Outcomes': described('Outcome', names['outcomes']),
+              'Combat Roles': described('Role', names['roles']),
+              'Combat Stances': described('Role', names['stances']),
+              'Combat Targeting Summary': described('Outcome', names['outcomes']),
+              'Combat Role Variations': described('Role Variant', names['variants']),
+              'Combat Surges': pd.DataFrame(effects),
+              'Combat Lulls': pd.DataFrame(effects)}
+    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+        for sheet_name, table in sheets.items():
+            table.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def write_combat_tables(filepath, names, rows, rng):
+    """This function writes a combat tables workbook with an action and a targeting
+    table for every role, variant and stance. One action outcome in four is a
+    surge or lull so that effect lookups are exercised too."""
+    action_outcomes = list(names['outcomes'])
+    for outcome in names['outcomes'][::4]:
+        for effect_level in EFFECT_LEVELS:
+            action_outcomes.extend([f"{outcome}/{effect_level} Surge",
+                                    f"{outcome}/{effect_level} Lull"])
+    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+        for table_name in table_names(names):
+            outcomes = action_outcomes if table_name.endswith('Action') else names['outcomes']
+            combat_table(rng, rows, outcomes).to_excel(writer, sheet_name=table_name,
+                                                       index=False)
+
+
+def write_roster(filepath, names, combatants, rng):
+    """This function writes a roster CSV file of combatants spread at random over
+    the roles, variants, stances, difficulties and levels in names."""
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ROSTER_COLUMNS)
+        for idx in range(combatants):
+            writer.writerow([f"Combatant {idx + 1}", rng.choice(names['roles']),
+                             rng.choice([''] + names['variants']),
+                             rng.choice(names['stances']),
+                             rng.choice(DIFFICULTY_VARIATIONS),
+                             rng.choice(INDIVIDUAL_LEVEL)])
+
+
+def generate(output_dir, scale=None):
+    """
+    This function writes a configuration workbook, a combat tables workbook and
+    a roster to output_dir and returns their paths. The same scale always gives
+    the same files.
+    :param output_dir: str, required
+    :param scale: dict of int, optional, keys as in DEFAULT_SCALE, missing keys
+        take their default
+    :return: tuple of str, (configuration, combat tables, roster)
+    """
+    scale = {**DEFAULT_SCALE, **(scale or {})}
+    if not 1 <= scale['rows'] <= 100:
+        raise ValueError("rows must be between 1 and 100.")
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(scale['seed'])
+    names = scale_names(scale)
+    paths = (os.path.join(output_dir, CONFIGURATION_FILENAME),
+             os.path.join(output_dir, COMBAT_TABLES_FILENAME),
+             os.path.join(output_dir, ROSTER_FILENAME))
+    write_configuration_tables(paths[0], names)
+    write_combat_tables(paths[1], names, scale['rows'], rng)
+    write_roster(paths[2], names, scale['combatants'], rng)
+    return paths
+
+
+def add_scale_arguments(parser):
+    """This function adds an option to parser for every key in DEFAULT_SCALE."""
+    for key, default in DEFAULT_SCALE.items():
+        parser.add_argument(f"--{key}", type=int, default=default,
+                            help=f"Defaults to {default}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic workbooks and a "
+                                                 "roster for benchmarking.")
+    parser.add_argument('--output-dir', required=True,
+                        help="Folder to write the workbooks and roster to.")
+    add_scale_arguments(parser)
+    args = parser.parse_args(argv)
+    scale = {key: getattr(args, key) for key in DEFAULT_SCALE}
+    for path in generate(args.output_dir, scale):
+        print(path)
+    print(f"{len(table_names(scale_names(scale)))} combat tables.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,6 @@
 from .config_windows import ConfigurationWindow
 from .combat_windows import CombatModelerWindow
+from .watchers import WorkbookWatcher
+from .diagnostics_windows import DiagnosticsWindow
+from .probability_windows import ProbabilitiesWindow, StanceForecastWindow
+from .workers import TableLoadWorker
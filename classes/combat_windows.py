@@ -1,24 +1,39 @@
 import pandas as pd
+from PySide6.QtCore import Qt, QThreadPool, QStringListModel
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QFileDialog,
                                QMessageBox, QApplication, QMainWindow, QStatusBar,
                                QLabel, QHBoxLayout, QDialog, QTableView,
-                               QGridLayout, QDialogButtonBox, QTabWidget,
-                               QLineEdit, QTextEdit, QComboBox, QToolBar, QToolButton)
-from entities import PandasModel, Character
+                               QGridLayout, QDialogButtonBox, QAbstractItemView,
+                               QHeaderView, QLineEdit, QComboBox, QToolBar, QSpinBox,
+                               QStyledItemDelegate, QProgressBar, QListView, QCheckBox)
+from entities import (PERFORMANCE, RosterModel, EventLogModel, EventLog,
+                      LogRecord, Character, build_surge_lull_index, build_transition_models,
+                      check_tables, event_records, read_roster,
+                      read_session, reload_changed_sheets, restore_session, session_snapshot,
+                      write_session)
+from entities.event_log import DEFAULT_SEARCH_LIMIT, MESSAGE, START
+from .probability_windows import ProbabilitiesWindow, StanceForecastWindow
+from .watchers import WorkbookWatcher
+from .workers import ReloadWorker, SimulationWorker
+import logging
 import sys
 import os
-import datetime
+
+logger = logging.getLogger(__name__)
 
 REQUIRED_WORKSHEETS = ['Combat Outcomes', 'Combat Roles', 'Combat Stances',
                        'Combat Targeting Summary']
-OPTIONAL_WORKSHEETS = ['Combat Role Variations', 'Combat Surges', 'Combat Lulls']
+OPTIONAL_WORKSHEETS = ['Combat Role Variations', 'Combat Surges', 'Combat Lulls',
+                       'Combat Stance Transitions', 'Combat Variant Transitions']
 DIFFICULTY_VARIATIONS = ['A', 'B', 'C', 'D']
 INDIVIDUAL_LEVEL = ['Low', 'Moderate', 'Advanced', 'Elite']
+DEFAULT_ROSTER_SIZE = 10
+MAX_COMBATANTS_ADDED = 1000
 
 
 class CombatModelerWindow(QWidget):
     def __init__(self, required_config_dfs, optional_config_dfs,
-                 combat_tables_filepath, parent=None):
+                 combat_tables_filepath, parent=None, max_log_records=None, seed=None):
         super().__init__(parent)
         self.setMinimumSize(800, 600)
         self.setWindowTitle("Combat Modeler")
@@ -32,121 +47,172 @@ class CombatModelerWindow(QWidget):
         # We need lists made from the first column of each config dataframe.
         self.config = self.extract_dropdown_lists(required_config_dfs,
                                                   optional_config_dfs)
-        # We also need the actual dataframes for combat surges and lulls, either
-        # as None or as a dataframe.
-        self.combat_surges = optional_config_dfs['Combat Surges']
-        self.combat_lulls = optional_config_dfs['Combat Lulls']
-        print(f"config: {self.config}")
-        print(f"combat_surges: {self.combat_surges}")
-        print(f"combat_lulls: {self.combat_lulls}")
+        # Combat surges and lulls are compiled into an index once, so problems
+        # with them are reported now rather than when one is rolled.
+        self.surge_lull_index = build_surge_lull_index(required_config_dfs,
+                                                       optional_config_dfs)
+        # The optional stance and role variant transitions, None if not configured.
+        self.stance_model, self.variant_model = build_transition_models(required_config_dfs,
+                                                                        optional_config_dfs)
+        logger.debug("config: %s", self.config)
+        logger.debug("surge_lull_index: %s effects", len(self.surge_lull_index))
         self.event_counter = 0
 
-        # Create tabs
-        self.tab0 = CharacterTab(self, self.config, self.combat_workbook_filepath, "One")
-        self.tab1 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Two")
-        self.tab2 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Three")
-        self.tab3 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Four")
-        self.tab4 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Five")
-        self.tab5 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Six")
-        self.tab6 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Seven")
-        self.tab7 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Eight")
-        self.tab8 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Nine")
-        self.tab9 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Ten")
-        self.tab_widget1 = QTabWidget()
-        self.tab_widget1.addTab(self.tab0, "One")
-        self.tab_widget1.addTab(self.tab1, "Two")
-        self.tab_widget1.addTab(self.tab2, "Three")
-        self.tab_widget1.addTab(self.tab3, "Four")
-        self.tab_widget1.addTab(self.tab4, "Five")
-        self.tab_widget2 = QTabWidget()
-        self.tab_widget2.addTab(self.tab5, "Six")
-        self.tab_widget2.addTab(self.tab6, "Seven")
-        self.tab_widget2.addTab(self.tab7, "Eight")
-        self.tab_widget2.addTab(self.tab8, "Nine")
-        self.tab_widget2.addTab(self.tab9, "Ten")
-
-        mainLayout.addWidget(self.tab_widget1, 0, 0)
-        mainLayout.addWidget(self.tab_widget2, 1, 0)
-
-        # Build text display area here.
-        self.text_display = QTextEdit(self)
-        self.text_display.setReadOnly(True)
-
-        mainLayout.addWidget(self.text_display, 0, 1, 0, 1)
+        # Create the roster. The view only creates widgets for the rows on
+        # screen, and an editor only for the cell being edited, so it stays
+        # responsive with thousands of combatants.
+        self.roster_model = RosterModel(self.config, self.combat_workbook_filepath, self,
+                                        seed)
+        self.roster_model.add_combatants(DEFAULT_ROSTER_SIZE)
+        self.roster_view = QTableView(self)
+        self.roster_view.setModel(self.roster_model)
+        self.roster_view.setItemDelegate(RosterDelegate(self.roster_view))
+        self.roster_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.roster_view.setEditTriggers(QAbstractItemView.DoubleClicked |
+                                         QAbstractItemView.SelectedClicked |
+                                         QAbstractItemView.EditKeyPressed)
+        self.roster_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.roster_view.horizontalHeader().setStretchLastSection(True)
+
+        mainLayout.addWidget(self.roster_view, 0, 0)
+
+        # Roster toolbar.
+        self.roster_toolbar = QToolBar()
+        self.add_count_spinbox = QSpinBox()
+        self.add_count_spinbox.setRange(1, MAX_COMBATANTS_ADDED)
+        self.roster_toolbar.addWidget(self.add_count_spinbox)
+        self.add_combatants_button = QPushButton("Add Combatants")
+        self.add_combatants_button.clicked.connect(self.add_combatants)
+        self.roster_toolbar.addWidget(self.add_combatants_button)
+        self.remove_combatants_button = QPushButton("Remove Selected")
+        self.remove_combatants_button.clicked.connect(self.remove_selected)
+        self.roster_toolbar.addWidget(self.remove_combatants_button)
+        self.toggle_active_button = QPushButton("Toggle Active")
+        self.toggle_active_button.clicked.connect(self.toggle_selected)
+        self.roster_toolbar.addWidget(self.toggle_active_button)
+        self.import_roster_button = QPushButton("Import Roster")
+        self.import_roster_button.clicked.connect(self.import_roster)
+        self.roster_toolbar.addWidget(self.import_roster_button)
+        self.probabilities_button = QPushButton("Show Probabilities")
+        self.probabilities_button.clicked.connect(self.show_probabilities)
+        self.roster_toolbar.addWidget(self.probabilities_button)
+        self.forecast_button = QPushButton("Forecast Stances")
+        self.forecast_button.clicked.connect(self.show_stance_forecast)
+        self.roster_toolbar.addWidget(self.forecast_button)
+
+        mainLayout.addWidget(self.roster_toolbar, 1, 0)
+
+        # Build the event log here. Only the most recent records are kept in
+        # memory and the list view only draws the rows on screen. Older records
+        # are spilled to disk, where Search still finds them.
+        self.event_log_model = EventLogModel(EventLog(max_log_records), self)
+        self.log_view = QListView(self)
+        self.log_view.setModel(self.event_log_model)
+        self.log_view.setUniformItemSizes(True)
+        self.log_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.log_search_input = QLineEdit(self)
+        self.log_search_input.setPlaceholderText("Search the event log")
+        self.log_search_input.returnPressed.connect(self.search_log)
+        self.log_search_button = QPushButton("Search")
+        self.log_search_button.clicked.connect(self.search_log)
+        log_search_layout = QHBoxLayout()
+        log_search_layout.addWidget(self.log_search_input)
+        log_search_layout.addWidget(self.log_search_button)
+        log_layout = QVBoxLayout()
+        log_layout.addLayout(log_search_layout)
+        log_layout.addWidget(self.log_view)
+
+        mainLayout.addLayout(log_layout, 0, 1, 2, 1)
 
         # Adding Toolbar.
         self.toolbar = QToolBar()
         self.run_sim_button = QPushButton("Run Simulation")
         self.run_sim_button.clicked.connect(self.run_simulation)
         self.toolbar.addWidget(self.run_sim_button)
-        self.clear_tab_data_button = QPushButton("Clear Tab Data")
-        self.clear_tab_data_button.clicked.connect(self.clear_tabs)
-        self.toolbar.addWidget(self.clear_tab_data_button)
+        self.clear_roster_button = QPushButton("Clear Roster")
+        self.clear_roster_button.clicked.connect(self.clear_roster)
+        self.toolbar.addWidget(self.clear_roster_button)
+        self.save_session_button = QPushButton("Save Session")
+        self.save_session_button.clicked.connect(self.save_tab_data)
+        self.toolbar.addWidget(self.save_session_button)
+        self.load_session_button = QPushButton("Load Session")
+        self.load_session_button.clicked.connect(self.load_tab_data)
+        self.toolbar.addWidget(self.load_session_button)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_simulation)
+        self.cancel_button.setEnabled(False)
+        self.toolbar.addWidget(self.cancel_button)
+        self.advance_stances_checkbox = QCheckBox("Advance Stances")
+        self.advance_stances_checkbox.setToolTip("After each event, move the active "
+                                                 "combatants to a stance drawn from the "
+                                                 "stance transitions.")
+        self.toolbar.addWidget(self.advance_stances_checkbox)
         self.close_window_button = QPushButton("Close Window")
         self.close_window_button.clicked.connect(self.close_simulator)
         self.toolbar.addWidget(self.close_window_button)
 
-        mainLayout.addWidget(self.toolbar, 2, 0, 2, 0)
+        mainLayout.addWidget(self.toolbar, 2, 0, 1, 2)
+
+        # Status area showing the progress of a simulation running on the
+        # thread pool.
+        self.statusbar = QStatusBar()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        self.statusbar.addPermanentWidget(self.progress_bar)
+        self.worker = None
+
+        mainLayout.addWidget(self.statusbar, 3, 0, 1, 2)
 
         self.setLayout(mainLayout)
-        print(f"CombatModelerWindow.init: Initialization completed.")
 
-    def check_table_validation(self):
+        # Worksheets edited while the window is open are reloaded in place.
+        # Changes that arrive while a worker is rolling wait until it is done.
+        self.pending_sheets = set()
+        self.workbook_watcher = WorkbookWatcher(self.combat_workbook_filepath, self)
+        self.workbook_watcher.changed.connect(self.reload_combat_tables)
+
+        self.update_transition_controls()
+        problems = (self.surge_lull_index.problems + self.transition_problems()
+                    + self.sheet_name_problems())
+        if problems:
+            self.add_log_records([LogRecord(0, MESSAGE, problem) for problem in problems])
+        logger.debug("CombatModelerWindow.init: Initialization completed.")
+
+    def transition_problems(self):
+        """This method returns the problems found in the transition worksheets."""
+        return [problem for model in (self.stance_model, self.variant_model)
+                if model is not None for problem in model.problems]
+
+    def sheet_name_problems(self):
+        """This method returns the combat table names that Excel's 31 character limit
+        cuts to the same worksheet name."""
+        availability = self.roster_model.availability()
+        return [] if availability is None else availability.problems
+
+    def update_transition_controls(self):
+        """This method enables the stance controls only when stance transitions are
+        configured."""
+        configured = self.stance_model is not None
+        self.forecast_button.setEnabled(configured and self.worker is None)
+        self.advance_stances_checkbox.setEnabled(configured)
+        if not configured:
+            self.advance_stances_checkbox.setChecked(False)
+
+    def check_table_validation(self, characters=None):
         """This method generates warnings when a table is not valid. It also checks
         to see if a table was assigned. It returns a tuple of integers, the first is
         the error count, the second the number that were missing. This allows the
-        requesting method or function to determine if there is an actual problem."""
-        error_ctr = 0
-        missing_ctr = 0
-        print(f"CombatModelerWindow.check_table_validation: Testing tables.")
-        for i in range(self.tab_widget1.count()):
-            # We need to check if a pd.DataFrame was added as a targeting table.
-            print(f"CombatModelerWindow.check_table_validation: checking "
-                  f"combat_targeting_table in widget panel 1: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table}")
-            if not isinstance(self.tab_widget1.widget(i).character.combat_targeting_table,
-                              pd.DataFrame):
-                if self.tab_widget1.widget(i).character.combat_targeting_table == "missing":
-                    missing_ctr += 1
-                else:
-                    error_ctr += 1
-                    self.generate_error_dialog(
-                        self.tab_widget1.widget(i).character.combat_targeting_table_name)
-            print(f"CombatModelerWindow.check_table_validation: checking "
-                  f"combat_action_table in widget panel 1: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table}")
-            if not isinstance(self.tab_widget1.widget(i).character.combat_action_table,
-                              pd.DataFrame):
-                if self.tab_widget1.widget(i).character.combat_action_table == "missing":
-                    missing_ctr += 1
-                else:
-                    error_ctr += 1
-                    self.generate_error_dialog(
-                        self.tab_widget1.widget(i).character.combat_action_table_name)
-            print(f"CombatModelerWindow.check_table_validation: checking "
-                  f"combat_targeting_table in widget panel 2: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table}")
-            if not isinstance(self.tab_widget2.widget(i).character.combat_targeting_table,
-                              pd.DataFrame):
-                if self.tab_widget2.widget(i).character.combat_targeting_table == "missing":
-                    missing_ctr += 1
-                else:
-                    error_ctr += 1
-                    self.generate_error_dialog(
-                        self.tab_widget2.widget(i).character.combat_targeting_table_name)
-            print(f"CombatModelerWindow.check_table_validation: checking "
-                  f"combat_action_table in widget panel 2: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table}")
-            if not isinstance(self.tab_widget2.widget(i).character.combat_action_table,
-                              pd.DataFrame):
-                if self.tab_widget2.widget(i).character.combat_action_table == "missing":
-                    missing_ctr += 1
-                else:
-                    error_ctr += 1
-                    self.generate_error_dialog(
-                        self.tab_widget2.widget(i).character.combat_action_table_name)
-        print(f"CombatModelerWindow.check_table_validation: Validation completed. Error "
-              f"count: {error_ctr}. Missing count: {missing_ctr}.")
+        requesting method or function to determine if there is an actual problem.
+        Only the given characters are checked, by default the active ones. Each
+        invalid table is reported once however many characters use it. Run
+        Simulation does the same checks on a worker thread instead."""
+        if characters is None:
+            characters = self.roster_model.active_characters()
+        error_ctr, missing_ctr, invalid_tables = check_tables(characters)
+        for table_name in invalid_tables:
+            self.generate_error_dialog(table_name)
+        logger.debug("CombatModelerWindow.check_table_validation: Validation completed. "
+                     "Error count: %s. Missing count: %s.", error_ctr, missing_ctr)
         return (error_ctr, missing_ctr)
 
     def generate_error_dialog(self, table_name):
@@ -183,298 +249,353 @@ class CombatModelerWindow(QWidget):
         return config
 
     def run_simulation(self):
-        print(f"CombatModelerWindow.run_simulation: Starting simulation.")
-        ctr = 0
-        self.text_display.append(
-            f"<h2>Beginning Event {self.event_counter + 1}</h2>")
-        errors, missing = self.check_table_validation()
-        if errors:
-            self.text_display.append(
-                f"<h1>One of the combat tables is invalid.</h1>")
+        """This method starts an event for the active combatants on the thread pool.
+        Loading tables and rolling happen on the worker, and the results are shown by
+        show_simulation_results() when it finishes."""
+        if self.worker is not None:
+            return
+        logger.debug("CombatModelerWindow.run_simulation: Starting simulation.")
+        characters = self.roster_model.active_characters()
+        self.worker = SimulationWorker(characters, self.surge_lull_index)
+        self.worker.signals.progress.connect(self.show_simulation_progress)
+        self.worker.signals.finished.connect(self.show_simulation_results)
+        self.worker.signals.cancelled.connect(self.simulation_cancelled)
+        self.worker.signals.failed.connect(self.simulation_failed)
+        self.set_busy(True)
+        self.statusbar.showMessage(f"Running Event {self.event_counter + 1}.")
+        QThreadPool.globalInstance().start(self.worker)
+
+    @PERFORMANCE.timed('show_simulation_results')
+    def show_simulation_results(self, result):
+        for table_name in result['invalid_tables']:
+            self.generate_error_dialog(table_name)
+        event = self.event_counter + 1
+        if result['errors']:
+            self.add_log_records([LogRecord(event, START, f"Beginning Event {event}"),
+                                  LogRecord(event, MESSAGE,
+                                            "One of the combat tables is invalid.")])
+            self.set_busy(False)
             return
-        if missing == 20:
-            self.text_display.append(
-                f"<h1>None of the combatants were made active.</h1>")
-
-        for i in range(self.tab_widget1.count()):
-            print(f"CombatModelerWindow.run_simulation: first group: i: {i}")
-            print(f"CombatModelerWindow.run_simulation: status: "
-                  f"{self.tab_widget1.widget(i).status}")
-            print(f"CombatModelerWindow.run_simulation: action: "
-                  f"{self.tab_widget1.widget(i).character.combat_action_table_name}")
-            print(f"CombatModelerWindow.run_simulation: actual table: "
-                  f"{self.tab_widget1.widget(i).character.combat_action_table}")
-            print(f"CombatModelerWindow.run_simulation: target: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table_name}")
-            print(f"CombatModelerWindow.run_simulation: actual table: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table}")
-            if self.tab_widget1.widget(i).status:
-                # Generate an action and a target.
-                self.tab_widget1.widget(i).character.roll_for_combat_action()
-                self.tab_widget1.widget(i).character.roll_for_combat_targeting()
-
-                # Pull out the data that is needed.
-                name = self.tab_widget1.widget(i).character.name
-                action = self.tab_widget1.widget(i).character.action
-                target = self.tab_widget1.widget(i).character.target
-                level = self.tab_widget1.widget(i).character.level
-
-                self.text_display.append(
-                    f"<p>{name} targets {target} with {action}</p>")
-
-                # Handling surges and lulls.
-                if 'Surge' in action:
-                    surge_result = self.get_surge_or_lull_result(
-                        action, level, 'surge', self.combat_surges)
-                    self.text_display.append(f"<b>{surge_result}.")
-                elif "Lull" in action:
-                    lull_result = self.get_surge_or_lull_result(
-                        action, level, 'lull', self.combat_lulls)
-                    self.text_display.append(f"<b>{lull_result}.")
-
-                ctr += 1
-            else:
-                continue
-
-        for i in range(self.tab_widget2.count()):
-            print(f"CombatModelerWindow.run_simulation: second group: i: {i}")
-            print(f"CombatModelerWindow.run_simulation: status: "
-                  f"{self.tab_widget1.widget(i).status}")
-            print(f"CombatModelerWindow.run_simulation: action: "
-                  f"{self.tab_widget1.widget(i).character.combat_action_table_name}")
-            print(f"CombatModelerWindow.run_simulation: actual table: "
-                  f"{self.tab_widget1.widget(i).character.combat_action_table}")
-            print(f"CombatModelerWindow.run_simulation: target: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table_name}")
-            print(f"CombatModelerWindow.run_simulation: actual table: "
-                  f"{self.tab_widget1.widget(i).character.combat_targeting_table}")
-            if self.tab_widget2.widget(i).status:
-                self.tab_widget2.widget(i).character.roll_for_combat_action()
-                self.tab_widget2.widget(i).character.roll_for_combat_targeting()
-
-                # Pull out the data_orig needed.
-                name = self.tab_widget2.widget(i).character.name
-                action = self.tab_widget2.widget(i).character.action
-                target = self.tab_widget2.widget(i).character.target
-                level = self.tab_widget1.widget(i).character.level
-
-                self.text_display.append(
-                    f"<p>{name} targets {target} with {action}</p>")
-
-                # Handling surges and lulls.
-                # Handling surges and lulls.
-                if 'Surge' in action:
-                    surge_result = self.get_surge_or_lull_result(
-                        action, level, 'surge', self.combat_surges)
-                    self.text_display.append(f"<b>{surge_result}.")
-                elif "Lull" in action:
-                    lull_result = self.get_surge_or_lull_result(
-                        action, level, 'lull', self.combat_lulls)
-                    self.text_display.append(f"<b>{lull_result}.")
-
-                ctr += 1
-            else:
-                continue
-        self.text_display.append(
-            f"<h3>End of Event {self.event_counter + 1}</h3>")
-        self.event_counter += 1
 
-        if ctr == 0:
-            self.text_display.append(f"<p><b>No tabs are active currently.</b></p>")
+        records = event_records(event, result['results'])
+        if not result['results']:
+            records.append(LogRecord(event, MESSAGE, "No combatants are active currently."))
+        self.event_counter += 1
+        if self.advance_stances_checkbox.isChecked():
+            records.extend(self.advance_stances(self.event_counter))
+        self.add_log_records(records)
+        self.set_busy(False)
+        self.statusbar.showMessage(f"Event {self.event_counter} completed.", 3000)
+
+    def advance_stances(self, event):
+        """This method moves the active combatants to their stances for the next
+        round, drawn from the event's own stream so a seeded roster repeats, and
+        returns a log record for each combatant that changed."""
+        changed = self.roster_model.advance_stances(
+            self.stance_model, self.roster_model.streams.transition_generator(event),
+            self.variant_model)
+        records = []
+        for character, stance, variant in changed:
+            text = f"{character.name} changes from {stance} to {character.combat_stance}."
+            if variant != character.role_variant:
+                text = (f"{character.name} changes from {stance} {variant or ''} to "
+                        f"{character.combat_stance} {character.role_variant or ''}.")
+            records.append(LogRecord(event, MESSAGE, text))
+        return records
+
+    def add_log_records(self, records):
+        """This method adds records to the event log in one batch, keeping the view
+        scrolled to the end if it already was."""
+        scrollbar = self.log_view.verticalScrollBar()
+        at_end = scrollbar.value() == scrollbar.maximum()
+        self.event_log_model.add_records(records)
+        if at_end:
+            self.log_view.scrollToBottom()
+
+    def search_log(self):
+        """This method shows every record in the event log containing the search
+        text, including records already spilled to disk."""
+        text = self.log_search_input.text().strip()
+        if not text:
+            return
+        matches = self.event_log_model.event_log.search(text)
+        dialog = EventSearchDialog(text, matches, self)
+        dialog.exec()
+
+    def show_simulation_progress(self, done, total, stage):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.statusbar.showMessage(f"{stage}: {done} of {total} combatants.")
+
+    def cancel_simulation(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.statusbar.showMessage("Cancelling.")
+
+    def simulation_cancelled(self):
+        self.add_log_records([LogRecord(self.event_counter + 1, MESSAGE,
+                                        f"Event {self.event_counter + 1} cancelled.")])
+        self.set_busy(False)
+        self.statusbar.showMessage("Simulation cancelled.", 3000)
+
+    def simulation_failed(self, error):
+        self.set_busy(False)
+        QMessageBox.critical(self, 'Error', f"Simulation failed: {error}")
+
+    def set_busy(self, busy):
+        """This method disables everything that changes the roster while a worker
+        is using it, and enables the Cancel button and progress bar instead."""
+        for button in (self.run_sim_button, self.clear_roster_button,
+                       self.add_combatants_button, self.remove_combatants_button,
+                       self.toggle_active_button, self.import_roster_button,
+                       self.probabilities_button, self.save_session_button,
+                       self.load_session_button):
+            button.setEnabled(not busy)
+        self.forecast_button.setEnabled(not busy and self.stance_model is not None)
+        self.cancel_button.setEnabled(busy)
+        self.roster_model.set_read_only(busy)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(busy)
+        if not busy:
+            self.worker = None
+            self.statusbar.clearMessage()
+            if self.pending_sheets:
+                self.reload_combat_tables(sorted(self.pending_sheets))
+
+    def reload_combat_tables(self, changed):
+        """This method reloads the combat tables edited on disk on the thread pool.
+        Only the characters rolling on one of the changed worksheets reload their
+        tables. Their roster rows and the event log are kept, and the roster cannot
+        be changed until combat_tables_reloaded() is called.
+        :param changed: list of str, required, the names of the changed worksheets
+        """
+        if self.worker is not None:
+            self.pending_sheets.update(changed)
+            return
+        self.pending_sheets.clear()
+        self.worker = ReloadWorker(self.combat_workbook_filepath, changed,
+                                   self.roster_model.characters())
+        self.worker.signals.finished.connect(self.combat_tables_reloaded)
+        self.worker.signals.failed.connect(self.reload_failed)
+        self.set_busy(True)
+        # A reload cannot be cancelled part way.
+        self.cancel_button.setEnabled(False)
+        self.statusbar.showMessage(f"Reloading {', '.join(changed)}.")
+        QThreadPool.globalInstance().start(self.worker)
+
+    def combat_tables_reloaded(self, changed, reloaded):
+        self.add_log_records([LogRecord(self.event_counter + 1, MESSAGE,
+                                        f"Reloaded {', '.join(changed)}. "
+                                        f"{len(reloaded)} combatants updated.")])
+        if reloaded:
+            self.check_table_validation(reloaded)
+        # Worksheets changed during the reload start another one here.
+        self.set_busy(False)
+        if self.worker is None:
+            self.statusbar.showMessage(f"Reloaded {len(changed)} combat tables.", 3000)
+
+    def reload_failed(self, error):
+        self.set_busy(False)
+        QMessageBox.critical(self, 'Error', f"Reloading the combat tables failed: {error}")
+
+    def reload_configuration(self, required_config_dfs, optional_config_dfs):
+        """This method applies a configuration workbook that was edited on disk: the
+        dropdown lists, the surge and lull index and the stance transitions are
+        rebuilt. The roster and the event log are kept.
+        :param required_config_dfs: dict of pd.DataFrame, required
+        :param optional_config_dfs: dict of pd.DataFrame, required
+        """
+        self.config = self.extract_dropdown_lists(required_config_dfs,
+                                                  optional_config_dfs)
+        self.roster_model.config = self.config
+        self.surge_lull_index = build_surge_lull_index(required_config_dfs,
+                                                       optional_config_dfs)
+        self.stance_model, self.variant_model = build_transition_models(required_config_dfs,
+                                                                        optional_config_dfs)
+        self.update_transition_controls()
+        records = [LogRecord(self.event_counter + 1, MESSAGE,
+                             "Reloaded the configuration tables.")]
+        records.extend(LogRecord(self.event_counter + 1, MESSAGE, problem)
+                       for problem in self.surge_lull_index.problems
+                       + self.transition_problems() + self.sheet_name_problems())
+        self.add_log_records(records)
+
+    def selected_rows(self):
+        """This method returns the roster rows selected in the view."""
+        return [index.row() for index in self.roster_view.selectionModel().selectedRows()]
+
+    def add_combatants(self):
+        self.roster_model.add_combatants(self.add_count_spinbox.value())
+
+    def remove_selected(self):
+        self.roster_model.remove_rows(self.selected_rows())
+
+    def toggle_selected(self):
+        """This method makes the selected combatants active, or inactive if all of
+        them already are. Only active combatants take part in Run Simulation."""
+        rows = self.selected_rows()
+        if not rows:
+            return
+        active = self.roster_model.active_rows()
+        self.roster_model.set_active(rows, not all(row in active for row in rows))
+
+    def show_probabilities(self):
+        """This method shows the exact outcome probabilities of the selected
+        combatants, or of the active ones if none are selected."""
+        characters = self.roster_model.characters()
+        rows = self.selected_rows()
+        if rows:
+            characters = [characters[row] for row in sorted(rows)]
+        else:
+            characters = self.roster_model.active_characters()
+        if not characters:
+            self.statusbar.showMessage("Select or activate combatants first.", 3000)
+            return
+        ProbabilitiesWindow(characters, self).exec()
+
+    def show_stance_forecast(self):
+        """This method forecasts the stances and outcomes of the selected
+        combatants, or of the active ones if none are selected."""
+        characters = self.roster_model.characters()
+        rows = self.selected_rows()
+        if rows:
+            characters = [characters[row] for row in sorted(rows)]
+        else:
+            characters = self.roster_model.active_characters()
+        if not characters:
+            self.statusbar.showMessage("Select or activate combatants first.", 3000)
+            return
+        StanceForecastWindow(characters, self.stance_model, self.variant_model, self).exec()
+
+    def import_roster(self):
+        """This method adds the combatants in a roster CSV file, as used by the
+        headless runner, to the roster and makes them active."""
+        filepath, _ = QFileDialog.getOpenFileName(self, "Import Roster", "",
+                                                  "CSV files (*.csv)")
+        if not filepath:
+            return
+        try:
+            characters = [Character(combat_tables_filepath=self.combat_workbook_filepath,
+                                    lazy=True, **row)
+                          for row in read_roster(filepath)]
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, 'Error', f"Could not import roster: {e}")
+            return
+        self.roster_model.add_characters(characters, active=True)
 
-    @staticmethod
-    def get_surge_or_lull_result(action, level, event_type, table):
-        event = event_type.title()
-        action_list = action.split('/')
-        effect_list = action_list[1].split(' ')
-        actual_action = action_list[0].strip()
-        effect_level = effect_list[0]
-        print(f"actual_action: {actual_action}. surge_level: {effect_level}")
-        table_col = f"{effect_level} {level}"
-        series = table["Outcome"]
-        mask = (series == actual_action)
-        surge_row = series.index[mask]
-        print(f"surge_col: {table_col}. surge_row: {surge_row}")
-        result = str(table.loc[surge_row][table_col])
-        # Strip off leading index.
-        result = result[2:]
-        result = result.split('Name')[0]
-        return f"{effect_level} {event}: {result}"
-
-    def clear_tabs(self):
+    def clear_roster(self):
         """Reinitialize the window."""
-        self.text_display.clear()
-        self.tab_widget1.clear()
-        self.tab_widget2.clear()
-        self.tab0 = CharacterTab(self, self.config, self.combat_workbook_filepath, "One")
-        self.tab1 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Two")
-        self.tab2 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Three")
-        self.tab3 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Four")
-        self.tab4 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Five")
-        self.tab5 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Six")
-        self.tab6 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Seven")
-        self.tab7 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Eight")
-        self.tab8 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Nine")
-        self.tab9 = CharacterTab(self, self.config, self.combat_workbook_filepath, "Ten")
-        self.tab_widget1.addTab(self.tab0, "One")
-        self.tab_widget1.addTab(self.tab1, "Two")
-        self.tab_widget1.addTab(self.tab2, "Three")
-        self.tab_widget1.addTab(self.tab3, "Four")
-        self.tab_widget1.addTab(self.tab4, "Five")
-        self.tab_widget2.addTab(self.tab5, "Six")
-        self.tab_widget2.addTab(self.tab6, "Seven")
-        self.tab_widget2.addTab(self.tab7, "Eight")
-        self.tab_widget2.addTab(self.tab8, "Nine")
-        self.tab_widget2.addTab(self.tab9, "Ten")
-
-        # Checking the results of the validations.
-        self.check_table_validation()
+        self.event_counter = 0
+        self.event_log_model.clear()
+        self.roster_model.clear()
+        self.roster_model.add_combatants(DEFAULT_ROSTER_SIZE)
 
     def save_tab_data(self):
-        pass
+        """This method saves the roster, which combatants are active, the event
+        counter and the random number streams to a session file, along with a
+        fingerprint of every combat table the combatants roll on."""
+        filepath, _ = QFileDialog.getSaveFileName(self, "Save Session", "session.json",
+                                                  "Session (*.json)")
+        if not filepath:
+            return
+        active_rows = self.roster_model.active_rows()
+        characters = self.roster_model.characters()
+        snapshot = session_snapshot(characters,
+                                    [row in active_rows for row in range(len(characters))],
+                                    self.combat_workbook_filepath, self.event_counter,
+                                    self.roster_model.stream_state())
+        try:
+            write_session(filepath, snapshot)
+        except OSError as e:
+            QMessageBox.critical(self, 'Error', f"Could not save the session: {e}")
+            return
+        self.statusbar.showMessage(f"Saved {len(characters)} combatants to {filepath}.", 3000)
 
     def load_tab_data(self):
-        pass
+        """This method replaces the roster with a saved session and carries on from
+        its event counter and random number streams. Combat tables that have not
+        changed since the session was saved are not validated again."""
+        filepath, _ = QFileDialog.getOpenFileName(self, "Load Session", "",
+                                                  "Session (*.json);;All files (*)")
+        if not filepath:
+            return
+        try:
+            snapshot = read_session(filepath)
+            characters, active, changed = restore_session(snapshot,
+                                                          self.combat_workbook_filepath)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, 'Error', f"Could not load the session: {e}")
+            return
+        self.roster_model.restore(characters, active, snapshot['roster_state'])
+        self.event_counter = snapshot['event_counter']
+        text = f"Loaded {len(characters)} combatants from {os.path.basename(filepath)}."
+        if changed:
+            text += f" Changed since it was saved: {', '.join(changed)}."
+        self.add_log_records([LogRecord(self.event_counter, MESSAGE, text)])
+        if changed:
+            self.check_table_validation()
 
     def close_simulator(self):
         self.close()
 
+    def closeEvent(self, event):
+        # A running worker still refers to the roster, so let it stop first.
+        if self.worker is not None:
+            self.worker.cancel()
+            QThreadPool.globalInstance().waitForDone()
+        self.event_log_model.event_log.close()
+        super().closeEvent(event)
 
-class CharacterTab(QWidget):
-    def __init__(self, parent, config, combat_tables_filepath, name):
-        super().__init__(parent)
-        self.config = config
-        self.combat_workbook_filepath = combat_tables_filepath
 
-        # Create character assigned to this tab.
-        self.name = name
-        self.combat_role = config['Combat Roles'][0]
-        self.combat_stance = config['Combat Stances'][0]
-        self.difficulty = config['Relative Difficulty'][0]
-        if config['Combat Role Variations'] is not None:
-            self.role_variant = config['Combat Role Variations'][0]
-        else:
-            self.role_variant = None
-        if config['Surges and Lulls'] is not None:
-            self.level = INDIVIDUAL_LEVEL[0]
-        else:
-            self.level = None
-        self.character = Character(name = self.name,
-                                   combat_role=self.combat_role,
-                                   combat_stance=self.combat_stance,
-                                   combat_tables_filepath=self.combat_workbook_filepath,
-                                   difficulty=self.difficulty,
-                                   role_variant=self.role_variant,
-                                   individual_level=self.level)
-
-        # Set up tab layout and widget content.
-        self.layout = QGridLayout()
-        self.tab_name_label = QLabel("Set Name:")
-        self.layout.addWidget(self.tab_name_label, 0, 0)
-        self.name_input = QLineEdit(self)
-        self.name_input.setText(self.name)
-        self.layout.addWidget(self.name_input, 0, 1)
-
-        # Create Combat Role ComboBox.
-        self.combat_role_label = QLabel("Combat Role:")
-        self.layout.addWidget(self.combat_role_label, 1, 0)
-        self.combat_role_cbox = QComboBox()
-        for item in self.config['Combat Roles']:
-            self.combat_role_cbox.addItem(item)
-        self.layout.addWidget(self.combat_role_cbox, 1, 1)
-
-        # Create Combat Stance ComboBox.
-        self.combat_stance_label = QLabel("Combat Stance:")
-        self.layout.addWidget(self.combat_stance_label, 2, 0)
-        self.combat_stance_cbox = QComboBox()
-        for item in self.config['Combat Stances']:
-            self.combat_stance_cbox.addItem(item)
-        self.layout.addWidget(self.combat_stance_cbox, 2, 1)
-
-        # Create Combat Difficulty ComboBox.
-        self.difficulty_label = QLabel("Encounter Difficulty:")
-        self.layout.addWidget(self.difficulty_label, 3, 0)
-        self.difficulty_cbox = QComboBox()
-        for item in self.config['Relative Difficulty']:
-            self.difficulty_cbox.addItem(item)
-        self.layout.addWidget(self.difficulty_cbox, 3, 1)
-
-        # Create Combat Role Variant ComboBox.
-        self.combat_role_variant_label = QLabel("Role Variants:")
-        self.layout.addWidget(self.combat_role_variant_label, 4, 0)
-        if config['Combat Role Variations']:
-            self.combat_role_variant_cbox = QComboBox()
-            for item in self.config['Combat Role Variations']:
-                self.combat_role_variant_cbox.addItem(item)
+class EventSearchDialog(QDialog):
+    """This dialog lists the event log records found by a search, with the event
+    each one belongs to."""
+    def __init__(self, text, records, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Event Log Search: {text}")
+        self.setMinimumSize(500, 400)
+        layout = QVBoxLayout()
+        if len(records) >= DEFAULT_SEARCH_LIMIT:
+            summary = f"Showing the first {len(records)} matches."
         else:
-            self.combat_role_variant_cbox = QLabel("Not configured")
-        self.layout.addWidget(self.combat_role_variant_cbox, 4, 1)
-
-        # Create Combat Surges and Lulls ComboBox.
-        self.combat_surge_lull_label = QLabel("Surges and/or Lulls:")
-        self.layout.addWidget(self.combat_surge_lull_label, 5, 0)
-        if config['Surges and Lulls']:
-            self.combat_surge_lull_cbox = QComboBox()
-            for item in self.config['Surges and Lulls']:
-                self.combat_surge_lull_cbox.addItem(item)
+            summary = f"{len(records)} matches."
+        layout.addWidget(QLabel(summary))
+        self.results_model = QStringListModel(
+            [f"Event {record.event}: {record.text}" for record in records], self)
+        self.results_view = QListView(self)
+        self.results_view.setModel(self.results_model)
+        self.results_view.setUniformItemSizes(True)
+        self.results_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.results_view)
+        button_box = QDialogButtonBox(QDialogButtonBox.Close)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+        self.setLayout(layout)
+
+
+class RosterDelegate(QStyledItemDelegate):
+    """This delegate edits roster columns that have a fixed list of choices
+    with a QComboBox and leaves the Name column as free text. Roles, variants and
+    stances only offer the combinations that have worksheets."""
+    def createEditor(self, parent, option, index):
+        options = index.model().options(index.column(), index.row())
+        if not options:
+            return super().createEditor(parent, option, index)
+        editor = QComboBox(parent)
+        editor.addItems(options)
+        return editor
+
+    def setEditorData(self, editor, index):
+        if isinstance(editor, QComboBox):
+            editor.setCurrentText(index.data(Qt.EditRole))
         else:
-            self.combat_surge_lull_cbox = QLabel("Not configured")
-        self.layout.addWidget(self.combat_surge_lull_cbox, 5, 1)
+            super().setEditorData(editor, index)
 
-        # Create Toggle Active button and QLabel to show status.
-        # There is also an attribute to store this status.
-        self.toggle_active_button = QPushButton("Toggle Active")
-        self.status = False
-        self.status_label = QLabel("Inactive")
-        self.toggle_active_button.clicked.connect(self.toggle_status)
-        self.layout.addWidget(self.toggle_active_button, 6, 0)
-        self.layout.addWidget(self.status_label, 6, 1)
-
-        # Create tab button to update character data_orig for the tab and
-        # a label it can use to write when the last update occurred.
-        self.update_button = QPushButton("Update Character")
-        self.update_button.clicked.connect(self.update_character)
-        self.update_label = QLabel()
-        self.layout.addWidget(self.update_button, 7, 0)
-        self.layout.addWidget(self.update_label, 7, 1)
-
-        self.setLayout(self.layout)
-        print(f"CharacterTab.init: Initialization of character tab completed.")
-
-    def update_character(self):
-        print(f"CharacterTab.update_character: Character update started.")
-        self.name = self.name_input.text()
-        self.combat_role = self.combat_role_cbox.currentText()
-        self.combat_stance = self.combat_stance_cbox.currentText()
-        self.difficulty = self.difficulty_cbox.currentText()
-        # __init__() set self.roll_variant to None if config has it as None.
-        if self.config['Combat Role Variations'] is not None:
-            self.role_variant = self.combat_role_variant_cbox.currentText()
-        # __init__() set self.level to None if config has it as None.
-        if self.config['Surges and Lulls'] is not None:
-            self.level = self.combat_surge_lull_cbox.currentText()
-        self.character.update_status(name=self.name,
-                                     combat_role=self.combat_role,
-                                     combat_stance=self.combat_stance,
-                                     difficulty=self.difficulty,
-                                     role_variant=self.role_variant,
-                                     individual_level=self.level)
-        time = datetime.datetime.now()
-        time_str = "%d/%m/%y %H:%M"
-        update_text = f"{self.name} updated at {time.strftime(time_str)}"
-        self.update_label.setText(update_text)
-        print(f"CharacterTab.update_character: Updates completed.")
-
-    def toggle_status(self):
-        """This status determines whether the character will be used
-        when the Run Simulation button is clicked in the CharacterModeler
-        window."""
-        if self.status:
-            self.status = False
-            self.status_label.setText("Inactive")
+    def setModelData(self, editor, model, index):
+        if isinstance(editor, QComboBox):
+            model.setData(index, editor.currentText(), Qt.EditRole)
         else:
-            self.status = True
-            self.status_label.setText("<b>Active</b>")
+            super().setModelData(editor, model, index)
 
 
 if __name__ == "__main__":
@@ -3,13 +3,17 @@ from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QFileDialog, QM
     QApplication, QMainWindow, QStatusBar, QLabel, QHBoxLayout, QDialog, QTableView, \
     QGridLayout, QDialogButtonBox
 from entities import PandasModel
+import logging
 import sys
 import os
 
+logger = logging.getLogger(__name__)
+
 CONFIGURATION_FILEPATH = '../data/configuration-tables.xlsx'
 REQUIRED_WORKSHEETS = ['Combat Outcomes', 'Combat Roles', 'Combat Stances',
                        'Combat Targeting Summary']
-OPTIONAL_WORKSHEETS = ['Combat Role Variations', 'Combat Surges', 'Combat Lulls']
+OPTIONAL_WORKSHEETS = ['Combat Role Variations', 'Combat Surges', 'Combat Lulls',
+                       'Combat Stance Transitions', 'Combat Variant Transitions']
 
 
 class ConfigurationWindow(QDialog):
@@ -38,6 +42,10 @@ class ConfigurationWindow(QDialog):
         self.combat_surges_button.clicked.connect(self.show_combat_surges)
         self.combat_lulls_button = QPushButton("Show Combat Lulls")
         self.combat_lulls_button.clicked.connect(self.show_combat_lulls)
+        self.stance_transitions_button = QPushButton("Show Combat Stance Transitions")
+        self.stance_transitions_button.clicked.connect(self.show_stance_transitions)
+        self.variant_transitions_button = QPushButton("Show Combat Variant Transitions")
+        self.variant_transitions_button.clicked.connect(self.show_variant_transitions)
         self.close_button = QPushButton("Close")
         self.close_button.clicked.connect(self.close)
         # Optional configuration tables should be disabled if
@@ -48,6 +56,10 @@ class ConfigurationWindow(QDialog):
             self.combat_surges_button.setEnabled(False)
         if optional_config_dfs["Combat Lulls"] is None:
             self.combat_lulls_button.setEnabled(False)
+        if optional_config_dfs.get("Combat Stance Transitions") is None:
+            self.stance_transitions_button.setEnabled(False)
+        if optional_config_dfs.get("Combat Variant Transitions") is None:
+            self.variant_transitions_button.setEnabled(False)
         self.layout = QVBoxLayout(self)
         self.layout.addWidget(self.combat_outcome_button)
         self.layout.addWidget(self.combat_role_button)
@@ -56,17 +68,19 @@ class ConfigurationWindow(QDialog):
         self.layout.addWidget(self.combat_role_variant_button)
         self.layout.addWidget(self.combat_surges_button)
         self.layout.addWidget(self.combat_lulls_button)
+        self.layout.addWidget(self.stance_transitions_button)
+        self.layout.addWidget(self.variant_transitions_button)
         self.layout.addWidget(self.close_button)
 
     def show_required_combat_data(self, title):
         data = self.required_config_dfs[title]
-        print(f"data_orig: {data}")
+        logger.debug("data_orig: %s", data)
         dialog = ConfigDisplayDialog(title, data)
         dialog.exec()
 
     def show_optional_combat_data(self, title):
         data = self.optional_config_dfs[title]
-        print(f"data_orig: {data}")
+        logger.debug("data_orig: %s", data)
         if data is None:
             dialog = QMessageBox()
             dialog.setText(f"{title} is not configured in the files in data_orig.")
@@ -98,6 +112,12 @@ class ConfigurationWindow(QDialog):
     def show_combat_lulls(self):
         self.show_optional_combat_data("Combat Lulls")
 
+    def show_stance_transitions(self):
+        self.show_optional_combat_data("Combat Stance Transitions")
+
+    def show_variant_transitions(self):
+        self.show_optional_combat_data("Combat Variant Transitions")
+
 
 class ConfigDisplayDialog(QDialog):
     def __init__(self, window_title: str, data: pd.DataFrame):
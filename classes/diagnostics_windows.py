@@ -0,0 +1,77 @@
+import logging
+
+import pandas as pd
+from PySide6.QtWidgets import (QCheckBox, QDialog, QFileDialog, QHBoxLayout, QHeaderView,
+                               QMessageBox, QPushButton, QTableView, QVBoxLayout)
+
+from entities import PERFORMANCE, PandasModel
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLUMNS = ['Phase', 'Calls', 'Total ms', 'Mean ms', 'p50 ms', 'p95 ms', 'Max ms']
+
+
+def summary_table(snapshot):
+    """This function turns PERFORMANCE.snapshot() into a DataFrame with one row
+    per phase, slowest in total first, with times in milliseconds."""
+    rows = []
+    for name, metric in snapshot.items():
+        rows.append([name, metric['count']] +
+                    [f"{metric[key] * 1000:.3f}"
+                     for key in ('total', 'mean', 'p50', 'p95', 'max')])
+    rows.sort(key=lambda row: float(row[2]), reverse=True)
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+class DiagnosticsWindow(QDialog):
+    """This dialog shows the performance counters collected so far, lets them
+    be turned on, reset and refreshed, and saves them as JSON."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Performance Diagnostics")
+        self.setMinimumSize(700, 400)
+
+        self.enabled_checkbox = QCheckBox("Collect performance counters")
+        self.enabled_checkbox.setChecked(PERFORMANCE.enabled)
+        self.enabled_checkbox.toggled.connect(self.set_enabled)
+        self.table_view = QTableView()
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh)
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        save_button = QPushButton("Save JSON")
+        save_button.clicked.connect(self.save_json)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+
+        buttons = QHBoxLayout()
+        for button in (refresh_button, reset_button, save_button, close_button):
+            buttons.addWidget(button)
+        layout = QVBoxLayout()
+        layout.addWidget(self.enabled_checkbox)
+        layout.addWidget(self.table_view)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.refresh()
+
+    def set_enabled(self, enabled):
+        PERFORMANCE.enabled = enabled
+
+    def refresh(self):
+        self.table_view.setModel(PandasModel(summary_table(PERFORMANCE.snapshot())))
+
+    def reset(self):
+        PERFORMANCE.reset()
+        self.refresh()
+
+    def save_json(self):
+        filepath, _ = QFileDialog.getSaveFileName(self, "Save Performance Counters",
+                                                  "performance.json", "JSON (*.json)")
+        if not filepath:
+            return
+        try:
+            PERFORMANCE.dump(filepath)
+        except OSError as e:
+            QMessageBox.critical(self, 'Error', f"Could not save {filepath}: {e}")
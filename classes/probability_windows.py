@@ -0,0 +1,156 @@
+import logging
+
+import pandas as pd
+from PySide6.QtWidgets import (QDialog, QHBoxLayout, QHeaderView, QLabel, QPushButton,
+                               QSpinBox, QTabWidget, QTableView, QVBoxLayout)
+
+from entities import (PandasModel, character_probabilities, forecast_stances,
+                      roster_probabilities)
+
+logger = logging.getLogger(__name__)
+
+TABS = [('action', 'Action'), ('targeting', 'Targeting'),
+        ('combat_status', 'Combat Status'), ('joint', 'Action x Target')]
+FORECAST_TABS = [('occupancy', 'Stances'), ('action', 'Action'), ('targeting', 'Targeting'),
+                 ('combat_status', 'Combat Status')]
+DEFAULT_FORECAST_ROUNDS = 20
+MAX_FORECAST_ROUNDS = 1000
+
+
+def probability_table(values, percent):
+    """This function formats a field of OutcomeProbabilities for display, as
+    percentages for one character or expected combatants for a roster."""
+    if values is None:
+        return pd.DataFrame({'Outcome': ['No valid table for this difficulty.']})
+    if percent:
+        heading = 'Chance'
+        values = values.map(lambda value: f"{value * 100:.2f}%")
+    else:
+        heading = 'Expected Combatants'
+        values = values.map(lambda value: f"{value:.2f}")
+    if isinstance(values, pd.Series):
+        return pd.DataFrame({'Outcome': values.index, heading: values.to_numpy()})
+    values = values.reset_index(names='Action')
+    values.columns = [str(column) for column in values.columns]
+    return values
+
+
+class ProbabilitiesWindow(QDialog):
+    """
+    This dialog shows the exact chance of every action, target and combat status,
+    and of every action and target pair, worked out from the combat tables
+    without rolling. For a single combatant they are shown as percentages, for
+    several as the expected number of combatants in one event.
+    :param characters: list of Character, required
+    :param parent: QWidget, optional
+    """
+    def __init__(self, characters, parent=None):
+        super().__init__(parent)
+        self.characters = characters
+        self.setWindowTitle("Outcome Probabilities")
+        self.setMinimumSize(700, 400)
+
+        self.summary_label = QLabel()
+        self.tabs = QTabWidget()
+        self.table_views = {}
+        for field, title in TABS:
+            table_view = QTableView()
+            table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            self.table_views[field] = table_view
+            self.tabs.addTab(table_view, title)
+
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(refresh_button)
+        buttons.addWidget(close_button)
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.tabs)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        """This method works the probabilities out again, for example after the
+        combat tables were reloaded."""
+        if len(self.characters) == 1:
+            character = self.characters[0]
+            probabilities = character_probabilities(character)
+            self.summary_label.setText(
+                f"Chance of each outcome for {character.name} ({character.combat_role}, "
+                f"{character.combat_stance}, difficulty {character.difficulty}).")
+            percent = True
+        else:
+            probabilities = roster_probabilities(self.characters)
+            self.summary_label.setText(f"Expected number of the {len(self.characters)} "
+                                       f"combatants with each outcome in one event.")
+            percent = False
+        for field, title in TABS:
+            table = probability_table(getattr(probabilities, field), percent)
+            self.table_views[field].setModel(PandasModel(table))
+
+
+class StanceForecastWindow(QDialog):
+    """
+    This dialog forecasts how the combatants' stances, and role variants if they
+    change too, are expected to move over a fight, and the expected number of
+    combatants rolling each action, target and combat status in every round.
+    :param characters: list of Character, required
+    :param stance_model: TransitionModel, required
+    :param variant_model: TransitionModel, optional
+    :param parent: QWidget, optional
+    """
+    def __init__(self, characters, stance_model, variant_model=None, parent=None):
+        super().__init__(parent)
+        self.characters = characters
+        self.stance_model = stance_model
+        self.variant_model = variant_model
+        self.setWindowTitle("Stance Forecast")
+        self.setMinimumSize(700, 400)
+
+        self.rounds_spinbox = QSpinBox()
+        self.rounds_spinbox.setRange(1, MAX_FORECAST_ROUNDS)
+        self.rounds_spinbox.setValue(DEFAULT_FORECAST_ROUNDS)
+        self.rounds_spinbox.setPrefix("Rounds: ")
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+        self.tabs = QTabWidget()
+        self.table_views = {}
+        for field, title in FORECAST_TABS:
+            table_view = QTableView()
+            table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            self.table_views[field] = table_view
+            self.tabs.addTab(table_view, title)
+
+        refresh_button = QPushButton("Forecast")
+        refresh_button.clicked.connect(self.refresh)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.rounds_spinbox)
+        buttons.addWidget(refresh_button)
+        buttons.addWidget(close_button)
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.tabs)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        """This method forecasts the number of rounds chosen."""
+        forecast = forecast_stances(self.characters, self.stance_model,
+                                    self.rounds_spinbox.value(), self.variant_model)
+        text = (f"Expected number of the {len(self.characters)} combatants in each "
+                f"stance and with each outcome, by round.")
+        if forecast.problems:
+            text += " " + " ".join(forecast.problems)
+        self.summary_label.setText(text)
+        for field, title in FORECAST_TABS:
+            table = getattr(forecast, field).map(lambda value: f"{value:.2f}")
+            self.table_views[field].setModel(PandasModel(table.reset_index()))
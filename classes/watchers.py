@@ -0,0 +1,80 @@
+import logging
+import os
+
+from PySide6.QtCore import QFileSystemWatcher, QObject, QThreadPool, QTimer, Signal
+
+from entities import WorkbookSnapshot
+from .workers import RefreshWorker
+
+logger = logging.getLogger(__name__)
+
+# Excel and LibreOffice write a workbook in several steps, so the watcher waits
+# this long after the last change before reading it.
+SETTLE_MILLISECONDS = 500
+
+
+class WorkbookWatcher(QObject):
+    """
+    This object watches a workbook on disk and emits changed with the names of
+    the worksheets whose content differs once an edit has been saved. Saves
+    that leave every worksheet as it was emit nothing.
+
+    Many programs save by writing a new file and renaming it over the old one,
+    after which QFileSystemWatcher stops watching the path, so the path is added
+    back after every change.
+
+    The workbook is read on a QThreadPool thread by RefreshWorker, so a changed
+    workbook does not freeze the GUI while its sidecar is rebuilt. Changes that
+    arrive while it is being read are checked once it is done.
+    :param filepath: str, required
+    :param parent: QObject, optional
+    """
+    changed = Signal(list)
+
+    def __init__(self, filepath, parent=None):
+        super().__init__(parent)
+        self.filepath = filepath
+        self.snapshot = WorkbookSnapshot(filepath)
+        self.worker = None
+        self._check_again = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(SETTLE_MILLISECONDS)
+        self._timer.timeout.connect(self.check)
+        self._watcher = QFileSystemWatcher([filepath], self)
+        self._watcher.fileChanged.connect(self._timer.start)
+        # A rename over the file shows up as a change to its folder.
+        self._watcher.addPath(os.path.dirname(os.path.abspath(filepath)))
+        self._watcher.directoryChanged.connect(self._timer.start)
+        # The first read records the workbook as it is now.
+        self.check()
+
+    def check(self):
+        """This method starts comparing the workbook with the last version read on
+        the thread pool. changed is emitted if any worksheet differs. A workbook
+        that cannot be read yet is tried again later."""
+        if self.filepath not in self._watcher.files() and os.path.exists(self.filepath):
+            self._watcher.addPath(self.filepath)
+        if self.worker is not None:
+            self._check_again = True
+            return
+        self.worker = RefreshWorker(self.snapshot)
+        self.worker.signals.finished.connect(self.refreshed)
+        self.worker.signals.failed.connect(self.refresh_failed)
+        QThreadPool.globalInstance().start(self.worker)
+
+    def refreshed(self, changed):
+        self.worker = None
+        if changed:
+            logger.info("WorkbookWatcher.refreshed: %s changed: %s", self.filepath, changed)
+            self.changed.emit(changed)
+        if self._check_again:
+            self._check_again = False
+            self._timer.start()
+
+    def refresh_failed(self, message):
+        self.worker = None
+        self._check_again = False
+        logger.debug("WorkbookWatcher.refresh_failed: %s is not readable yet: %s",
+                     self.filepath, message)
+        self._timer.start()
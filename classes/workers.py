@@ -0,0 +1,193 @@
+import logging
+import threading
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from entities import (PERFORMANCE, SimulationCancelled, check_tables, load_all_combat_tables,
+                      reload_changed_sheets, run_event)
+
+logger = logging.getLogger(__name__)
+
+# Progress is reported to the GUI at most this many times per stage, so a large
+# roster does not flood the event queue.
+PROGRESS_STEPS = 100
+# Characters rolled between checks for cancellation.
+ROLL_CHUNK_SIZE = 256
+
+
+class WorkerSignals(QObject):
+    """Signals emitted by SimulationWorker. They are delivered to slots on the
+    GUI thread, so the slots can update widgets directly."""
+    progress = Signal(int, int, str)
+    finished = Signal(object)
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class SimulationWorker(QRunnable):
+    """
+    This task runs one event for a list of characters on a QThreadPool thread:
+    it resolves and checks their tables, loading them from the workbook if
+    needed, and then rolls for each of them. Nothing is shown until it is done,
+    when finished carries everything back to the GUI thread in one dict with
+    the keys errors, missing, invalid_tables and results. results is the list
+    returned by run_event(), or None if a table was invalid.
+
+    cancel() can be called from the GUI thread at any time. The worker stops at
+    the next character and emits cancelled instead of finished.
+    :param characters: list of Character, required
+    :param surge_lull_index: SurgeLullIndex, optional
+    """
+    def __init__(self, characters, surge_lull_index=None):
+        super().__init__()
+        # The window keeps a reference for as long as the worker is in flight.
+        self.setAutoDelete(False)
+        self.characters = characters
+        self.surge_lull_index = surge_lull_index
+        self.signals = WorkerSignals()
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        try:
+            result = self.simulate()
+        except SimulationCancelled:
+            logger.debug("SimulationWorker.run: Simulation cancelled.")
+            self.signals.cancelled.emit()
+        except Exception as e:
+            logger.exception("SimulationWorker.run: Simulation failed.")
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+    @PERFORMANCE.timed('simulation')
+    def simulate(self):
+        total = len(self.characters)
+        step = max(1, total // PROGRESS_STEPS)
+
+        def report(done, total, stage):
+            if done % step == 0 or done == total:
+                self.signals.progress.emit(done, total, stage)
+
+        errors, missing, invalid_tables = check_tables(
+            self.characters, lambda done, total: report(done, total, "Loading tables"),
+            self._cancel_event)
+        result = {'errors': errors, 'missing': missing, 'invalid_tables': invalid_tables,
+                  'results': None}
+        if errors:
+            return result
+
+        results = []
+        for start in range(0, total, ROLL_CHUNK_SIZE):
+            if self.is_cancelled():
+                raise SimulationCancelled()
+            chunk = self.characters[start:start + ROLL_CHUNK_SIZE]
+            results.extend(run_event(chunk, self.surge_lull_index))
+            report(len(results), total, "Rolling")
+        result['results'] = results
+        return result
+
+
+class LoadSignals(QObject):
+    """Signals emitted by TableLoadWorker, delivered to slots on the GUI thread."""
+    progress = Signal(int, int)
+    finished = Signal()
+    failed = Signal(str)
+
+
+class TableLoadWorker(QRunnable):
+    """
+    This task runs load_all_combat_tables() on a QThreadPool thread, so the GUI
+    keeps painting while a stale workbook is parsed and its sidecar rebuilt.
+    :param filepath: str, required
+    """
+    def __init__(self, filepath):
+        super().__init__()
+        # The window keeps a reference for as long as the worker is in flight.
+        self.setAutoDelete(False)
+        self.filepath = filepath
+        self.signals = LoadSignals()
+
+    def run(self):
+        try:
+            load_all_combat_tables(self.filepath, progress=self.signals.progress.emit)
+        except Exception as e:
+            logger.exception("TableLoadWorker.run: Loading %s failed.", self.filepath)
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit()
+
+
+class RefreshSignals(QObject):
+    """Signals emitted by RefreshWorker, delivered to slots on the GUI thread."""
+    finished = Signal(list)
+    failed = Signal(str)
+
+
+class RefreshWorker(QRunnable):
+    """
+    This task calls WorkbookSnapshot.refresh() on a QThreadPool thread. A changed
+    workbook may have its sidecar rebuilt before its worksheets can be compared,
+    which is too slow for the GUI thread. finished carries the names of the
+    changed worksheets.
+    :param snapshot: WorkbookSnapshot, required
+    """
+    def __init__(self, snapshot):
+        super().__init__()
+        # The watcher keeps a reference for as long as the worker is in flight.
+        self.setAutoDelete(False)
+        self.snapshot = snapshot
+        self.signals = RefreshSignals()
+
+    def run(self):
+        try:
+            changed = self.snapshot.refresh()
+        except Exception as e:
+            # A half written workbook can fail in many ways inside openpyxl.
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(changed)
+
+
+class ReloadSignals(QObject):
+    """Signals emitted by ReloadWorker, delivered to slots on the GUI thread."""
+    finished = Signal(list, list)
+    failed = Signal(str)
+
+
+class ReloadWorker(QRunnable):
+    """
+    This task runs reload_changed_sheets() on a QThreadPool thread, so the changed
+    worksheets are parsed, validated and compiled again without freezing the GUI.
+    finished carries the names of the changed worksheets and the characters that
+    were reloaded. A reload is short and leaves the characters half updated if it
+    is stopped, so cancel() does nothing and the window waits for it instead.
+    :param filepath: str, required
+    :param changed: list of str, required
+    :param characters: list of Character, required
+    """
+    def __init__(self, filepath, changed, characters):
+        super().__init__()
+        # The window keeps a reference for as long as the worker is in flight.
+        self.setAutoDelete(False)
+        self.filepath = filepath
+        self.changed = changed
+        self.characters = characters
+        self.signals = ReloadSignals()
+
+    def cancel(self):
+        pass
+
+    def run(self):
+        try:
+            reloaded = reload_changed_sheets(self.filepath, self.changed, self.characters)
+        except Exception as e:
+            logger.exception("ReloadWorker.run: Reloading %s failed.", self.changed)
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(list(self.changed), reloaded)
@@ -0,0 +1,27 @@
+"""
+Compiles workbooks into the binary sidecar files that the GUI and the headless
+runner read instead of parsing .xlsx files. Sidecars are also rebuilt
+automatically when a workbook changes, so running this is optional.
+
+Example:
+    python compile_workbooks.py data/combat-tables.xlsx data/configuration-tables.xlsx
+"""
+import argparse
+import sys
+
+from entities.sidecar import compile_workbook, sidecar_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile workbooks into sidecar caches.")
+    parser.add_argument('workbooks', nargs='+', help="Excel workbooks to compile.")
+    args = parser.parse_args(argv)
+    for workbook_path in args.workbooks:
+        compiled = compile_workbook(workbook_path)
+        print(f"{workbook_path}: {len(compiled.sheet_names)} worksheets compiled to "
+              f"{sidecar_path(workbook_path)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
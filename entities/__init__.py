@@ -1,2 +1,39 @@
-from .display_models import PandasModel
-from .internal_objects import Character
+from .internal_objects import Character, prefetch_tables
+from .workbook_cache import WorkbookCache, WORKBOOK_CACHE
+from .compiled_tables import (CompiledTable, CompiledColumn, CompiledTableRegistry,
+                              COMPILED_TABLES)
+from .outcomes import (OutcomeCatalog, OutcomeInfo, OUTCOMES, COMBAT_STATUSES,
+                       split_action)
+from .surges import SurgeLullIndex
+from .configuration import (load_configuration_tables, build_surge_lull_index,
+                            build_transition_models)
+from .rng import RandomStreams
+from .probabilities import (OutcomeProbabilities, character_probabilities,
+                            roster_probabilities, column_probabilities,
+                            status_probabilities)
+from .combatant_store import CombatantStore, CombatantProxy, Vocabulary
+from .simulation import (read_roster, load_roster, load_roster_store, check_tables,
+                         run_event, run_store_event, SimulationCancelled)
+from .stance_model import (TransitionModel, StanceForecast, forecast_stances,
+                           advance_stances)
+from .monte_carlo import simulate_encounters, MonteCarloResult, SharedTables
+from .diagnostics import (configure_logging, configure_performance, PerformanceCounters,
+                          Metric, PERFORMANCE)
+from .event_log import EventLog, LogRecord, event_records
+from .validation import (validate_combat_table, validate_sheet, validate_workbook,
+                         validate_surge_lull_actions, format_report, non_string_cells)
+from .parallel_loading import load_all_combat_tables
+from .sidecar import sidecar_is_fresh, sheet_hash
+from .hot_reload import WorkbookSnapshot, reload_changed_sheets
+from .sheet_index import SheetIndex, sheet_index
+from .availability import AvailabilityMatrix, sheet_availability
+from .session import session_snapshot, write_session, read_session, restore_session
+
+
+def __getattr__(name):
+    # The Qt models need PySide6, so they are only imported when asked for.
+    # This keeps the simulation core importable on machines without Qt.
+    if name in ('PandasModel', 'RosterModel', 'EventLogModel'):
+        from . import display_models
+        return getattr(display_models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,152 @@
+import logging
+
+import numpy as np
+
+from .diagnostics import PERFORMANCE
+from .internal_objects import Character
+from .sheet_index import sheet_index
+from .workbook_cache import WORKBOOK_CACHE
+
+logger = logging.getLogger(__name__)
+
+AVAILABILITY_KEY = 'availability'
+
+
+class AvailabilityMatrix:
+    """
+    This object records which combinations of combat role, role variant and
+    combat stance have both an action and a targeting worksheet in a combat
+    workbook. available[r, v, s] is True when roles[r], variants[v] and
+    stances[s] can be rolled. variants[0] is None, for combatants without a
+    role variant.
+
+    Combinations whose table names collide with another combination's under
+    Excel's 31 character limit are not available, as there is no telling which
+    of them the worksheet is meant for. Each collision with a worksheet is
+    described in problems.
+    :param roles: list of str, required
+    :param variants: list of str or None, required, starting with None
+    :param stances: list of str, required
+    :param available: np.ndarray of bool, required, shape (roles, variants, stances)
+    :param problems: list of str, optional
+    """
+    def __init__(self, roles, variants, stances, available, problems=None):
+        self.roles = list(roles)
+        self.variants = list(variants)
+        self.stances = list(stances)
+        self.available = np.asarray(available, dtype=bool)
+        self.problems = problems or []
+        self._roles = {role: i for i, role in enumerate(self.roles)}
+        self._variants = {variant: i for i, variant in enumerate(self.variants)}
+        self._stances = {stance: i for i, stance in enumerate(self.stances)}
+
+    @classmethod
+    def from_index(cls, index, roles, variants, stances):
+        """
+        This class method works out every combination of roles, variants and
+        stances from a SheetIndex, without parsing any worksheet.
+        :param index: SheetIndex, required
+        :param roles: list of str, required
+        :param variants: list of str, optional, the Combat Role Variations
+        :param stances: list of str, required
+        :return: AvailabilityMatrix
+        """
+        variants = [None] + [variant for variant in variants or [] if variant]
+        table_names = {}
+        for r, role in enumerate(roles):
+            for v, variant in enumerate(variants):
+                for s, stance in enumerate(stances):
+                    table_names[(r, v, s)] = Character.table_names_for(role, variant, stance)
+        all_names = [name for names in table_names.values() for name in names]
+        index.add_table_names(all_names)
+        collisions = index.collisions(all_names)
+        colliding = {name for names in collisions.values() for name in names}
+        # Collisions only matter when the worksheet exists. Otherwise none of the
+        # combinations has worksheets anyway.
+        problems = [f"Combat tables {' and '.join(names)} are cut to the same worksheet "
+                    f"name {sheet_name!r} by Excel's 31 character limit."
+                    for sheet_name, names in collisions.items() if sheet_name in index]
+        for problem in problems:
+            logger.warning("AvailabilityMatrix.from_index: %s", problem)
+
+        available = np.zeros((len(roles), len(variants), len(stances)), dtype=bool)
+        for position, names in table_names.items():
+            available[position] = all(name in index and name not in colliding
+                                      for name in names)
+        return cls(roles, variants, stances, available, problems)
+
+    def is_available(self, role, variant, stance):
+        """This method returns True if the combination has both of its worksheets.
+        Blank variants count as no variant, and unknown values are never available."""
+        position = self._position(role, variant, stance)
+        return position is not None and bool(self.available[position])
+
+    def available_roles(self):
+        """This method returns the roles with at least one available combination."""
+        return [role for role, any_available in zip(self.roles, self.available.any(axis=(1, 2)))
+                if any_available]
+
+    def variants_for(self, role):
+        """This method returns the role variants with at least one available stance
+        for role, leaving out no variant."""
+        r = self._roles.get(role)
+        if r is None:
+            return []
+        return [variant for variant, any_available
+                in zip(self.variants[1:], self.available[r, 1:].any(axis=1)) if any_available]
+
+    def stances_for(self, role, variant):
+        """This method returns the stances available for role and variant."""
+        r = self._roles.get(role)
+        v = self._variants.get(variant or None)
+        if r is None or v is None:
+            return []
+        return [stance for stance, is_available in zip(self.stances, self.available[r, v])
+                if is_available]
+
+    def nearest(self, role, variant, stance):
+        """
+        This method returns an available combination as close as possible to the
+        one given, e.g. after the role of a combatant was changed. The role is
+        always kept, then the variant, then the stance. The combination is returned
+        unchanged if it is available or nothing is available for the role.
+        :return: tuple of (role, variant, stance)
+        """
+        if self.is_available(role, variant, stance):
+            return role, variant, stance
+        stances = self.stances_for(role, variant)
+        if stances:
+            return role, variant, stances[0]
+        for candidate in self.variants_for(role) + [None]:
+            stances = self.stances_for(role, candidate)
+            if stances:
+                return role, candidate, stance if stance in stances else stances[0]
+        return role, variant, stance
+
+    def _position(self, role, variant, stance):
+        r = self._roles.get(role)
+        v = self._variants.get(variant or None)
+        s = self._stances.get(stance)
+        if r is None or v is None or s is None:
+            return None
+        return r, v, s
+
+
+@PERFORMANCE.timed('sheet_availability')
+def sheet_availability(filepath, roles, variants, stances):
+    """
+    This function returns the AvailabilityMatrix of the combat workbook at
+    filepath for the configured roles, variants and stances. It is worked out
+    from the workbook's SheetIndex once for each version of the workbook and
+    each configuration, and kept in WORKBOOK_CACHE.
+    :param filepath: str, required
+    :param roles: list of str, required
+    :param variants: list of str, optional
+    :param stances: list of str, required
+    :return: AvailabilityMatrix
+    """
+    key = (AVAILABILITY_KEY, tuple(roles), tuple(variants or ()), tuple(stances))
+    return WORKBOOK_CACHE.get_workbook_derived(
+        filepath, key,
+        lambda sheet_names: AvailabilityMatrix.from_index(sheet_index(filepath), roles,
+                                                          variants, stances))
@@ -0,0 +1,488 @@
+import logging
+
+import numpy as np
+
+from .compiled_tables import MAX_SHEET_NAME_LENGTH
+from .diagnostics import PERFORMANCE
+from .internal_objects import Character
+from .outcomes import COMBAT_STATUSES, OUTCOMES
+from .rng import RandomStreams
+
+logger = logging.getLogger(__name__)
+
+# Code held in the action and target columns before anything has been rolled.
+NO_RESULT = -1
+INITIAL_CAPACITY = 64
+ROLL_KINDS = ('action', 'targeting')
+
+
+class Vocabulary:
+    """
+    This object interns values, such as role names or outcomes, as small
+    integer codes so that a column of them can be held in a NumPy array. Codes
+    are assigned in the order values are first seen and never change.
+    :param values: iterable, optional, values to intern up front
+    """
+    __slots__ = ('values', '_codes')
+
+    def __init__(self, values=()):
+        self.values = []
+        self._codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        """This method returns the code for value, interning it if it is new."""
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class CombatantStore:
+    """
+    This object holds a whole roster of combatants as parallel NumPy columns
+    instead of one Character per combatant, so that a 10,000 combatant siege
+    fits in a few MB and can be rolled in one vectorized pass.
+
+    Role, variant, stance, difficulty and level are stored as codes into a
+    Vocabulary each. The last action and target rolled are OUTCOMES IDs and
+    the combat status is a code into COMBAT_STATUSES, both taken straight from
+    the compiled column. Names stay a plain list.
+
+    Rolling groups the rows by role, variant, stance and difficulty and rolls
+    every row of a group in one CompiledColumn.sample_uniforms() call. Tables are
+    resolved through one lazy template Character per role, variant and stance,
+    so they are loaded, validated and shared exactly as for any other Character.
+
+    Rolls are drawn from RandomStreams seeded with seed. Each event has its own
+    stream, and row i always uses the i-th value drawn from it, so a given seed
+    gives the same results however the rows are split up and rolled.
+
+    store[i] returns a CombatantProxy that can be used in place of a Character,
+    e.g. with run_event(). It rolls from the combatant's own stream.
+    :param combat_tables_filepath: str, required
+    :param seed: int, optional, defaults to fresh entropy, see RandomStreams
+    """
+    def __init__(self, combat_tables_filepath, seed=None):
+        self.combat_workbook_filepath = combat_tables_filepath
+        self.streams = RandomStreams(seed)
+        self.event = 0
+        self._row_generators = {}
+        self.names = []
+        self.roles = Vocabulary()
+        self.variants = Vocabulary()
+        self.stances = Vocabulary()
+        self.difficulties = Vocabulary()
+        self.levels = Vocabulary()
+        self._size = 0
+        self._role = np.zeros(INITIAL_CAPACITY, dtype=np.int16)
+        self._variant = np.zeros(INITIAL_CAPACITY, dtype=np.int16)
+        self._stance = np.zeros(INITIAL_CAPACITY, dtype=np.int16)
+        self._difficulty = np.zeros(INITIAL_CAPACITY, dtype=np.int16)
+        self._level = np.zeros(INITIAL_CAPACITY, dtype=np.int16)
+        self._status = np.zeros(INITIAL_CAPACITY, dtype=np.int8)
+        self._action = np.full(INITIAL_CAPACITY, NO_RESULT, dtype=np.int32)
+        self._target = np.full(INITIAL_CAPACITY, NO_RESULT, dtype=np.int32)
+        self._active = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        # Template Character per (role, variant, stance) code, and the compiled
+        # column with its outcome and status codes per table and difficulty.
+        self._templates = {}
+        self._columns = {}
+
+    @classmethod
+    def from_characters(cls, characters, combat_tables_filepath, seed=None):
+        """This class method builds a store holding the settings of a list of
+        Character objects, all active."""
+        store = cls(combat_tables_filepath, seed)
+        for character in characters:
+            store.append(character.name, character.combat_role, character.combat_stance,
+                         character.difficulty, character.role_variant, character.level)
+        return store
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, row):
+        if not -self._size <= row < self._size:
+            raise IndexError(f"Combatant {row} is out of range.")
+        return CombatantProxy(self, row % self._size)
+
+    def __iter__(self):
+        return (CombatantProxy(self, row) for row in range(self._size))
+
+    @property
+    def nbytes(self):
+        """The number of bytes held by the NumPy columns."""
+        return sum(column.nbytes for column in self._arrays())
+
+    def append(self, name, combat_role, combat_stance, difficulty, role_variant=None,
+               individual_level=None, active=True):
+        """
+        This method adds a combatant and returns its row.
+        :param name: str, required
+        :param combat_role: str, required
+        :param combat_stance: str, required
+        :param difficulty: str, required, chosen from DIFFICULTY_VARIATIONS
+        :param role_variant: str, optional, defaults to None
+        :param individual_level: str, optional, defaults to None
+        :param active: bool, optional, defaults to True
+        :return: int
+        """
+        if self._size == len(self._role):
+            self._grow()
+        row = self._size
+        self._size += 1
+        self.names.append(name)
+        self._set(row, combat_role, combat_stance, difficulty, role_variant,
+                  individual_level)
+        self._active[row] = active
+        return row
+
+    def update(self, row, name, combat_role, combat_stance, difficulty, role_variant=None,
+               individual_level=None):
+        """This method replaces a combatant's settings, like
+        Character.update_status(), and clears its last results."""
+        self.names[row] = name
+        self._set(row, combat_role, combat_stance, difficulty, role_variant,
+                  individual_level)
+
+    def set_active(self, rows, active):
+        """This method makes the combatants in rows active or inactive."""
+        self._active[:self._size][rows] = active
+
+    def active_rows(self):
+        """This method returns the rows of the active combatants as an array."""
+        return np.flatnonzero(self._active[:self._size])
+
+    def clear_combat(self, rows=None):
+        """This method clears the last action, target and status of the given
+        rows, by default every row."""
+        if rows is None:
+            rows = slice(0, self._size)
+        self._action[rows] = NO_RESULT
+        self._target[rows] = NO_RESULT
+        self._status[rows] = 0
+
+    def next_event(self):
+        """This method moves the store on to the next event and returns its
+        number."""
+        self.event += 1
+        return self.event
+
+    @PERFORMANCE.timed('store_roll')
+    def roll(self, rows=None, kinds=ROLL_KINDS, event=None):
+        """
+        This method rolls actions and/or targets for the given rows, by default
+        the active ones, from the stream of an event. Rows whose table is
+        missing, invalid or has no column for their difficulty keep their previous
+        results, and a warning is logged once per table and difficulty, as
+        Character does for each roll.
+        :param rows: array of int, optional
+        :param kinds: tuple of str, optional, 'action' and/or 'targeting'
+        :param event: int, optional, defaults to self.event
+        """
+        if rows is None:
+            rows = self.active_rows()
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return
+        if event is None:
+            event = self.event
+        uniforms = self.streams.event_uniforms(event, len(ROLL_KINDS), self._size)
+        # Group the rows so that each group rolls on one compiled column.
+        group = self._role[rows].astype(np.int64)
+        for column, size in ((self._variant, len(self.variants)),
+                             (self._stance, len(self.stances)),
+                             (self._difficulty, len(self.difficulties))):
+            group = group * size + column[rows]
+        order = np.argsort(group, kind='stable')
+        boundaries = np.flatnonzero(np.diff(group[order])) + 1
+        for members in np.split(rows[order], boundaries):
+            first = int(members[0])
+            for kind in kinds:
+                column, outcome_codes, status_codes = self._column(first, kind)
+                if column is None:
+                    continue
+                local = column.sample_uniforms(uniforms[ROLL_KINDS.index(kind), members])
+                if kind == 'action':
+                    self._action[members] = outcome_codes[local]
+                    self._status[members] = status_codes[local]
+                else:
+                    self._target[members] = outcome_codes[local]
+
+    def roll_row(self, row, kind):
+        """This method rolls an action or target for one row from the combatant's
+        own stream, for code that rolls one combatant at a time."""
+        column, outcome_codes, status_codes = self._column(row, kind)
+        if column is None:
+            return
+        local = column.sample(1, self.row_generator(row))
+        if kind == 'action':
+            self._action[row] = outcome_codes[local[0]]
+            self._status[row] = status_codes[local[0]]
+        else:
+            self._target[row] = outcome_codes[local[0]]
+
+    def row_generator(self, row):
+        """This method returns the combatant's own stream used by roll_row(),
+        creating it the first time it is asked for."""
+        generator = self._row_generators.get(row)
+        if generator is None:
+            generator = self.streams.combatant_generator(row)
+            self._row_generators[row] = generator
+        return generator
+
+    def reload_tables(self, changed):
+        """
+        This method reloads the tables of the templates rolling on one of the
+        worksheets in changed and drops every compiled column, which is keyed by
+        template and would otherwise keep rolling on the old version of the
+        workbook. It returns the rows using a reloaded template.
+        :param changed: set of str, required, worksheet names
+        :return: list of int
+        """
+        reloaded = set()
+        for key, template in self._templates.items():
+            names = {name[:MAX_SHEET_NAME_LENGTH]
+                     for name in (template.combat_action_table_name,
+                                  template.combat_targeting_table_name) if name}
+            if names & changed:
+                template.reload_tables()
+                reloaded.add(key)
+        self._columns.clear()
+        return [row for row, key in enumerate(zip(self._role[:self._size].tolist(),
+                                                  self._variant[:self._size].tolist(),
+                                                  self._stance[:self._size].tolist()))
+                if key in reloaded]
+
+    def action_codes(self, rows=None):
+        """This method returns the last action codes, OUTCOMES IDs or
+        NO_RESULT, of the given rows, by default every row."""
+        return self._action[:self._size] if rows is None else self._action[rows]
+
+    def target_codes(self, rows=None):
+        """This method returns the last target codes, OUTCOMES IDs or
+        NO_RESULT, of the given rows, by default every row."""
+        return self._target[:self._size] if rows is None else self._target[rows]
+
+    def status_codes(self, rows=None):
+        """This method returns the combat status codes, indexes into
+        COMBAT_STATUSES, of the given rows, by default every row."""
+        return self._status[:self._size] if rows is None else self._status[rows]
+
+    def level_codes(self, rows=None):
+        """This method returns the level codes, indexes into self.levels, of the
+        given rows, by default every row."""
+        return self._level[:self._size] if rows is None else self._level[rows]
+
+    def compiled_column(self, row, kind):
+        """This method returns the CompiledColumn a row rolls its action or target
+        on, or None if its table is missing, invalid or has no rows for its
+        difficulty.
+        :param row: int, required
+        :param kind: str, required, 'action' or 'targeting'
+        :return: CompiledColumn or None
+        """
+        return self._column(row, kind)[0]
+
+    def outcome(self, code):
+        """This method returns the outcome text for an action or target code, or
+        None for NO_RESULT."""
+        return None if code == NO_RESULT else OUTCOMES.text(code)
+
+    def template(self, row):
+        """This method returns the lazy Character whose tables are used for a row,
+        shared by every row with the same role, variant and stance."""
+        key = (int(self._role[row]), int(self._variant[row]), int(self._stance[row]))
+        template = self._templates.get(key)
+        if template is None:
+            template = Character(name=f"{self.roles[key[0]]} template",
+                                 combat_role=self.roles[key[0]],
+                                 combat_stance=self.stances[key[2]],
+                                 difficulty=self.difficulties[int(self._difficulty[row])],
+                                 combat_tables_filepath=self.combat_workbook_filepath,
+                                 role_variant=self.variants[key[1]],
+                                 lazy=True)
+            self._templates[key] = template
+        return template
+
+    def _column(self, row, kind):
+        template = self.template(row)
+        difficulty = self.difficulties[int(self._difficulty[row])]
+        key = (id(template), kind, difficulty)
+        if key in self._columns:
+            return self._columns[key]
+        template.resolve_tables()
+        if kind == 'action':
+            table, table_name = template.compiled_action_table, template.combat_action_table_name
+        else:
+            table, table_name = (template.compiled_targeting_table,
+                                 template.combat_targeting_table_name)
+        entry = (None, None, None)
+        if table is None:
+            logger.warning("CombatantStore.roll: %s is missing or invalid. Cannot roll "
+                           "%s.", table_name, kind)
+        elif difficulty.strip() not in table.columns:
+            logger.warning("CombatantStore.roll: %s has no rows for difficulty %s. Cannot "
+                           "roll %s.", table_name, difficulty, kind)
+        else:
+            column = table.columns[difficulty.strip()]
+            entry = (column, column.outcome_ids, column.status_codes)
+        self._columns[key] = entry
+        return entry
+
+    def _set(self, row, combat_role, combat_stance, difficulty, role_variant,
+             individual_level):
+        self._role[row] = self.roles.code(combat_role)
+        self._variant[row] = self.variants.code(role_variant)
+        self._stance[row] = self.stances.code(combat_stance)
+        self._difficulty[row] = self.difficulties.code(difficulty)
+        self._level[row] = self.levels.code(individual_level)
+        self.clear_combat(row)
+
+    def _arrays(self):
+        return (self._role, self._variant, self._stance, self._difficulty, self._level,
+                self._status, self._action, self._target, self._active)
+
+    def _grow(self):
+        capacity = len(self._role) * 2
+        (self._role, self._variant, self._stance, self._difficulty, self._level,
+         self._status, self._action, self._target, self._active) = (
+            np.concatenate((column, np.full(capacity - len(column), fill, column.dtype)))
+            for column, fill in zip(self._arrays(), (0, 0, 0, 0, 0, 0, NO_RESULT,
+                                                     NO_RESULT, False)))
+
+
+class CombatantProxy:
+    """
+    This object is a view of one row of a CombatantStore with the attributes
+    and methods of Character that the simulation uses, so code written for a
+    list of Character objects also works on a store. It holds no state of its
+    own.
+    :param store: CombatantStore, required
+    :param row: int, required
+    """
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def name(self):
+        return self._store.names[self._row]
+
+    @property
+    def combat_role(self):
+        return self._store.roles[int(self._store._role[self._row])]
+
+    @property
+    def role_variant(self):
+        return self._store.variants[int(self._store._variant[self._row])]
+
+    @property
+    def combat_stance(self):
+        return self._store.stances[int(self._store._stance[self._row])]
+
+    @property
+    def difficulty(self):
+        return self._store.difficulties[int(self._store._difficulty[self._row])]
+
+    @property
+    def level(self):
+        return self._store.levels[int(self._store._level[self._row])]
+
+    @property
+    def action(self):
+        return self._store.outcome(int(self._store._action[self._row]))
+
+    @property
+    def target(self):
+        return self._store.outcome(int(self._store._target[self._row]))
+
+    @property
+    def action_id(self):
+        code = int(self._store._action[self._row])
+        return None if code == NO_RESULT else code
+
+    @property
+    def target_id(self):
+        code = int(self._store._target[self._row])
+        return None if code == NO_RESULT else code
+
+    @property
+    def combat_status(self):
+        return COMBAT_STATUSES[int(self._store._status[self._row])]
+
+    @property
+    def combat_workbook_filepath(self):
+        return self._store.combat_workbook_filepath
+
+    @property
+    def combat_action_table_name(self):
+        return self._store.template(self._row).combat_action_table_name
+
+    @property
+    def combat_targeting_table_name(self):
+        return self._store.template(self._row).combat_targeting_table_name
+
+    @property
+    def rng(self):
+        return self._store.row_generator(self._row)
+
+    @property
+    def combat_action_table(self):
+        return self._resolved().combat_action_table
+
+    @property
+    def combat_targeting_table(self):
+        return self._resolved().combat_targeting_table
+
+    @property
+    def compiled_action_table(self):
+        return self._resolved().compiled_action_table
+
+    @property
+    def compiled_targeting_table(self):
+        return self._resolved().compiled_targeting_table
+
+    @property
+    def tables_resolved(self):
+        return self._store.template(self._row).tables_resolved
+
+    def resolve_tables(self):
+        self._resolved()
+
+    def update_status(self, name, combat_role, combat_stance, difficulty,
+                      role_variant=None, individual_level=None):
+        self._store.update(self._row, name, combat_role, combat_stance, difficulty,
+                           role_variant, individual_level)
+
+    def clear_combat(self):
+        self._store.clear_combat(self._row)
+
+    def roll_for_combat_action(self):
+        self._store.roll_row(self._row, 'action')
+
+    def roll_for_combat_targeting(self):
+        self._store.roll_row(self._row, 'targeting')
+
+    def _resolved(self):
+        template = self._store.template(self._row)
+        template.resolve_tables()
+        return template
+
+    def __str__(self):
+        return f"Name: {self.name}. Role: {self.combat_role}.\n" \
+               f"Stance: {self.combat_stance}. Difficulty: {self.difficulty}.\n" \
+               f"Role Variant: {self.role_variant}. Level: {self.level}.\n" \
+               f"Status: {self.combat_status}. Target: {self.target}. Action: {self.action}.\n"
@@ -0,0 +1,309 @@
+import random
+import threading
+from bisect import bisect_left
+from itertools import accumulate
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from .outcomes import COMBAT_STATUSES, OUTCOMES
+from .validation import table_value
+from .workbook_cache import WorkbookCache
+
+DIFFICULTY_VARIATIONS = ['A', 'B', 'C', 'D']
+# Excel truncates worksheet names to this many characters.
+MAX_SHEET_NAME_LENGTH = 31
+
+
+class CompiledColumn:
+    """
+    This object holds one difficulty column of a combat table in the form
+    used for rolling: the lowest value that can be rolled, the upper bound of
+    each row that is not a dash and the Outcome of each of those rows. Upper
+    bounds written as zeros (00 for 100 and so on) are already converted.
+
+    Each outcome is also interned in OUTCOMES. outcome_ids and status_codes
+    hold the ID and the index into COMBAT_STATUSES of each row, so the codes
+    returned by sample() can be turned into IDs or statuses with one NumPy
+    index.
+    :param min_val: int, required
+    :param thresholds: tuple of int, required
+    :param outcomes: tuple of str, required
+    """
+    __slots__ = ('min_val', 'max_val', 'thresholds', 'outcomes', 'outcome_ids',
+                 'status_codes', '_search', '_search_array', '_row_counts',
+                 '_distribution', '_status_distribution')
+
+    def __init__(self, min_val, thresholds, outcomes):
+        self.min_val = min_val
+        self.max_val = thresholds[-1]
+        self.thresholds = thresholds
+        self.outcomes = outcomes
+        self.outcome_ids = np.array([OUTCOMES.intern(outcome) for outcome in outcomes],
+                                    dtype=np.int32)
+        self.status_codes = np.array([OUTCOMES[outcome_id].status
+                                      for outcome_id in self.outcome_ids.tolist()],
+                                     dtype=np.int8)
+        # The running maximum keeps the search sorted even if the rows are
+        # not, so bisect finds the first row whose upper bound covers the roll.
+        self._search = tuple(accumulate(thresholds, max))
+        self._search_array = np.array(self._search, dtype=np.int64)
+        self._row_counts = None
+        self._distribution = None
+        self._status_distribution = None
+
+    def row(self, roll):
+        """This method returns the index of the first row whose upper bound is
+        greater than or equal to roll."""
+        idx = bisect_left(self._search, roll)
+        if idx >= len(self.outcomes):
+            idx = len(self.outcomes) - 1
+        return idx
+
+    def lookup(self, roll):
+        """This method returns the Outcome of the first row whose upper bound
+        is greater than or equal to roll."""
+        return self.outcomes[self.row(roll)]
+
+    def roll_row(self, rng=None):
+        """This method rolls a uniform value between min_val and max_val and
+        returns the index of the matching row. Without rng, the random module is
+        used.
+        :param rng: np.random.Generator, optional
+        """
+        if rng is None:
+            return self.row(random.randint(self.min_val, self.max_val))
+        return self.row(int(rng.integers(self.min_val, self.max_val, endpoint=True)))
+
+    def roll(self, rng=None):
+        """This method rolls like roll_row() and returns the matching Outcome."""
+        return self.outcomes[self.roll_row(rng)]
+
+    def roll_id(self, rng=None):
+        """This method rolls like roll_row() and returns the OUTCOMES ID of the
+        matching Outcome."""
+        return int(self.outcome_ids[self.roll_row(rng)])
+
+    def row_counts(self):
+        """This method returns how many of the values between min_val and
+        max_val select each row, as an array that sums to the span. A row whose
+        range is hidden by an earlier, wider row gets zero. The counts are worked
+        out once from the thresholds, with the same rule as lookup()."""
+        if self._row_counts is None:
+            bounds = np.clip(self._search_array, self.min_val - 1, self.max_val)
+            counts = np.diff(bounds, prepend=self.min_val - 1)
+            # Rolls above the last bound fall on the last row, as in lookup().
+            counts[-1] += self.max_val - bounds[-1]
+            counts.flags.writeable = False
+            self._row_counts = counts
+        return self._row_counts
+
+    def probabilities(self):
+        """This method returns the exact probability of each row being rolled, as
+        an array of float that sums to 1."""
+        return self.row_counts() / (self.max_val - self.min_val + 1)
+
+    def distribution(self):
+        """This method returns the exact probability of every Outcome, summing the
+        rows that share one, as a pd.Series indexed by outcome in the order they
+        first appear. It is worked out once and must not be modified."""
+        if self._distribution is None:
+            probabilities = pd.Series(self.probabilities(), index=list(self.outcomes))
+            self._distribution = probabilities.groupby(level=0, sort=False).sum()
+        return self._distribution
+
+    def status_distribution(self):
+        """This method returns the exact probability of each combat status, as an
+        array indexed like COMBAT_STATUSES. It is worked out once."""
+        if self._status_distribution is None:
+            self._status_distribution = np.bincount(
+                self.status_codes, weights=self.probabilities(),
+                minlength=len(COMBAT_STATUSES))
+        return self._status_distribution
+
+    def sample(self, n, rng=None):
+        """This method draws n uniform rolls in one NumPy call and returns the
+        index of the matching row in outcomes for each of them.
+        :param n: int, required
+        :param rng: np.random.Generator, optional, defaults to a new generator
+        :return: np.ndarray of int
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        rolls = rng.integers(self.min_val, self.max_val, size=n, endpoint=True)
+        return self.codes_for_rolls(rolls)
+
+    def sample_uniforms(self, uniforms):
+        """This method turns uniform values in [0, 1), drawn elsewhere, into rolls
+        between min_val and max_val and returns the index of the matching row in
+        outcomes for each of them, like sample().
+        :param uniforms: np.ndarray of float, required
+        :return: np.ndarray of int
+        """
+        span = self.max_val - self.min_val + 1
+        rolls = self.min_val + np.floor(uniforms * span).astype(np.int64)
+        return self.codes_for_rolls(rolls)
+
+    def codes_for_rolls(self, rolls):
+        """This method returns the index of the matching row in outcomes for each
+        roll in an array."""
+        codes = np.searchsorted(self._search_array, rolls, side='left')
+        return np.minimum(codes, len(self.outcomes) - 1)
+
+
+class CompiledTable:
+    """
+    This object is a combat action or targeting table compiled once for
+    rolling. It holds a CompiledColumn for each difficulty that has at least
+    one row that is not a dash, keyed by the stripped column header.
+
+    A compiled table is shared by every Character that uses the same worksheet
+    (see CompiledTableRegistry), so its columns are read only.
+    :param table_name: str, required
+    :param columns: dict of CompiledColumn, required
+    """
+    __slots__ = ('table_name', 'columns')
+
+    def __init__(self, table_name, columns):
+        self.table_name = table_name
+        self.columns = MappingProxyType(dict(columns))
+
+    @classmethod
+    def from_dataframe(cls, table_name, table: pd.DataFrame):
+        """This class method compiles a combat table that has already passed
+        Character.validate_tables().
+        :param table_name: str, required
+        :param table: pd.DataFrame, required
+        :return: CompiledTable
+        """
+        headers = {col.strip(): col for col in table.columns}
+        outcome_series = table[headers['Outcome']]
+        columns = {}
+        for difficulty in DIFFICULTY_VARIATIONS:
+            if difficulty not in headers:
+                continue
+            series = table[headers[difficulty]]
+            thresholds = []
+            outcomes = []
+            for item, outcome in zip(series, outcome_series):
+                if item == '-':
+                    continue
+                thresholds.append(upper_bound(item))
+                outcomes.append(outcome)
+            if not thresholds:
+                continue
+            first_item = series[series != '-'].iloc[0]
+            min_val = int(first_item.split('-')[0])
+            columns[difficulty] = CompiledColumn(min_val, tuple(thresholds),
+                                                 tuple(outcomes))
+        return cls(table_name, columns)
+
+    def lookup(self, difficulty, roll):
+        """This method returns the Outcome for a roll that has already been
+        made. It raises KeyError if the difficulty has no rows."""
+        return self.columns[difficulty.strip()].lookup(roll)
+
+    def roll(self, difficulty, rng=None):
+        """This method rolls on the difficulty column and returns the Outcome.
+        It raises KeyError if the difficulty has no rows.
+        :param difficulty: str, required
+        :param rng: np.random.Generator, optional, see CompiledColumn.roll()
+        """
+        return self.columns[difficulty.strip()].roll(rng)
+
+    def roll_id(self, difficulty, rng=None):
+        """This method rolls like roll() and returns the OUTCOMES ID of the
+        Outcome instead of its text."""
+        return self.columns[difficulty.strip()].roll_id(rng)
+
+
+class CompiledTableRegistry:
+    """
+    This object hands out one CompiledTable per worksheet so that every
+    Character rolling on the same table holds a reference to the same object.
+    Twenty or two thousand identical minions then cost one compiled table each
+    for action and targeting, not one per minion.
+
+    Tables are keyed by their worksheet name, truncated to Excel's 31
+    characters, and the fingerprint of the workbook they came from, as given by
+    WorkbookCache.workbook_key(). When a workbook changes on disk, the tables
+    compiled from its older versions are dropped the next time one of its
+    tables is requested.
+    """
+    def __init__(self):
+        self._tables = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def table_key(filepath, table_name):
+        """This static method returns the registry key for a table: the worksheet
+        name and the fingerprint of the workbook's current version."""
+        return (table_name[:MAX_SHEET_NAME_LENGTH], WorkbookCache.workbook_key(filepath))
+
+    def get(self, filepath, table_name, table: pd.DataFrame):
+        """
+        This method returns the shared CompiledTable for a worksheet, compiling
+        it from table the first time that worksheet is requested. The table
+        must already have passed validation.
+        :param filepath: str, required
+        :param table_name: str, required, may be longer than 31 characters
+        :param table: pd.DataFrame, required, the worksheet as loaded
+        :return: CompiledTable
+        """
+        key = self.table_key(filepath, table_name)
+        sheet_name, fingerprint = key
+        with self._lock:
+            compiled = self._tables.get(key)
+            if compiled is not None:
+                return compiled
+            path = fingerprint[0]
+            if self._fingerprints.get(path) != fingerprint:
+                # The workbook changed. Its older tables can no longer be
+                # requested, so they are released.
+                for stale_key in [k for k in self._tables if k[1][0] == path]:
+                    del self._tables[stale_key]
+                self._fingerprints[path] = fingerprint
+            compiled = CompiledTable.from_dataframe(sheet_name, table)
+            self._tables[key] = compiled
+            return compiled
+
+    def carry_over(self, filepath, changed):
+        """
+        This method keeps the compiled tables of a workbook that has changed on
+        disk for its new version, except for the worksheets named in changed,
+        which are dropped and compiled again the next time they are requested.
+        Use it when the changed worksheets are known, e.g. from a
+        WorkbookSnapshot, instead of letting get() drop every table.
+        :param filepath: str, required
+        :param changed: set of str, required, worksheet names
+        """
+        fingerprint = WorkbookCache.workbook_key(filepath)
+        path = fingerprint[0]
+        with self._lock:
+            for key in [k for k in self._tables if k[1][0] == path]:
+                compiled = self._tables.pop(key)
+                if key[0] not in changed:
+                    self._tables[(key[0], fingerprint)] = compiled
+            self._fingerprints[path] = fingerprint
+
+    def __len__(self):
+        return len(self._tables)
+
+    def clear(self):
+        """This method drops every compiled table."""
+        with self._lock:
+            self._tables.clear()
+            self._fingerprints.clear()
+
+
+# Process-wide registry shared by every Character.
+COMPILED_TABLES = CompiledTableRegistry()
+
+
+def upper_bound(item: str):
+    """This function returns the larger integer in a table item, either a
+    single integer or a 'low-high' range, read by table_value(), so 0 and 00
+    both become 100."""
+    return table_value(item.split('-')[-1])
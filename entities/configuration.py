@@ -0,0 +1,72 @@
+import os
+
+from .stance_model import build_transition_model
+from .surges import SurgeLullIndex
+from .workbook_cache import WORKBOOK_CACHE
+
+REQUIRED_WORKSHEETS = ['Combat Outcomes', 'Combat Roles', 'Combat Stances',
+                       'Combat Targeting Summary']
+OPTIONAL_WORKSHEETS = ['Combat Role Variations', 'Combat Surges', 'Combat Lulls',
+                       'Combat Stance Transitions', 'Combat Variant Transitions']
+
+
+def load_configuration_tables(filepath):
+    """
+    This function loads the configuration workbook without any GUI. It returns
+    two dictionaries of pd.DataFrame, the required and the optional worksheets.
+    Optional worksheets that do not exist are set to None. It raises
+    FileNotFoundError if the workbook does not exist and ValueError if a
+    required worksheet is missing.
+    :param filepath: str, required
+    :return: tuple of dict of pd.DataFrame
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Required Configuration file, {filepath}, not found.")
+    required_config_dfs = {}
+    optional_config_dfs = {}
+    for worksheet in REQUIRED_WORKSHEETS:
+        try:
+            required_config_dfs[worksheet] = WORKBOOK_CACHE.get_sheet(filepath, worksheet)
+        except ValueError:
+            raise ValueError(f"Required {worksheet} not found in {filepath}")
+    for worksheet in OPTIONAL_WORKSHEETS:
+        try:
+            optional_config_dfs[worksheet] = WORKBOOK_CACHE.get_sheet(filepath, worksheet)
+        except ValueError:
+            optional_config_dfs[worksheet] = None
+    return required_config_dfs, optional_config_dfs
+
+
+def build_surge_lull_index(required_config_dfs, optional_config_dfs):
+    """
+    This function compiles the optional Combat Surges and Combat Lulls
+    worksheets into a SurgeLullIndex, checked against the outcomes in Combat
+    Outcomes. The GUI, headless runs and statistics all look effects up in it.
+    :param required_config_dfs: dict of pd.DataFrame, required
+    :param optional_config_dfs: dict of pd.DataFrame, required
+    :return: SurgeLullIndex
+    """
+    outcomes_df = required_config_dfs['Combat Outcomes']
+    outcomes = outcomes_df[outcomes_df.columns[0]].tolist()
+    return SurgeLullIndex.from_tables(optional_config_dfs['Combat Surges'],
+                                      optional_config_dfs['Combat Lulls'], outcomes)
+
+
+def build_transition_models(required_config_dfs, optional_config_dfs):
+    """
+    This function reads the optional Combat Stance Transitions and Combat
+    Variant Transitions worksheets into TransitionModels, checked against the
+    Combat Stances and Combat Role Variations. Either is None if its worksheet is
+    not configured.
+    :param required_config_dfs: dict of pd.DataFrame, required
+    :param optional_config_dfs: dict of pd.DataFrame, required
+    :return: tuple of TransitionModel or None, (stances, role variants)
+    """
+    stances_df = required_config_dfs['Combat Stances']
+    stance_model = build_transition_model(optional_config_dfs.get('Combat Stance Transitions'),
+                                          stances_df[stances_df.columns[0]].tolist())
+    variants_df = optional_config_dfs.get('Combat Role Variations')
+    variants = None if variants_df is None else variants_df[variants_df.columns[0]].tolist()
+    variant_model = build_transition_model(
+        optional_config_dfs.get('Combat Variant Transitions'), variants)
+    return stance_model, variant_model
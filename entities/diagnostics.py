@@ -0,0 +1,193 @@
+import atexit
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(levelname)s %(name)s: %(message)s'
+DEBUG_ENVIRONMENT_VARIABLE = 'COMBAT_MODELER_DEBUG'
+PROFILE_ENVIRONMENT_VARIABLE = 'COMBAT_MODELER_PROFILE'
+# Upper bounds, in seconds, of the latency histogram buckets: 1, 2 and 5 of
+# every decade from a microsecond to ten seconds. Anything slower falls in a
+# last, open bucket.
+HISTOGRAM_BOUNDS = tuple(float(f"{mantissa}e{exponent}") for exponent in range(-6, 1)
+                         for mantissa in (1, 2, 5)) + (10.0,)
+
+
+def configure_logging(debug=False):
+    """
+    This function sets up logging for the GUI and the headless runner. By
+    default only warnings and errors are shown, so no table is ever formatted
+    into a log message. Debug mode shows every diagnostic message, including
+    the full action and targeting tables. It is turned on by the debug
+    argument or by setting the COMBAT_MODELER_DEBUG environment variable.
+    :param debug: bool, optional, defaults to False
+    """
+    if os.environ.get(DEBUG_ENVIRONMENT_VARIABLE):
+        debug = True
+    level = logging.DEBUG if debug else logging.WARNING
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+    logging.getLogger().setLevel(level)
+
+
+class Metric:
+    """
+    This object collects the calls to one instrumented function or phase: how
+    many there were, their total, minimum and maximum time and a histogram of
+    their latency over HISTOGRAM_BOUNDS.
+    """
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if self.maximum is None or seconds > self.maximum:
+            self.maximum = seconds
+        self.buckets[bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+
+    def percentile(self, fraction):
+        """This method returns the upper bound of the histogram bucket holding
+        the given fraction of the calls, e.g. 0.95, or the maximum time if it
+        falls in the open bucket."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BOUNDS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        """This method returns the metric as a dict that can be written as JSON.
+        Times are in seconds and the histogram maps each bucket's upper bound to
+        its count, leaving out empty buckets."""
+        histogram = {f"<={bound:g}": count
+                     for bound, count in zip(HISTOGRAM_BOUNDS, self.buckets) if count}
+        if self.buckets[-1]:
+            histogram[f">{HISTOGRAM_BOUNDS[-1]:g}"] = self.buckets[-1]
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.minimum,
+                'max': self.maximum,
+                'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95),
+                'histogram': histogram}
+
+
+class PerformanceCounters:
+    """
+    This object times the hot paths of the program, such as loading and
+    validating tables, rolling, surge and lull lookups and showing results, so
+    that a slow Run Simulation can be traced to the phase responsible.
+
+    Functions are instrumented with the timed() decorator, and other code can
+    use timer() or add(). While disabled, which is the default, a timed function
+    costs one attribute check more than before and nothing is recorded. Enable
+    it with enabled = True, configure_performance() or the
+    COMBAT_MODELER_PROFILE environment variable.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def timed(self, name):
+        """This method returns a decorator that records every call of the
+        decorated function under name while the counters are enabled."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.add(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """This method returns a context manager that records the time spent in
+        its block under name while the counters are enabled."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        """This method records one call of seconds under name."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric()
+            metric.add(seconds)
+
+    def snapshot(self):
+        """This method returns every metric recorded so far as a dict of name to
+        Metric.summary(), sorted by name."""
+        with self._lock:
+            return {name: self._metrics[name].summary() for name in sorted(self._metrics)}
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def dump(self, filepath):
+        """This method writes snapshot() to filepath as JSON."""
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump({'enabled': self.enabled, 'metrics': self.snapshot()}, f, indent=2)
+        logger.info("PerformanceCounters.dump: Written to %s.", filepath)
+
+    def format_summary(self):
+        """This method returns snapshot() as text, one line per metric with its
+        count, total, mean and 95th percentile in milliseconds."""
+        lines = []
+        for name, metric in self.snapshot().items():
+            lines.append(f"{name:<28} {metric['count']:>9} calls "
+                         f"{metric['total'] * 1000:>11.1f} ms total "
+                         f"{metric['mean'] * 1000:>9.3f} ms mean "
+                         f"{metric['p95'] * 1000:>9.3f} ms p95")
+        return '\n'.join(lines) if lines else "Nothing has been recorded."
+
+
+# Process-wide counters used by every instrumented function.
+PERFORMANCE = PerformanceCounters()
+
+
+def configure_performance(enabled=False, dump_path=None):
+    """
+    This function turns on PERFORMANCE and, with dump_path, writes it as JSON
+    when the program exits. Setting the COMBAT_MODELER_PROFILE environment
+    variable to a file path does both.
+    :param enabled: bool, optional, defaults to False
+    :param dump_path: str, optional
+    """
+    dump_path = dump_path or os.environ.get(PROFILE_ENVIRONMENT_VARIABLE) or None
+    if dump_path:
+        enabled = True
+        atexit.register(PERFORMANCE.dump, dump_path)
+    PERFORMANCE.enabled = enabled
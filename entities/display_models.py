@@ -1,8 +1,15 @@
 import sys
 from PySide6 import QtCore, QtGui, QtWidgets
-from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PySide6.QtCore import Qt, QAbstractTableModel, QAbstractListModel, QModelIndex
 import pandas as pd
 
+from .availability import sheet_availability
+from .diagnostics import PERFORMANCE
+from .event_log import EFFECT, END, MESSAGE, START, EventLog
+from .internal_objects import Character, prefetch_tables
+from .rng import RandomStreams
+from .stance_model import advance_stances
+
 
 class PandasModel(QAbstractTableModel):
     """Interface between Pandas DataFrame and Qt."""
@@ -46,3 +53,402 @@ class PandasModel(QAbstractTableModel):
             if orientation == Qt.Vertical:
                 return str(self._dataframe.index[section])
         return None
+
+
+class RosterModel(QAbstractTableModel):
+    """
+    Interface between a roster of Character objects and Qt. Each row is one
+    combatant and its role, variant, stance, difficulty, level and whether it
+    is active can be edited in place. Characters are created lazy, so adding
+    hundreds of rows does not load any tables until they are used.
+
+    Simulations do not go through the model. They take the plain list from
+    characters() or active_characters().
+    :param config: dict of list, required, as made by
+        CombatModelerWindow.extract_dropdown_lists()
+    :param combat_tables_filepath: str, required
+    :param seed: int, optional, master seed for the combatants' RandomStreams
+    """
+    COLUMNS = ['Name', 'Role', 'Variant', 'Stance', 'Difficulty', 'Level', 'Active']
+    NAME, ROLE, VARIANT, STANCE, DIFFICULTY, LEVEL, ACTIVE = range(len(COLUMNS))
+    # Character attribute shown in each column other than Active.
+    ATTRIBUTES = ['name', 'combat_role', 'role_variant', 'combat_stance', 'difficulty',
+                  'level']
+
+    def __init__(self, config, combat_tables_filepath, parent=None, seed=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.config = config
+        self.combat_workbook_filepath = combat_tables_filepath
+        # Every combatant added gets its own stream, numbered in order of
+        # creation and never reused, so rows keep their streams when others
+        # are removed.
+        self.streams = RandomStreams(seed)
+        self._characters = []
+        self._active = []
+        self._created = 0
+        self._streams_used = 0
+        self.read_only = False
+
+    def rowCount(self, parent=QModelIndex()):
+        """Override QAbstractTableModel method to return the number of
+        combatants."""
+        if parent == QModelIndex():
+            return len(self._characters)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        """Override QAbstractTableModel method to return the number of
+        columns."""
+        if parent == QModelIndex():
+            return len(self.COLUMNS)
+        return 0
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        """Override QAbstractTableModel method to return a combatant's values.
+        The Active column is shown as a check box."""
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if column == self.ACTIVE:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if self._active[row] else Qt.Unchecked
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            value = getattr(self._characters[row], self.ATTRIBUTES[column])
+            return "" if value is None else str(value)
+        return None
+
+    def setData(self, index: QModelIndex, value, role=Qt.EditRole):
+        """Override QAbstractTableModel method to edit a combatant. Changing
+        anything other than the name updates the Character, which starts
+        prefetching its new tables."""
+        if not index.isValid() or self.read_only:
+            return False
+        row, column = index.row(), index.column()
+        if column == self.ACTIVE:
+            if role != Qt.CheckStateRole:
+                return False
+            self.set_active([row], Qt.CheckState(value) == Qt.Checked)
+            return True
+        if role != Qt.EditRole or self.options(column) == []:
+            return False
+        character = self._characters[row]
+        first = last = index
+        if column == self.NAME:
+            character.name = str(value)
+        else:
+            values = {attribute: getattr(character, attribute)
+                      for attribute in self.ATTRIBUTES}
+            values[self.ATTRIBUTES[column]] = value
+            availability = self.availability() if column in (self.ROLE,
+                                                             self.VARIANT) else None
+            if availability is not None:
+                # Keep the combatant on a combination that has worksheets, changing
+                # its variant or stance only if it has to.
+                (values['combat_role'], values['role_variant'],
+                 values['combat_stance']) = availability.nearest(values['combat_role'],
+                                                                 values['role_variant'],
+                                                                 values['combat_stance'])
+                first, last = self.index(row, self.ROLE), self.index(row, self.STANCE)
+            character.update_status(name=values['name'],
+                                    combat_role=values['combat_role'],
+                                    combat_stance=values['combat_stance'],
+                                    difficulty=values['difficulty'],
+                                    role_variant=values['role_variant'],
+                                    individual_level=values['level'])
+            prefetch_tables(self.combat_workbook_filepath,
+                            (character.combat_action_table_name,
+                             character.combat_targeting_table_name))
+        self.dataChanged.emit(first, last)
+        return True
+
+    def flags(self, index: QModelIndex):
+        """Override QAbstractTableModel method to make cells editable, except
+        for optional columns that are not configured."""
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if self.read_only:
+            return flags
+        if index.column() == self.ACTIVE:
+            return flags | Qt.ItemIsUserCheckable
+        if self.options(index.column()) == []:
+            return flags
+        return flags | Qt.ItemIsEditable
+
+    def headerData(self, section: int,
+                   orientation: Qt.Orientation,
+                   role=Qt.DisplayRole):
+        """Override QAbstractTableModel method to return the column names and
+        row numbers."""
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                return self.COLUMNS[section]
+            if orientation == Qt.Vertical:
+                return str(section + 1)
+        return None
+
+    def set_read_only(self, read_only):
+        """This method stops or allows editing in the view, e.g. while a
+        simulation is running on the roster."""
+        self.read_only = read_only
+        if self._characters:
+            self.dataChanged.emit(self.index(0, 0),
+                                  self.index(len(self._characters) - 1,
+                                             len(self.COLUMNS) - 1))
+
+    def options(self, column, row=None):
+        """This method returns the choices for a column as a list of str, None
+        if the column takes free text, or an empty list if the column is an
+        optional one that is not configured. With a row, the roles, variants and
+        stances are narrowed to the ones with worksheets for that combatant's
+        other values, as found by availability()."""
+        key = {self.ROLE: 'Combat Roles',
+               self.VARIANT: 'Combat Role Variations',
+               self.STANCE: 'Combat Stances',
+               self.DIFFICULTY: 'Relative Difficulty',
+               self.LEVEL: 'Surges and Lulls'}.get(column)
+        if key is None:
+            return None
+        options = self.config[key] or []
+        if row is None or not options or column not in (self.ROLE, self.VARIANT, self.STANCE):
+            return options
+        availability = self.availability()
+        if availability is None:
+            return options
+        character = self._characters[row]
+        if column == self.ROLE:
+            available = availability.available_roles()
+        elif column == self.VARIANT:
+            available = availability.variants_for(character.combat_role)
+        else:
+            available = availability.stances_for(character.combat_role,
+                                                 character.role_variant)
+        # With nothing available, e.g. a role with no worksheets at all, every
+        # choice is offered so the combatant can still be changed.
+        return available or options
+
+    def availability(self):
+        """This method returns the AvailabilityMatrix of the combat workbook for the
+        configured roles, variants and stances, or None if the workbook cannot be
+        read. It is kept in WORKBOOK_CACHE until the workbook changes."""
+        try:
+            return sheet_availability(self.combat_workbook_filepath,
+                                      self.config['Combat Roles'],
+                                      self.config['Combat Role Variations'],
+                                      self.config['Combat Stances'])
+        except OSError:
+            return None
+
+    def add_combatants(self, count, names=None):
+        """This method appends count combatants with the first option of every
+        dropdown, in one insertion so that the view only updates once.
+        :param count: int, required
+        :param names: list of str, optional, defaults to numbered names
+        """
+        if count <= 0:
+            return
+        if names is None:
+            names = [f"Combatant {self._created + i + 1}" for i in range(count)]
+        defaults = {column: (self.options(column) or [None])[0]
+                    for column in (self.ROLE, self.VARIANT, self.STANCE, self.DIFFICULTY,
+                                   self.LEVEL)}
+        availability = self.availability()
+        if availability is not None and availability.available_roles():
+            role = defaults[self.ROLE]
+            if not availability.is_available(role, defaults[self.VARIANT],
+                                             defaults[self.STANCE]):
+                if role not in availability.available_roles():
+                    role = availability.available_roles()[0]
+                (defaults[self.ROLE], defaults[self.VARIANT],
+                 defaults[self.STANCE]) = availability.nearest(role, defaults[self.VARIANT],
+                                                               defaults[self.STANCE])
+        characters = [Character(name=name,
+                                combat_role=defaults[self.ROLE],
+                                combat_stance=defaults[self.STANCE],
+                                difficulty=defaults[self.DIFFICULTY],
+                                combat_tables_filepath=self.combat_workbook_filepath,
+                                role_variant=defaults[self.VARIANT],
+                                individual_level=defaults[self.LEVEL],
+                                lazy=True)
+                      for name in names]
+        self.add_characters(characters)
+        prefetch_tables(self.combat_workbook_filepath,
+                        (characters[0].combat_action_table_name,
+                         characters[0].combat_targeting_table_name))
+
+    def add_characters(self, characters, active=False):
+        """This method appends existing Character objects, e.g. from
+        load_roster(), to the roster. Characters without an rng are given their
+        own stream from self.streams.
+        :param characters: list of Character, required
+        :param active: bool, optional, defaults to False
+        """
+        if not characters:
+            return
+        for character in characters:
+            if character.rng is None:
+                character.rng = self.streams.combatant_generator(self._streams_used)
+                self._streams_used += 1
+        first = len(self._characters)
+        self.beginInsertRows(QModelIndex(), first, first + len(characters) - 1)
+        self._characters.extend(characters)
+        self._active.extend([active] * len(characters))
+        self._created += len(characters)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        """This method removes the combatants in the given rows. Contiguous rows
+        are removed together, starting from the end so indexes stay valid."""
+        rows = sorted(set(rows))
+        while rows:
+            last = rows.pop()
+            first = last
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._characters[first:last + 1]
+            del self._active[first:last + 1]
+            self.endRemoveRows()
+
+    def set_active(self, rows, active):
+        """This method makes the combatants in the given rows active or inactive.
+        Their tables are resolved when they are next rolled."""
+        rows = list(rows)
+        for row in rows:
+            self._active[row] = active
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), self.ACTIVE),
+                                  self.index(max(rows), self.ACTIVE),
+                                  [Qt.CheckStateRole])
+
+    def advance_stances(self, stance_model, rng, variant_model=None):
+        """This method moves every active combatant on to the stance, and role
+        variant if variant_model is given, drawn for the next round with
+        advance_stances(), and returns the changes it made."""
+        changed = advance_stances(self.active_characters(), stance_model, rng, variant_model)
+        if changed:
+            changed_ids = {id(change[0]) for change in changed}
+            rows = [row for row, character in enumerate(self._characters)
+                    if id(character) in changed_ids]
+            self.dataChanged.emit(self.index(min(rows), self.VARIANT),
+                                  self.index(max(rows), self.STANCE))
+        return changed
+
+    def clear(self):
+        """This method removes every combatant."""
+        self.beginResetModel()
+        self._characters = []
+        self._active = []
+        self._created = 0
+        self.endResetModel()
+
+    def stream_state(self):
+        """This method returns what the model needs to carry on handing out the
+        same random streams after restore(): the master seed and how many
+        combatants and streams it has created."""
+        return {'seed': self.streams.seed, 'streams_used': self._streams_used,
+                'created': self._created}
+
+    def restore(self, characters, active, state=None):
+        """
+        This method replaces the whole roster with a restored one, in one reset
+        so the view only updates once.
+        :param characters: list of Character, required, each with its own rng
+        :param active: list of bool, required, one per character
+        :param state: dict, optional, from stream_state()
+        """
+        self.beginResetModel()
+        if state:
+            self.streams = RandomStreams(state['seed'])
+            self._streams_used = state['streams_used']
+            self._created = state['created']
+        else:
+            self._created = len(characters)
+        for character in characters:
+            if character.rng is None:
+                character.rng = self.streams.combatant_generator(self._streams_used)
+                self._streams_used += 1
+        self._characters = list(characters)
+        self._active = list(active)
+        self.endResetModel()
+
+    def characters(self):
+        """This method returns the list of every Character in roster order."""
+        return list(self._characters)
+
+    def active_characters(self):
+        """This method returns the list of active Character objects in roster
+        order."""
+        return [character for character, active in zip(self._characters, self._active)
+                if active]
+
+    def active_rows(self):
+        """This method returns the set of rows whose combatants are active."""
+        return {row for row, active in enumerate(self._active) if active}
+
+
+class EventLogModel(QAbstractListModel):
+    """
+    Interface between an EventLog and a Qt list view. The view asks only for the
+    rows on screen, so appending stays cheap however long the log gets. Records
+    the log spills to disk leave the model and can be found with search().
+    :param event_log: EventLog, optional, defaults to a new EventLog
+    """
+    def __init__(self, event_log=None, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.event_log = event_log if event_log is not None else EventLog()
+        self._bold = QtGui.QFont()
+        self._bold.setBold(True)
+        self._heading = QtGui.QFont()
+        self._heading.setBold(True)
+        self._heading.setPointSizeF(self._heading.pointSizeF() * 1.2)
+
+    def rowCount(self, parent=QModelIndex()):
+        """Override QAbstractListModel method to return the number of records held
+        in memory."""
+        if parent == QModelIndex():
+            return len(self.event_log)
+        return 0
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        """Override QAbstractListModel method to return a record's text, with
+        event headings and surge and lull effects in bold."""
+        if not index.isValid():
+            return None
+        record = self.event_log[index.row()]
+        if role == Qt.DisplayRole:
+            return record.text
+        if role == Qt.FontRole:
+            if record.kind in (START, END):
+                return self._heading
+            if record.kind in (EFFECT, MESSAGE):
+                return self._bold
+        return None
+
+    @PERFORMANCE.timed('event_log_append')
+    def add_records(self, records):
+        """This method appends records to the log, telling the view which rows
+        were spilled from the top and which were added at the bottom."""
+        records = list(records)
+        if not records:
+            return
+        if len(records) >= self.event_log.max_records:
+            self.beginResetModel()
+            self.event_log.extend(records)
+            self.endResetModel()
+            return
+        overflow = self.event_log.overflow(len(records))
+        if overflow:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            self.event_log.spill(overflow)
+            self.endRemoveRows()
+        first = len(self.event_log)
+        self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+        self.event_log.extend(records)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.event_log.clear()
+        self.endResetModel()
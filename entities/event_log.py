@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import tempfile
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RECORDS = 10000
+MAX_RECORDS_ENVIRONMENT_VARIABLE = 'COMBAT_MODELER_LOG_RECORDS'
+DEFAULT_SEARCH_LIMIT = 1000
+# Kinds of LogRecord. Results have the combatant's fields filled in.
+START, RESULT, EFFECT, END, MESSAGE = 'start', 'result', 'effect', 'end', 'message'
+
+LogRecord = namedtuple('LogRecord', ['event', 'kind', 'text', 'name', 'action', 'target',
+                                     'combat_status'],
+                       defaults=[None, None, None, None])
+
+
+def event_records(event, results):
+    """
+    This function turns the results of one event, as returned by run_event(),
+    into the LogRecord lines shown for it: a start line, a line per combatant,
+    a line per surge or lull effect and an end line.
+    :param event: int, required
+    :param results: list of dict, required
+    :return: list of LogRecord
+    """
+    records = [LogRecord(event, START, f"Beginning Event {event}")]
+    for result in results:
+        records.append(LogRecord(event, RESULT,
+                                 f"{result['name']} targets {result['target']} with "
+                                 f"{result['action']}",
+                                 result['name'], result['action'], result['target'],
+                                 result['combat_status']))
+        if result['effect'] is not None:
+            records.append(LogRecord(event, EFFECT, f"{result['effect']}.", result['name']))
+    records.append(LogRecord(event, END, f"End of Event {event}"))
+    return records
+
+
+def configured_max_records():
+    """This function returns the number of log records to keep in memory, taken
+    from the COMBAT_MODELER_LOG_RECORDS environment variable if it is set to a
+    positive integer, or DEFAULT_MAX_RECORDS otherwise."""
+    value = os.environ.get(MAX_RECORDS_ENVIRONMENT_VARIABLE)
+    if value:
+        try:
+            max_records = int(value)
+        except ValueError:
+            max_records = 0
+        if max_records > 0:
+            return max_records
+        logger.warning("%s must be a positive integer, not %r. Using %s.",
+                       MAX_RECORDS_ENVIRONMENT_VARIABLE, value, DEFAULT_MAX_RECORDS)
+    return DEFAULT_MAX_RECORDS
+
+
+class EventLog:
+    """
+    This object keeps the most recent max_records lines of the event log in a
+    ring buffer of LogRecord, so memory stays flat however long a session runs.
+    Older records are not lost: they are appended to a JSON lines spill file,
+    which search() reads along with the records still in memory.
+
+    The spill file is a temporary file created on first use unless spill_path
+    is given, and a temporary one is removed by close().
+    :param max_records: int, optional, defaults to configured_max_records()
+    :param spill_path: str, optional
+    """
+    def __init__(self, max_records=None, spill_path=None):
+        if max_records is None:
+            max_records = configured_max_records()
+        if max_records < 1:
+            raise ValueError("max_records must be at least 1.")
+        self.max_records = max_records
+        self.spill_path = spill_path
+        self._temporary = spill_path is None
+        self._buffer = [None] * max_records
+        self._start = 0
+        self._count = 0
+        self.spilled = 0
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx):
+        """This method returns the idx-th record held in memory, oldest first."""
+        if not 0 <= idx < self._count:
+            raise IndexError(f"Record {idx} is not in memory.")
+        return self._buffer[(self._start + idx) % self.max_records]
+
+    def __iter__(self):
+        return (self[idx] for idx in range(self._count))
+
+    def overflow(self, count):
+        """This method returns how many records held in memory must be spilled to
+        make room for count more."""
+        return max(0, min(self._count, self._count + count - self.max_records))
+
+    def extend(self, records):
+        """This method appends records, spilling the oldest ones to disk once the
+        ring buffer is full. Any that would not fit at all go straight to disk."""
+        records = list(records)
+        if len(records) > self.max_records:
+            self.spill(self._count)
+            self._write(records[:-self.max_records])
+            records = records[-self.max_records:]
+        self.spill(self.overflow(len(records)))
+        for record in records:
+            self._buffer[(self._start + self._count) % self.max_records] = record
+            self._count += 1
+
+    def append(self, record):
+        self.extend([record])
+
+    def spill(self, count):
+        """This method moves the count oldest records in memory to the spill file."""
+        if count <= 0:
+            return
+        self._write([self[idx] for idx in range(count)])
+        for idx in range(count):
+            self._buffer[(self._start + idx) % self.max_records] = None
+        self._start = (self._start + count) % self.max_records
+        self._count -= count
+
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        This method returns the records whose text contains text, ignoring case,
+        oldest first, from the spill file and then from memory.
+        :param text: str, required
+        :param limit: int, optional, defaults to DEFAULT_SEARCH_LIMIT, None for all
+        :return: list of LogRecord
+        """
+        needle = text.lower()
+        matches = []
+        for record in self._spilled_records():
+            if needle in record.text.lower():
+                matches.append(record)
+                if limit is not None and len(matches) >= limit:
+                    return matches
+        for record in self:
+            if needle in record.text.lower():
+                matches.append(record)
+                if limit is not None and len(matches) >= limit:
+                    break
+        return matches
+
+    def clear(self):
+        """This method drops every record, in memory and on disk."""
+        self._buffer = [None] * self.max_records
+        self._start = 0
+        self._count = 0
+        self.spilled = 0
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            open(self.spill_path, 'w').close()
+
+    def close(self):
+        """This method removes a temporary spill file."""
+        if self._temporary and self.spill_path is not None:
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
+            self.spill_path = None
+
+    def _write(self, records):
+        if not records:
+            return
+        if self.spill_path is None:
+            fd, self.spill_path = tempfile.mkstemp(prefix='combat-log-', suffix='.jsonl')
+            os.close(fd)
+            logger.debug("EventLog: Spilling old records to %s.", self.spill_path)
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        self.spilled += len(records)
+
+    def _spilled_records(self):
+        if not self.spilled:
+            return
+        with open(self.spill_path, encoding='utf-8') as f:
+            for line in f:
+                yield LogRecord(*json.loads(line))
@@ -0,0 +1,78 @@
+import logging
+
+from .combatant_store import CombatantStore
+from .compiled_tables import COMPILED_TABLES, MAX_SHEET_NAME_LENGTH
+from .workbook_cache import WORKBOOK_CACHE, WorkbookCache
+
+logger = logging.getLogger(__name__)
+
+
+class WorkbookSnapshot:
+    """
+    This object remembers the hash of every worksheet in a workbook so that,
+    when the file changes on disk, refresh() can tell which worksheets were
+    actually edited, added or removed. A save that leaves a worksheet's cells
+    alone leaves its hash alone too, so nothing built from it has to be redone.
+    The hashes are the ones saved in the compiled sidecar, so no worksheet is
+    parsed to take a snapshot.
+
+    The first refresh() records the workbook and reports no changes.
+    :param filepath: str, required
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.key = None
+        self.hashes = {}
+
+    def refresh(self):
+        """
+        This method rereads the workbook if it has changed on disk since the last
+        call and returns the names of the worksheets whose content differs, sorted.
+        It returns an empty list if the file is unchanged, and raises OSError if
+        the file cannot be read, e.g. while it is still being saved.
+        :return: list of str
+        """
+        key = WorkbookCache.workbook_key(self.filepath)
+        if key == self.key:
+            return []
+        hashes = WORKBOOK_CACHE.get_sheet_hashes(self.filepath)
+        first = self.key is None
+        self.key = key
+        old_hashes, self.hashes = self.hashes, hashes
+        if first:
+            return []
+        changed = sorted(sheet_name for sheet_name in old_hashes.keys() | hashes.keys()
+                         if old_hashes.get(sheet_name) != hashes.get(sheet_name))
+        logger.debug("WorkbookSnapshot.refresh: %s changed: %s", self.filepath, changed)
+        return changed
+
+
+def reload_changed_sheets(filepath, changed, characters):
+    """
+    This function brings characters up to date after the worksheets named in
+    changed were edited in the combat tables workbook at filepath. Compiled
+    tables of every other worksheet are kept for the new version of the
+    workbook, and only the characters rolling on a changed worksheet reload
+    and recompile their tables. Their name, role, last results and everything
+    else are left alone.
+    :param filepath: str, required
+    :param changed: list of str, required, as returned by WorkbookSnapshot.refresh()
+    :param characters: iterable of Character, or a CombatantStore, required
+    :return: list of Character, the ones that were reloaded, or of CombatantProxy
+        for a store
+    """
+    changed = set(changed)
+    COMPILED_TABLES.carry_over(filepath, changed)
+    if isinstance(characters, CombatantStore):
+        return [characters[row] for row in characters.reload_tables(changed)]
+    reloaded = []
+    for character in characters:
+        names = {name[:MAX_SHEET_NAME_LENGTH]
+                 for name in (character.combat_action_table_name,
+                              character.combat_targeting_table_name) if name}
+        if names & changed:
+            character.reload_tables()
+            reloaded.append(character)
+    logger.debug("reload_changed_sheets: Reloaded %s characters for %s changed sheets.",
+                 len(reloaded), len(changed))
+    return reloaded
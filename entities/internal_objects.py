@@ -1,14 +1,54 @@
-import sys
-import os
-import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 import random
 
-COMBAT_STATUSES = ['Normal', 'Minor Surge', 'Major Surge', 'Minor Lull', 'Major Lull']
+from .compiled_tables import COMPILED_TABLES
+from .diagnostics import PERFORMANCE
+from .outcomes import COMBAT_STATUSES, OUTCOMES
+from .sheet_index import sheet_index
+from .validation import table_value, validate_sheet
+from .workbook_cache import WORKBOOK_CACHE
+
+logger = logging.getLogger(__name__)
+
 DIFFICULTY_VARIATIONS = ['A', 'B', 'C', 'D']
 
 
+# A single background thread is enough to stay ahead of the user clicking
+# through the combo boxes, and keeps prefetching from competing with the GUI.
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='table-prefetch')
+
+
+def prefetch_tables(combat_tables_filepath, table_names):
+    """This function loads and validates tables on a background thread so that they
+    are already in WORKBOOK_CACHE when a Character resolves them. Tables that do not
+    exist are skipped. It returns a Future that completes when they are loaded.
+    :param combat_tables_filepath: str, required
+    :param table_names: list of str, required
+    :return: concurrent.futures.Future
+    """
+    return _prefetch_executor.submit(_prefetch, combat_tables_filepath, table_names)
+
+
+def _prefetch(combat_tables_filepath, table_names):
+    for table_name in table_names:
+        try:
+            worksheet_name = sheet_index(combat_tables_filepath).worksheet_name(table_name)
+            if worksheet_name is None:
+                continue
+            validate_sheet(combat_tables_filepath, worksheet_name)
+        except ValueError:
+            continue
+        except Exception:
+            # A failure here only means the table is loaded later on demand,
+            # where the error is reported properly.
+            logger.debug("prefetch_tables: Could not prefetch %s.", table_name,
+                         exc_info=True)
+
+
 class Character:
     """
     This object stores values for each of up to ten characters that
@@ -26,9 +66,15 @@ class Character:
     :param role_variant: str, optional, defaults to None
     :param individual_level: str, optional, defaults to None,if used, it is chosen
         by the user from INDIVIDUAL_LEVEL
+    :param lazy: bool, optional, defaults to False. If True, the tables are not loaded
+        until resolve_tables() is called, which the roll methods do on first use.
+    :param rng: np.random.Generator, optional, defaults to None. If given, every roll
+        is drawn from it, e.g. from RandomStreams.combatant_generator() so results can
+        be reproduced. Otherwise the random module is used.
     """
     def __init__(self, name,  combat_role, combat_stance, difficulty,
-                 combat_tables_filepath, role_variant=None, individual_level=None):
+                 combat_tables_filepath, role_variant=None, individual_level=None,
+                 lazy=False, rng=None):
         self.name = name
         self.combat_role = combat_role
         self.combat_stance = combat_stance
@@ -36,31 +82,43 @@ class Character:
         self.combat_workbook_filepath = combat_tables_filepath
         self.role_variant = role_variant
         self.level = individual_level
+        self.lazy = lazy
+        self.rng = rng
+        self.tables_resolved = False
         self.target = None
         self.action = None
+        self.target_id = None
+        self.action_id = None
         self.combat_action_table_name = None
         self.combat_action_table = None
         self.combat_targeting_table_name = None
         self.combat_targeting_table = None
+        self.compiled_action_table = None
+        self.compiled_targeting_table = None
         self.combat_status = 'Normal'
         self.create_table_names()
-        print(f"Character.__init__: {self}")
-        print(f"Character.__init__: Initialization completed.")
+        logger.debug("Character.__init__: %s", self)
+        logger.debug("Character.__init__: Initialization completed.")
 
     def clear_combat(self):
         """This method is required to clear the combat values when the
         Run Simulation button is pressed. It is included in the __init__()
         method rather than duplicate code."""
-        print(f"Character.clear_combat: Clearing combat settings.")
+        logger.debug("Character.clear_combat: Clearing combat settings.")
         self.target = None
         self.action = None
+        self.target_id = None
+        self.action_id = None
         self.combat_action_table_name = None
         self.combat_action_table = None
         self.combat_targeting_table_name = None
         self.combat_targeting_table = None
+        self.compiled_action_table = None
+        self.compiled_targeting_table = None
+        self.tables_resolved = False
         self.combat_status = 'Normal'
-        print(f"Character.clear_combat: {self}")
-        print(f"Character.clear_combat: clear_combat completed.")
+        logger.debug("Character.clear_combat: %s", self)
+        logger.debug("Character.clear_combat: clear_combat completed.")
 
     def update_status(self, name,  combat_role, combat_stance, difficulty,
                       role_variant=None, individual_level=None):
@@ -69,7 +127,7 @@ class Character:
         replaced or because their role, stance, and/or role variant need to
         change during combat. Difficulty and individual level will change if
         character changes or the GM needs to tweak the combat."""
-        print(f"Character.update_status: Update starting.")
+        logger.debug("Character.update_status: Update starting.")
         self.name = name
         self.combat_role = combat_role
         self.combat_stance = combat_stance
@@ -78,133 +136,125 @@ class Character:
         self.level = individual_level
         self.clear_combat()
         self.create_table_names()
-        print(f"Character.update_status: {self}")
-        print(f"Character.update_status: update completed.")
+        logger.debug("Character.update_status: %s", self)
+        logger.debug("Character.update_status: update completed.")
 
     def create_table_names(self):
-        """This method sets the Action and Targeting combat table names. It also
-        calls the load_table() method to load and set these table attribute
-        assignments."""
-        print(f"Character.create_table_names: Beginning creation of table names and "
-              f"loading tables.")
-        role = self.combat_role
-        stance = self.combat_stance
-        role_variant = self.role_variant
-        if role_variant:
-            action_table_name = f"{role} {role_variant} {stance} Action"
-            targeting_table_name = f"{role} {role_variant} {stance} Targeting"
-        else:
-            action_table_name = f"{role} {stance} Action"
-            targeting_table_name = f"{role} {stance} Targeting"
+        """This method sets the Action and Targeting combat table names. Unless the
+        character is lazy, it also calls resolve_tables() to load and set these table
+        attribute assignments."""
+        logger.debug("Character.create_table_names: Beginning creation of table names.")
+        action_table_name, targeting_table_name = self.table_names_for(
+            self.combat_role, self.role_variant, self.combat_stance)
         self.combat_action_table_name = action_table_name
         self.combat_targeting_table_name = targeting_table_name
-        self.combat_action_table = self.load_table(action_table_name)
-        self.combat_targeting_table = self.load_table(targeting_table_name)
+        if not self.lazy:
+            self.resolve_tables()
+        logger.debug("Character.create_table_names: %s", self)
+        logger.debug("Character.create_table_names: table names completed.")
+
+    def resolve_tables(self):
+        """This method loads, validates and compiles the action and targeting tables
+        named by create_table_names(). It does nothing if they are already resolved."""
+        if self.tables_resolved:
+            return
+        logger.debug("Character.resolve_tables: Loading %s and %s.",
+                     self.combat_action_table_name, self.combat_targeting_table_name)
+        self.combat_action_table = self.load_table(self.combat_action_table_name)
+        self.combat_targeting_table = self.load_table(self.combat_targeting_table_name)
         self.validate_tables()
-        print(f"Character.create_table_names: {self}")
-        print(f"Character.create_table_names: pulling tables completed.")
+        self.compile_tables()
+        self.tables_resolved = True
+        logger.debug("Character.resolve_tables: pulling tables completed.")
+
+    def reload_tables(self):
+        """This method drops the action and targeting tables and resolves them again
+        from the current version of the workbook, keeping the character's last
+        results. It is used when a worksheet the character rolls on is edited. Lazy
+        characters that have not resolved their tables yet are left for their next
+        roll."""
+        if not self.tables_resolved:
+            return
+        self.combat_action_table = None
+        self.combat_targeting_table = None
+        self.compiled_action_table = None
+        self.compiled_targeting_table = None
+        self.tables_resolved = False
+        self.resolve_tables()
+
+    @staticmethod
+    def table_names_for(combat_role, role_variant, combat_stance):
+        """This static method returns the names of the action and targeting tables for
+        a combination of role, role variant and stance as a tuple of two strings. The
+        names are not truncated to Excel's 31 character limit."""
+        if role_variant:
+            return (f"{combat_role} {role_variant} {combat_stance} Action",
+                    f"{combat_role} {role_variant} {combat_stance} Targeting")
+        return (f"{combat_role} {combat_stance} Action",
+                f"{combat_role} {combat_stance} Targeting")
 
+    @PERFORMANCE.timed('validate_tables')
     def validate_tables(self):
         """This method ensures that the combat action and targeting tables will
         be usable by this program. Other classes that use this will need to respond
         to a self.combat_action_table or self.combat_targeting_table being set to
-        "invalid". It will also stop if the status of the table is already missing.
-        This method returns no values. All changes are made in place."""
-        print(f"Character.validate_tables: Beginning validation of tables to be used.")
-        if isinstance(self.combat_action_table, str):
-            return
-        if isinstance(self.combat_targeting_table, str):
-            return
-
-        action_table = self.combat_action_table
-        action_table_name = self.combat_action_table_name
-        targeting_table = self.combat_targeting_table
-        targeting_table_name = self.combat_targeting_table_name
-        action_cols = [col.strip() for col in action_table.columns]
-        target_cols = [col.strip() for col in targeting_table.columns]
-        cols = DIFFICULTY_VARIATIONS.copy()
-        cols.append('Outcome')
-        errors = 0
-        if cols != action_cols:
-            print(f"Character.validate_tables: cols: {cols}. action_cols: {action_cols}")
-            print(f"Character.validate_tables: marking table invalid")
+        "invalid". A table that is already missing or invalid is skipped, and the
+        other one is still validated, so it is never compiled unchecked.
+        Each worksheet is checked by validate_sheet(), which covers all four
+        difficulty columns and caches its result, so a worksheet shared by several
+        characters is only validated once. This method returns no values. All changes
+        are made in place."""
+        logger.debug("Character.validate_tables: Beginning validation of tables to be used.")
+        action_errors = []
+        if not isinstance(self.combat_action_table, str):
+            action_errors = validate_sheet(self.combat_workbook_filepath,
+                                           self.combat_action_table_name[:31])
+        for error in action_errors:
+            logger.warning("Character.validate_tables: %s: %s",
+                           self.combat_action_table_name, error)
+        if action_errors:
             self.combat_action_table = "invalid"
-            errors += 1
-        if cols != target_cols:
-            print(f"Character.validate_tables: cols: {cols}. target_cols: {target_cols}")
-            print(f"Character.validate_tables: marking table invalid")
+        targeting_errors = []
+        if not isinstance(self.combat_targeting_table, str):
+            targeting_errors = validate_sheet(self.combat_workbook_filepath,
+                                              self.combat_targeting_table_name[:31])
+        for error in targeting_errors:
+            logger.warning("Character.validate_tables: %s: %s",
+                           self.combat_targeting_table_name, error)
+        if targeting_errors:
             self.combat_targeting_table = "invalid"
-            errors += 1
-        if errors != 0:
-            print(f"Character.validate_tables: {errors} have been generated. Action "
-                  f"table, {action_table_name} or targeting table, {targeting_table_name} "
-                  f"has an invalid format. Ending processing.")
-            return
-        print(f"Character.validate_tables: action table {action_table_name} and target "
-              f"table {targeting_table_name} passed phase 1 validation.")
-
-        # The columns of the tables are correct or an approximate match.
-        # Now, the contents of each columns need to checked. Columns A through
-        # D (columns[0] to columns[3) must contain one of the following: a dash
-        # "-" string for not applicable, a string or integer that can contain
-        # leading zeros or be composed of zeros, or two integers connected by a
-        # dash "-" character indicating a range of values. The left value must be
-        # less than or equal to the right value. The fifth column is a string.
-        for n in range(0, 4):
-            action_series = action_table[action_table.columns[n]]
-            target_series = targeting_table[targeting_table.columns[n]]
-            for item in action_series:
-                if not self.check_item(item):
-                    print(f"Character.validate_tables: item: {item} in table {action_table_name} "
-                          f"failed validation")
-                    self.combat_action_table = "invalid"
-                    errors += 1
-            for item in target_series:
-                if not self.check_item(item):
-                    print(f"Character.validate_tables: item: {item} in table "
-                          f"{targeting_table_name} failed validation")
-                    self.combat_targeting_table = "invalid"
-                    errors += 1
-            if errors != 0:
-                print(f"Character.validate_tables: {errors} have been generated. Action "
-                      f"table, {action_table_name} or targeting table, {targeting_table_name} "
-                      f"has an invalid format. Ending processing.")
-                return
-            print(f"Character.validate_tables: action table {action_table_name} and target "
-                  f"table {targeting_table_name} passed phase 2 validation.")
-
-            # The final step is to make sure that the series in each table column
-            # have sequential values with no gaps. self.check_series() is a static
-            # method to perform that operation.
-            if not self.check_series(action_series):
-                bad_series = DIFFICULTY_VARIATIONS[n]
-                print(f"Character.validate_tables: series {bad_series} in "
-                      f"{action_table_name} is not sequential.")
-                self.combat_action_table = "invalid"
-                errors += 1
-            if not self.check_series(target_series):
-                bad_series = DIFFICULTY_VARIATIONS[n]
-                print(f"Character.validate_tables: series {bad_series} in "
-                      f"{targeting_table_name} is not sequential.")
-                self.combat_targeting_table = "invalid"
-                errors += 1
-            if errors != 0:
-                print(f"Character.validate_tables: {errors} have been generated. Action "
-                      f"table, {action_table_name} or targeting table, {targeting_table_name} "
-                      f"has an invalid format. Ending processing.")
-                return
-            print(f"Character.validate_tables: action table {action_table_name} and target "
-                  f"table {targeting_table_name} passed phase 1 validation.")
-            return
+        logger.debug("Character.validate_tables: action table %s and target table %s "
+                     "validated with %s errors.", self.combat_action_table_name,
+                     self.combat_targeting_table_name,
+                     len(action_errors) + len(targeting_errors))
+
+    @PERFORMANCE.timed('compile_tables')
+    def compile_tables(self):
+        """This method sets the compiled action and targeting tables for rolling once
+        they have passed validation. They come from COMPILED_TABLES, so characters
+        using the same worksheets share them. A table that is missing or invalid is
+        not compiled and its compiled attribute stays None."""
+        if isinstance(self.combat_action_table, pd.DataFrame):
+            self.compiled_action_table = COMPILED_TABLES.get(
+                self.combat_workbook_filepath, self.combat_action_table_name,
+                self.combat_action_table)
+        else:
+            self.compiled_action_table = None
+        if isinstance(self.combat_targeting_table, pd.DataFrame):
+            self.compiled_targeting_table = COMPILED_TABLES.get(
+                self.combat_workbook_filepath, self.combat_targeting_table_name,
+                self.combat_targeting_table)
+        else:
+            self.compiled_targeting_table = None
 
     @staticmethod
     def check_series(series: pd.DataFrame):
         """This static method checks a series to make sure that the actual integer
         values in the series are sequential and have no gaps. It returns True if everything
         checks out, False otherwise."""
-        print(f"Character.check_series: Starting validation of series {series}.")
+        logger.debug("Character.check_series: Starting validation of series %s.", series)
         filtered_series = series[lambda s: s != '-']
-        print(f"Character.check_series: filtered_series: {filtered_series}")
+        logger.debug("Character.check_series: filtered_series: %s", filtered_series)
         previous_value = 0
         errors = 0
         for item in filtered_series:
@@ -214,33 +264,36 @@ class Character:
                 high = int(l[1])
             else:
                 high = None
-            print(f"Character.check_series: previous value: {previous_value} low: {low}, "
-                  f"high: {high}, l: {l}, errors: {errors}")
+            logger.debug("Character.check_series: previous value: %s low: %s, high: %s, l: "
+                         "%s, errors: %s", previous_value, low, high, l, errors)
 
             if low == 0 and high is None:
                 low = 100
-                print(f"Character.check_series: l: {l[0]} is zero and high is None. "
-                      f"Setting low to {low}.")
+                logger.debug("Character.check_series: l: %s is zero and high is None. "
+                             "Setting low to %s.", l[0], low)
 
             if previous_value != (low - 1):
-                print(f"Character.check_series: previous value is not equal to low - 1.")
+                logger.debug("Character.check_series: previous value is not equal to low - "
+                             "1.")
                 errors += 1
 
             if high is not None:
                 if high == 0:
                     high = 100
-                    print(f"Character.check_series: low is {low}. h is {l[1]} which is zero. "
-                          f"Setting high to {high}.")
-                print(f"Character.check_series: checking value pair.")
+                    logger.debug("Character.check_series: low is %s. h is %s which is "
+                                 "zero. Setting high to %s.", low, l[1], high)
+                logger.debug("Character.check_series: checking value pair.")
                 if low >= high:
-                    print(f"Character.check_series: low:, {low}, is greater than or equal "
-                          f"to high, {high}, Series failed sequential test.")
+                    logger.warning("Character.check_series: low:, %s, is greater than or "
+                                   "equal to high, %s, Series failed sequential test.", low,
+                                   high)
                     errors += 1
                 previous_value = high
             else:
                 previous_value = low
 
-        print(f"Character.check_series: Series check completed with {errors} errors.")
+        logger.debug("Character.check_series: Series check completed with %s errors.",
+                     errors)
         return errors == 0
 
     @staticmethod
@@ -248,18 +301,18 @@ class Character:
         """This static method checks a string to see if the format is correct for
         combat action or targeting tables. It returns True if so, False if not."""
         # print(f"check_item: item: {item}")
-        print(f"Character.check_item: Starting validation of item, {item}.")
+        logger.debug("Character.check_item: Starting validation of item, %s.", item)
         if item == "-":
             return True
         l = item.split('-')
-        print(f"Character.check_item: l: {l}.")
+        logger.debug("Character.check_item: l: %s.", l)
         if len(l) > 2:
             return False
         elif len(l) == 2:
             try:
                 low = int(l[0])
                 high = int(l[1])
-                print(f"Character.check_item: low: {low}. high: {high}.")
+                logger.debug("Character.check_item: low: %s. high: %s.", low, high)
             except ValueError:
                 return False
             if low > high:
@@ -269,31 +322,45 @@ class Character:
         else:
             try:
                 low = int(l[0])
-                print(f"Character.check_item: low: {low}.")
+                logger.debug("Character.check_item: low: %s.", low)
             except ValueError:
                 return False
         return True
 
+    @PERFORMANCE.timed('load_table')
     def load_table(self, table_name):
         """This method extracts the required table from self.combat_workbook_filepath and returns
-        it. Note: Excel limits worksheet names to 31 characters.
+        it. Note: Excel limits worksheet names to 31 characters. Missing tables are found
+        in the workbook's SheetIndex without asking the workbook for them, and a table
+        whose name is cut to the same worksheet name as another is "invalid". Tables come
+        from the process-wide WORKBOOK_CACHE, so the workbook is only parsed again when it
+        changes on disk. The returned table is shared and must not be modified in place.
         :param table_name: str, required
-        :param combat_tables: filepath, optional, defaults to COMBAT_TABLES
         :return pd.DataFrame or str
         """
         combat_tables = self.combat_workbook_filepath
-        print(f"Character.load_table: Beginning extraction of table {table_name} "
-              f"from {combat_tables}.")
-        xls = pd.ExcelFile(combat_tables)
-        worksheet_name = table_name[:31]
-        print(f"Character.load_table: table_name: {table_name}. "
-              f"worksheet_name: {worksheet_name}.")
+        logger.debug("Character.load_table: Beginning extraction of table %s from %s.",
+                     table_name, combat_tables)
+        index = sheet_index(combat_tables)
+        # The character's action and targeting tables can be cut to the same name.
+        index.add_table_names((self.combat_action_table_name,
+                               self.combat_targeting_table_name))
+        if table_name in index and index.collides(table_name):
+            logger.warning("Character.load_table: Table %s shares its worksheet name with "
+                           "another table.", table_name)
+            return "invalid"
+        worksheet_name = index.worksheet_name(table_name)
+        logger.debug("Character.load_table: table_name: %s. worksheet_name: %s.",
+                     table_name, worksheet_name)
+        if worksheet_name is None:
+            logger.info("Character.load_table: Table %s could not be found.", table_name[:31])
+            return "missing"
         try:
-            table = pd.read_excel(xls, worksheet_name)
+            table = WORKBOOK_CACHE.get_sheet(combat_tables, worksheet_name)
         except ValueError:
-            print(f"Character.load_table: Table {worksheet_name} could not be found.")
+            logger.info("Character.load_table: Table %s could not be found.", worksheet_name)
             return "missing"
-        print(f"Character.load_table: Table {table} found.")
+        logger.debug("Character.load_table: Table %s found.", table)
         return table
 
     def __str__(self):
@@ -307,73 +374,97 @@ class Character:
                  f"Targeting Table: {self.combat_targeting_table}\n"
         return output
 
+    @PERFORMANCE.timed('roll_for_combat_action')
     def roll_for_combat_action(self):
-        """This method finds the minimum and maximum values in the combat action table,
-        generates a random number between the two values using a uniform distribution,
-        and returns the text in the 'Outcome' column of the dataframe corresponding to
-        that number. This result is assigned to Character.action."""
-        # Grab the two columns we need from the table.
-        print(f"Character.roll_for_combat_action: Determining combat action.")
-        difficulty = self.difficulty
-        for item in self.combat_targeting_table.columns:
-            if item.strip() == self.difficulty:
-                difficulty = item
-                print(f"Character.roll_for_combat_action: difficulty "
-                      f"changed from {self.difficulty} to {difficulty}")
+        """This method rolls on the compiled combat action table between its minimum and
+        maximum values using a uniform distribution and finds the text in the 'Outcome'
+        column corresponding to that number. This result is assigned to Character.action,
+        its OUTCOMES ID to Character.action_id and the status it names, precomputed when
+        the table was compiled, to Character.combat_status."""
+        logger.debug("Character.roll_for_combat_action: Determining combat action.")
+        self.resolve_tables()
+        if self.compiled_action_table is None:
+            logger.warning("Character: roll_for_combat_action: %s is %s. Cannot complete "
+                           "task.", self.combat_action_table_name, self.combat_action_table)
+            return
         try:
-            table = self.combat_action_table[[difficulty, 'Outcome']]
+            self.action_id = self.compiled_action_table.roll_id(self.difficulty, self.rng)
         except KeyError:
-            print(f"Character: roll_for_combat_action: KeyError discovered in table "
-                  f"using {difficulty}. Could not complete task.")
-            return
-        except TypeError:
-            print(f"Character: roll_for_combat_acton: TypeError discovered for "
-                  f"{self.combat_targeting_table_name}. Cannot complete task.")
+            logger.warning("Character: roll_for_combat_action: KeyError discovered in table "
+                           "using %s. Could not complete task.", self.difficulty)
             return
+        outcome = OUTCOMES[self.action_id]
+        self.action = outcome.text
+        self.combat_status = COMBAT_STATUSES[outcome.status]
+        logger.debug("Character.roll_for_combat_action: %s", self)
+        logger.debug("Character.roll_for_combat_action: Combat action determined "
+                     "successfully.")
 
-        print(f"Character.roll_for_combat_action: action table: {table}")
-        filtered_table = table[table[difficulty] != '-']
-        print(f"Character.roll_for_combat_action: filtered action table: {filtered_table}")
-        self.action = self.determine_result_from_table(filtered_table, difficulty)
-
-        # Generally, 'Normal' is not included in action outcomes. So, just in case,
-        # the status_flag tracks changes that were included in the action outcome.
-        # If none are found, it will default to 'Normal'.
-        status_flag = False
-        for status in COMBAT_STATUSES:
-            if status.lower() in self.action.lower():
-                self.combat_status = status
-                status_flag = True
-        if not status_flag:
-            self.combat_status = 'Normal'
-        print(f"Character.roll_for_combat_action: {self}")
-        print(f"Character.roll_for_combat_action: Combat action determined successfully.")
-
+    @PERFORMANCE.timed('roll_for_combat_targeting')
     def roll_for_combat_targeting(self):
-        """This method finds the minimum and maximum values in the combat targeting table,
-        generates a random number between the two values using a uniform distribution,
-        and returns the text in the 'Outcome' column of the dataframe corresponding to
-        that number. This result is assigned to Character.target."""
-        # Grab the two columns we need from the table.
-        print(f"Character.roll_for_combat_targeting: Determining target.")
-        difficulty = self.difficulty
-        for item in self.combat_targeting_table.columns:
-            if item.strip() == self.difficulty:
-                difficulty = item
-                print(f"Character.roll_for_combat_targeting: difficulty "
-                      f"changed from {self.difficulty} to {difficulty}")
+        """This method rolls on the compiled combat targeting table between its minimum and
+        maximum values using a uniform distribution and finds the text in the 'Outcome'
+        column corresponding to that number. This result is assigned to Character.target
+        and its OUTCOMES ID to Character.target_id."""
+        logger.debug("Character.roll_for_combat_targeting: Determining target.")
+        self.resolve_tables()
+        if self.compiled_targeting_table is None:
+            logger.warning("Character.roll_for_combat_targeting: %s is %s. Cannot complete "
+                           "task.", self.combat_targeting_table_name,
+                           self.combat_targeting_table)
+            return
         try:
-            table = self.combat_targeting_table[[difficulty,'Outcome']]
+            self.target_id = self.compiled_targeting_table.roll_id(self.difficulty, self.rng)
         except KeyError:
-            print(f"Character.roll_for_combat_targeting: KeyError discovered in "
-                  f"table using {difficulty}. Could not complete task.")
+            logger.warning("Character.roll_for_combat_targeting: KeyError discovered in "
+                           "table using %s. Could not complete task.", self.difficulty)
             return
-        print(f"Character.roll_for_combat_targeting: target_table: {table}")
-        filtered_table = table[table[difficulty] != '-']
-        print(f"Character.roll_for_combat_targeting: filtered target table: {filtered_table}")
-        self.target = self.determine_result_from_table(filtered_table, difficulty)
-        print(f"Character.roll_for_combat_targeting: {self}")
-        print(f"Character.roll_for_combat_targeting: Target determination completed.")
+        self.target = OUTCOMES.text(self.target_id)
+        logger.debug("Character.roll_for_combat_targeting: %s", self)
+        logger.debug("Character.roll_for_combat_targeting: Target determination completed.")
+
+    @PERFORMANCE.timed('roll_many')
+    def roll_many(self, n, kind="action", counts=False, rng=None):
+        """This method draws n results from the compiled action or targeting table in a
+        single NumPy call without changing self.action, self.target or
+        self.combat_status. By default it returns an array of outcome codes, each an
+        index into the outcomes of the compiled column for self.difficulty. With
+        counts=True it returns a histogram instead: a dict holding the count of each
+        outcome under 'outcomes' and, for action rolls, the count of each derived combat
+        status under 'combat_status'. It raises KeyError if the difficulty has no rows
+        and ValueError if the table is missing or invalid.
+        :param n: int, required
+        :param kind: str, optional, "action" or "targeting", defaults to "action"
+        :param counts: bool, optional, defaults to False
+        :param rng: np.random.Generator, optional, defaults to self.rng
+        :return: np.ndarray of int or dict
+        """
+        self.resolve_tables()
+        if kind == "action":
+            table = self.compiled_action_table
+            table_name = self.combat_action_table_name
+        elif kind == "targeting":
+            table = self.compiled_targeting_table
+            table_name = self.combat_targeting_table_name
+        else:
+            raise ValueError(f"kind must be 'action' or 'targeting', not {kind}")
+        if table is None:
+            raise ValueError(f"Table {table_name} is missing or invalid.")
+        column = table.columns[self.difficulty.strip()]
+        codes = column.sample(n, rng if rng is not None else self.rng)
+        if not counts:
+            return codes
+
+        row_counts = np.bincount(codes, minlength=len(column.outcomes))
+        outcome_counts = {}
+        for outcome, count in zip(column.outcomes, row_counts.tolist()):
+            outcome_counts[outcome] = outcome_counts.get(outcome, 0) + count
+        result = {'outcomes': outcome_counts}
+        if kind == "action":
+            status_counts = np.bincount(column.status_codes[codes],
+                                        minlength=len(COMBAT_STATUSES))
+            result['combat_status'] = dict(zip(COMBAT_STATUSES, status_counts.tolist()))
+        return result
 
     def determine_result_from_table(self, filtered_table, difficulty):
         """
@@ -382,53 +473,56 @@ class Character:
         self.combat_action_table, determines the largest and smallest number for
         the roll possibilities in the table, generates a uniform distribution roll
         for that range of values, finds the text Outcome corresponding to roll, and
-        returns that string.
+        returns that string. The roll methods use the compiled tables built by
+        compile_tables() instead, which give the same results without scanning the
+        DataFrame.
         :param filtered_table: pd.DataFrame
         :param difficulty: str
         :return: str
         """
-        print(f"Character.determine_result_from_table: starting process.")
-        print(f"Character.determine_result_from_table: filtered table: {filtered_table}")
+        logger.debug("Character.determine_result_from_table: starting process.")
+        logger.debug("Character.determine_result_from_table: filtered table: %s",
+                     filtered_table)
         min_entry = filtered_table.iloc[0, 0]
         min_val = int(min_entry.split('-')[0])
         max_entry = filtered_table.iloc[-1, 0]
         max_val = self.return_int_from_table_item(max_entry)
         roll = random.randint(min_val, max_val)
-        print(f"Character.determine_result_from_table: min: {min_val}. max: {max_val}. roll: {roll}")
+        logger.debug("Character.determine_result_from_table: min: %s. max: %s. roll: %s",
+                     min_val, max_val, roll)
 
         series = filtered_table[difficulty]
         idx = 0
         for item in series:
             list_values = item.split('-')
-            print(f"Character.determine_result_from_table: idx: {idx}. item: {item}. "
-                  f"list_values: {list_values}")
+            logger.debug("Character.determine_result_from_table: idx: %s. item: %s. "
+                         "list_values: %s", idx, item, list_values)
             comp_val = self.return_int_from_table_item(item)
             result = filtered_table['Outcome'].iloc[idx]
-            print(f"Character.determine_result_from_table: comp_val: "
-                  f"{comp_val}. roll: {roll} result: {result}")
+            logger.debug("Character.determine_result_from_table: comp_val: %s. roll: %s "
+                         "result: %s", comp_val, roll, result)
             if roll > comp_val:
                 idx += 1
                 continue
             else:
                 break
-        print(f"Character.determine_result_from_table: Result, {result} determined.")
+        logger.debug("Character.determine_result_from_table: Result, %s determined.",
+                     result)
         return result
 
     @staticmethod
     def convert_table_string(s: str):
-        """This static method takes a string of integers and converts it into a integer.
-        If the integers are all zeros, it converts it into the correct power of ten."""
-        print(f"Character.convert_table_string: Beginning string conversion.")
-        len_s = len(s)
-        if int(s) == 0:
-            result = 10**len_s
-        else:
-            result = int(s)
-        print(f"Character.convert_table_string: String converted to {result}.")
+        """This static method takes a string of integers and converts it into a integer
+        with table_value(). If the integers are all zeros, it is 100, as validation
+        counts it."""
+        logger.debug("Character.convert_table_string: Beginning string conversion.")
+        result = table_value(s)
+        logger.debug("Character.convert_table_string: String converted to %s.", result)
         return result
 
     def return_int_from_table_item(self, s: str, larger=True):
-        print(f"Character.return_int_from_table_item: Pulling integer from item {s}.")
+        logger.debug("Character.return_int_from_table_item: Pulling integer from item %s.",
+                     s)
         list_s = s.split('-')
         len_list_s = len(list_s)
         if len_list_s == 1:
@@ -438,7 +532,7 @@ class Character:
                 result = self.convert_table_string(list_s[1])
             else:
                 result = self.convert_table_string(list_s[0])
-        print(f"Character.return_int_from_table_item: Result is {result}.")
+        logger.debug("Character.return_int_from_table_item: Result is %s.", result)
         return result
 
 
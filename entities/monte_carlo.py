@@ -0,0 +1,435 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .diagnostics import PERFORMANCE
+from .outcomes import COMBAT_STATUSES, OUTCOMES
+from .rng import RandomStreams
+
+logger = logging.getLogger(__name__)
+
+ROLL_KINDS = ('action', 'targeting')
+# First and last index into COMBAT_STATUSES of the surge and of the lull
+# statuses.
+SURGE_STATUSES = (1, 2)
+LULL_STATUSES = (3, 4)
+# Roughly how many rolls of each kind one task makes. Encounters are split
+# into tasks by this alone, never by the number of workers, and each task has
+# its own random stream, so a seed gives the same results on any machine.
+TASK_ROLLS = 2**20
+NO_COLUMN = -1
+# Columns spanning at most this many values are rolled through a lookup table
+# with an entry per value instead of a search.
+MAX_LOOKUP_SPAN = 4096
+
+
+class SharedTables:
+    """
+    This object holds the compiled columns a roster rolls on, packed into flat
+    NumPy arrays, along with the column each combatant rolls its action and
+    target on. Worker processes attach to a copy of the arrays in one
+    multiprocessing.shared_memory block rather than receiving pickled tables.
+
+    Rows of every column are stored one after another, followed by one extra
+    row for combatants that cannot roll. offsets[c] is the first row of column
+    c, and codes and statuses hold the outcome, as an index into the outcome
+    list, and combat status of each row, or NO_COLUMN for the extra row.
+
+    For columns spanning at most MAX_LOOKUP_SPAN values, lookup_rows holds the
+    row matching every value that can be rolled, starting at lookup_offsets[c],
+    so a roll is one index rather than a search. Wider columns are searched
+    like CompiledColumn.codes_for_rolls().
+    :param arrays: dict of np.ndarray, required, see pack_store()
+    """
+    # Arrays in the order they are laid out in shared memory.
+    FIELDS = ('search', 'offsets', 'min_vals', 'spans', 'codes', 'statuses',
+              'lookup_offsets', 'lookup_rows', 'action_columns', 'target_columns')
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.combatants = len(arrays['action_columns'])
+        self.outcome_count = int(arrays['codes'].max(initial=NO_COLUMN)) + 1
+        # Where each combatant's rolls start in lookup_rows and how many values
+        # it rolls, and the combatants on each wider column, worked out once
+        # per process. Combatants that cannot roll stay on the last entry of
+        # lookup_rows, which is the extra row.
+        self.lookups = {}
+        self.searched = {}
+        no_roll = len(arrays['lookup_rows']) - 1
+        for kind, columns in zip(ROLL_KINDS, (arrays['action_columns'],
+                                              arrays['target_columns'])):
+            starts = np.full(self.combatants, no_roll, dtype=np.int64)
+            spans = np.zeros(self.combatants, dtype=np.int64)
+            self.searched[kind] = []
+            for column in np.unique(columns).tolist():
+                if column == NO_COLUMN:
+                    continue
+                members = np.flatnonzero(columns == column)
+                start, stop = arrays['lookup_offsets'][column:column + 2]
+                if stop > start:
+                    starts[members] = start
+                    spans[members] = arrays['spans'][column]
+                else:
+                    self.searched[kind].append((column, members))
+            self.lookups[kind] = (starts, spans)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['arrays'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def layout(self):
+        """This method returns the offset, dtype and shape of each array in a
+        shared memory block, and the size of the block."""
+        layout = {}
+        size = 0
+        for name in self.FIELDS:
+            array = self.arrays[name]
+            layout[name] = (size, array.dtype.str, array.shape)
+            # Keep every array 8 byte aligned.
+            size += -(-array.nbytes // 8) * 8
+        return layout, max(size, 1)
+
+    def to_shared_memory(self):
+        """This method copies the arrays into a new shared memory block and returns
+        it with its layout. The caller must close and unlink the block."""
+        layout, size = self.layout()
+        block = shared_memory.SharedMemory(create=True, size=size)
+        for name, (offset, dtype, shape) in layout.items():
+            view = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+            view[...] = self.arrays[name]
+        return block, layout
+
+    @classmethod
+    def from_shared_memory(cls, block, layout):
+        """This class method returns SharedTables whose arrays are read only views
+        of a shared memory block."""
+        arrays = {}
+        for name, (offset, dtype, shape) in layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+            array.flags.writeable = False
+            arrays[name] = array
+        return cls(arrays)
+
+
+def pack_store(store, rows=None):
+    """
+    This function packs the compiled columns that the given rows of a store roll
+    on into SharedTables, resolving their tables if needed. Rows without a
+    usable table for a kind of roll are given NO_COLUMN and never roll it, as
+    with CombatantStore.roll().
+    :param store: CombatantStore, required
+    :param rows: array of int, optional, defaults to the active rows
+    :return: tuple of SharedTables and the list of OUTCOMES IDs of its outcome codes
+    """
+    if rows is None:
+        rows = store.active_rows()
+    columns = {}
+    outcome_codes = {}
+    row_columns = {kind: np.full(len(rows), NO_COLUMN, dtype=np.int32) for kind in ROLL_KINDS}
+    for i, row in enumerate(np.asarray(rows).tolist()):
+        for kind in ROLL_KINDS:
+            column = store.compiled_column(row, kind)
+            if column is None:
+                continue
+            if id(column) not in columns:
+                columns[id(column)] = (len(columns), column)
+                for outcome_id in column.outcome_ids.tolist():
+                    outcome_codes.setdefault(outcome_id, len(outcome_codes))
+            row_columns[kind][i] = columns[id(column)][0]
+
+    compiled = [column for _, column in columns.values()]
+    offsets = np.concatenate(([0], np.cumsum([len(column.outcomes) for column in compiled],
+                                             dtype=np.int64))).astype(np.int64)
+    lookups = []
+    for offset, column in zip(offsets.tolist(), compiled):
+        span = column.max_val - column.min_val + 1
+        if span <= MAX_LOOKUP_SPAN:
+            rolls = np.arange(column.min_val, column.max_val + 1)
+            lookups.append(offset + column.codes_for_rolls(rolls))
+        else:
+            lookups.append(np.zeros(0, dtype=np.int64))
+    # The extra row, for combatants that cannot roll.
+    lookups.append(offsets[-1:])
+    arrays = {
+        'search': np.concatenate([np.maximum.accumulate(np.array(column.thresholds,
+                                                                 dtype=np.int64))
+                                  for column in compiled] or [np.zeros(0, np.int64)]),
+        'offsets': offsets,
+        'min_vals': np.array([column.min_val for column in compiled], dtype=np.int64),
+        'spans': np.array([column.max_val - column.min_val + 1 for column in compiled],
+                          dtype=np.int64),
+        'codes': np.array([outcome_codes[outcome_id] for column in compiled
+                           for outcome_id in column.outcome_ids.tolist()] + [NO_COLUMN],
+                          dtype=np.int32),
+        'statuses': np.concatenate([column.status_codes for column in compiled]
+                                   + [np.array([NO_COLUMN])]).astype(np.int8),
+        'lookup_offsets': np.concatenate(([0], np.cumsum([len(lookup) for lookup in lookups],
+                                                         dtype=np.int64))).astype(np.int64),
+        'lookup_rows': np.concatenate(lookups).astype(np.int64),
+        'action_columns': row_columns['action'],
+        'target_columns': row_columns['targeting'],
+    }
+    return SharedTables(arrays), list(outcome_codes)
+
+
+def roll_encounters(tables, rng, encounters, rounds):
+    """
+    This function rolls an action and a target for every combatant in every
+    round of a number of encounters and returns the counts: per combatant
+    action, target and combat status counts, and how many encounters had each
+    number of surges and of lulls.
+    :param tables: SharedTables, required
+    :param rng: np.random.Generator, required
+    :param encounters: int, required
+    :param rounds: int, required, events per encounter
+    :return: dict of np.ndarray
+    """
+    events = encounters * rounds
+    n = tables.combatants
+    k = tables.outcome_count
+    counts = {}
+    statuses = None
+    for kind in ROLL_KINDS:
+        # Every combatant draws a value, whether it can roll or not, so the
+        # values a combatant gets do not depend on the others' tables.
+        uniforms = rng.random((events, n))
+        starts, spans = tables.lookups[kind]
+        rows = tables.lookup_rows[starts + (uniforms * spans).astype(np.int64)]
+        for column, members in tables.searched[kind]:
+            start, stop = tables.offsets[column], tables.offsets[column + 1]
+            rolls = (tables.min_vals[column]
+                     + (uniforms[:, members] * tables.spans[column]).astype(np.int64))
+            found = np.searchsorted(tables.search[start:stop], rolls, side='left')
+            rows[:, members] = start + np.minimum(found, stop - start - 1)
+        codes = tables.codes[rows]
+        if kind == 'action':
+            statuses = tables.statuses[rows]
+        rolled = codes != NO_COLUMN
+        cells = (codes + np.arange(n, dtype=np.int64) * k)[rolled]
+        counts[kind] = np.bincount(cells, minlength=n * k).reshape(n, k)
+
+    rolled = statuses != NO_COLUMN
+    cells = (statuses + np.arange(n, dtype=np.int64) * len(COMBAT_STATUSES))[rolled]
+    counts['status'] = np.bincount(cells, minlength=n * len(COMBAT_STATUSES)).reshape(
+        n, len(COMBAT_STATUSES))
+    for name, (low, high) in (('surges', SURGE_STATUSES), ('lulls', LULL_STATUSES)):
+        effects = (statuses >= low) & (statuses <= high)
+        counts[name] = np.bincount(effects.reshape(encounters, rounds * n).sum(axis=1))
+    return counts
+
+
+# The tables and master seed used by each worker process, see
+# attach_shared_tables().
+_worker_tables = None
+_worker_block = None
+_worker_streams = None
+
+
+def attach_shared_tables(name, layout, seed):
+    """This function runs once in each worker process and attaches to the shared
+    memory block holding the packed tables."""
+    global _worker_tables, _worker_block, _worker_streams
+    _worker_block = shared_memory.SharedMemory(name=name)
+    _worker_tables = SharedTables.from_shared_memory(_worker_block, layout)
+    _worker_streams = RandomStreams(seed)
+
+
+def run_task(task, encounters, rounds):
+    """This function rolls one task's encounters from the task's own stream in
+    a process set up by attach_shared_tables()."""
+    return roll_encounters(_worker_tables, _worker_streams.task_generator(task),
+                           encounters, rounds)
+
+
+def merge_counts(total, counts):
+    """This function adds one task's counts to the running total in place. The
+    histograms of surges and lulls per encounter are padded to the longer one."""
+    for name, array in counts.items():
+        if name not in total:
+            total[name] = array.copy()
+        elif total[name].shape == array.shape:
+            total[name] += array
+        else:
+            length = max(len(total[name]), len(array))
+            merged = np.zeros(length, dtype=np.int64)
+            merged[:len(total[name])] += total[name]
+            merged[:len(array)] += array
+            total[name] = merged
+    return total
+
+
+def plan_tasks(encounters, rounds, combatants):
+    """This function splits encounters into tasks of about TASK_ROLLS rolls each
+    and returns the number of encounters in each task."""
+    per_task = max(1, TASK_ROLLS // max(1, rounds * combatants))
+    return [min(per_task, encounters - start) for start in range(0, encounters, per_task)]
+
+
+@PERFORMANCE.timed('monte_carlo')
+def simulate_encounters(store, encounters, rounds=1, max_workers=None, progress=None):
+    """
+    This function runs a number of encounters of several rounds each for the
+    active combatants of a store and returns every roll counted up in a
+    MonteCarloResult. Nothing is stored in the store itself.
+
+    Encounters are split into tasks of a fixed size, each with its own stream
+    from the store's RandomStreams, and the tasks are shared out between worker
+    processes that read the compiled tables from shared memory. The same seed
+    gives the same counts however many workers are used.
+    :param store: CombatantStore, required
+    :param encounters: int, required
+    :param rounds: int, optional, defaults to 1, events per encounter
+    :param max_workers: int, optional, defaults to the number of CPU cores
+    :param progress: callable, optional, called as progress(done, total) with the
+        number of encounters finished so far
+    :return: MonteCarloResult
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    rows = store.active_rows()
+    tables, outcome_ids = pack_store(store, rows)
+    tasks = plan_tasks(encounters, rounds, len(rows))
+    logger.debug("simulate_encounters: %s encounters of %s rounds for %s combatants in %s "
+                 "tasks with up to %s workers.", encounters, rounds, len(rows), len(tasks),
+                 max_workers)
+    total = {}
+    done = 0
+    if max_workers <= 1 or len(tasks) <= 1:
+        for task, task_encounters in enumerate(tasks):
+            counts = roll_encounters(tables, store.streams.task_generator(task),
+                                     task_encounters, rounds)
+            merge_counts(total, counts)
+            done += task_encounters
+            if progress is not None:
+                progress(done, encounters)
+    else:
+        block, layout = tables.to_shared_memory()
+        try:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)),
+                                     initializer=attach_shared_tables,
+                                     initargs=(block.name, layout, store.streams.seed)
+                                     ) as executor:
+                futures = {executor.submit(run_task, task, task_encounters, rounds):
+                           task_encounters for task, task_encounters in enumerate(tasks)}
+                for future in as_completed(futures):
+                    # Counts are integers, so the order they are added in does
+                    # not change the total.
+                    merge_counts(total, future.result())
+                    done += futures[future]
+                    if progress is not None:
+                        progress(done, encounters)
+        finally:
+            block.close()
+            block.unlink()
+    return MonteCarloResult(
+        names=[store.names[row] for row in rows.tolist()],
+        levels=[store.levels[code] for code in store.level_codes(rows).tolist()],
+        outcomes=[OUTCOMES.text(outcome_id) for outcome_id in outcome_ids],
+        encounters=encounters, rounds=rounds, counts=total)
+
+
+class MonteCarloResult:
+    """
+    This object holds the counts from simulate_encounters(): how often each
+    combatant rolled each action, target and combat status, and how many
+    encounters had each number of surges and of lulls. The methods turn them
+    into pd.DataFrame tables.
+    :param names: list of str, required, one per combatant
+    :param levels: list of str, required, the individual level of each combatant
+    :param outcomes: list of str, required, the outcome of each count column
+    :param encounters: int, required
+    :param rounds: int, required
+    :param counts: dict of np.ndarray, required, see roll_encounters()
+    """
+    def __init__(self, names, levels, outcomes, encounters, rounds, counts):
+        self.names = names
+        self.levels = levels
+        self.outcomes = outcomes
+        self.encounters = encounters
+        self.rounds = rounds
+        n, k = len(names), len(outcomes)
+        self.action_counts = counts.get('action', np.zeros((n, k), dtype=np.int64))
+        self.target_counts = counts.get('targeting', np.zeros((n, k), dtype=np.int64))
+        self.status_counts = counts.get('status',
+                                        np.zeros((n, len(COMBAT_STATUSES)), dtype=np.int64))
+        self.surges_per_encounter = counts.get('surges', np.zeros(1, dtype=np.int64))
+        self.lulls_per_encounter = counts.get('lulls', np.zeros(1, dtype=np.int64))
+
+    def _outcome_table(self, counts):
+        table = pd.DataFrame(counts, index=self.names, columns=self.outcomes)
+        # Action and target outcomes share one list, so drop the other kind's.
+        return table.loc[:, table.sum(axis=0) > 0]
+
+    def action_table(self):
+        """This method returns the number of times each combatant rolled each
+        action, one row per combatant."""
+        return self._outcome_table(self.action_counts)
+
+    def target_table(self):
+        """This method returns the number of times each combatant rolled each
+        target, one row per combatant."""
+        return self._outcome_table(self.target_counts)
+
+    def status_table(self):
+        """This method returns the number of times each combatant rolled each
+        combat status, one row per combatant."""
+        return pd.DataFrame(self.status_counts, index=self.names, columns=COMBAT_STATUSES)
+
+    def effect_table(self):
+        """This method returns the number of surges and lulls rolled, one row per
+        surge or lull status and one column per individual level."""
+        table = self.status_table().iloc[:, 1:]
+        table.index = [str(level) if level is not None else 'None' for level in self.levels]
+        return table.groupby(level=0, sort=False).sum().T
+
+    def encounter_histogram(self):
+        """This method returns how many encounters had each number of surges and
+        of lulls, indexed by that number."""
+        length = max(len(self.surges_per_encounter), len(self.lulls_per_encounter))
+        return pd.DataFrame({'Surges': np.pad(self.surges_per_encounter,
+                                              (0, length - len(self.surges_per_encounter))),
+                             'Lulls': np.pad(self.lulls_per_encounter,
+                                             (0, length - len(self.lulls_per_encounter)))})
+
+    def mean_per_encounter(self):
+        """This method returns the mean number of surges and of lulls per
+        encounter."""
+        histogram = self.encounter_histogram()
+        if self.encounters == 0:
+            return {column: 0.0 for column in histogram.columns}
+        return {column: float((histogram.index * histogram[column]).sum() / self.encounters)
+                for column in histogram.columns}
+
+    def long_table(self):
+        """This method returns every per combatant count as one long table with
+        columns kind, row, name, outcome and count, leaving out zero counts."""
+        parts = []
+        for kind, table in (('action', self.action_table()), ('target', self.target_table()),
+                            ('combat_status', self.status_table())):
+            table = table.reset_index(drop=True)
+            table.index.name = 'row'
+            part = table.stack().rename('count').reset_index()
+            part.columns = ['row', 'outcome', 'count']
+            part.insert(0, 'kind', kind)
+            part.insert(2, 'name', [self.names[row] for row in part['row']])
+            parts.append(part[part['count'] > 0])
+        return pd.concat(parts, ignore_index=True)
+
+    def format_summary(self):
+        """This method returns the surge and lull counts as text."""
+        means = self.mean_per_encounter()
+        lines = [f"{self.encounters} encounters of {self.rounds} rounds with "
+                 f"{len(self.names)} combatants.",
+                 f"Mean surges per encounter: {means['Surges']:.3f}. "
+                 f"Mean lulls per encounter: {means['Lulls']:.3f}.",
+                 "", "Surges and lulls by individual level:",
+                 self.effect_table().to_string(), "",
+                 "Encounters by number of surges and lulls:",
+                 self.encounter_histogram().to_string()]
+        return '\n'.join(lines)
@@ -0,0 +1,102 @@
+import threading
+from collections import namedtuple
+
+COMBAT_STATUSES = ['Normal', 'Minor Surge', 'Major Surge', 'Minor Lull', 'Major Lull']
+EVENT_TYPES = ['Surge', 'Lull']
+
+# What an outcome means, worked out once when it is interned. status is an
+# index into COMBAT_STATUSES. base_action, event_type ('Surge' or 'Lull') and
+# effect_level ('Minor' or 'Major') split a surge or lull outcome such as
+# 'Attack Main/Minor Surge'; for other outcomes base_action is the whole text
+# and the other two are None.
+OutcomeInfo = namedtuple('OutcomeInfo', ['id', 'text', 'base_action', 'status',
+                                         'event_type', 'effect_level'])
+
+
+def split_action(action):
+    """
+    This function splits an action outcome such as 'Attack Main/Minor Surge'
+    into its base outcome, effect level and event type, e.g.
+    ('Attack Main', 'Minor', 'Surge'). It returns None if the action has no
+    surge or lull. Only the last '/' separates the effect, so base outcomes may
+    contain a '/' themselves.
+    :param action: str, required
+    :return: tuple of str or None
+    """
+    if not isinstance(action, str) or '/' not in action:
+        return None
+    base, effect = action.rsplit('/', 1)
+    parts = effect.split()
+    if len(parts) != 2 or parts[1] not in EVENT_TYPES:
+        return None
+    return base.strip(), parts[0], parts[1]
+
+
+def outcome_status(outcome):
+    """This function returns the combat status named in an action outcome. Generally,
+    'Normal' is not included in action outcomes, so it is the default if no other
+    status is found."""
+    result = 'Normal'
+    for status in COMBAT_STATUSES:
+        if status.lower() in outcome.lower():
+            result = status
+    return result
+
+
+class OutcomeCatalog:
+    """
+    This object interns every outcome text found in the combat tables as an
+    integer ID with an OutcomeInfo record, so the status, base action and surge
+    or lull of a rolled outcome are a list index away instead of being parsed
+    from its text on every roll. Tables are compiled with the IDs of their
+    outcomes (see CompiledColumn), so only loading a table does any string work.
+
+    IDs are assigned in the order outcomes are first seen and never change for
+    the life of the process. They are not stable between processes, so save
+    or send the text instead.
+    """
+    def __init__(self):
+        self._records = []
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def intern(self, text):
+        """This method returns the ID of an outcome, parsing and recording it the
+        first time it is seen."""
+        outcome_id = self._ids.get(text)
+        if outcome_id is not None:
+            return outcome_id
+        with self._lock:
+            outcome_id = self._ids.get(text)
+            if outcome_id is None:
+                outcome_id = len(self._records)
+                self._records.append(self._parse(outcome_id, text))
+                self._ids[text] = outcome_id
+            return outcome_id
+
+    def __getitem__(self, outcome_id):
+        return self._records[outcome_id]
+
+    def __len__(self):
+        return len(self._records)
+
+    def text(self, outcome_id):
+        return self._records[outcome_id].text
+
+    def status(self, outcome_id):
+        """This method returns the combat status of an outcome as its name in
+        COMBAT_STATUSES."""
+        return COMBAT_STATUSES[self._records[outcome_id].status]
+
+    @staticmethod
+    def _parse(outcome_id, text):
+        status = COMBAT_STATUSES.index(outcome_status(text))
+        parts = split_action(text)
+        if parts is None:
+            return OutcomeInfo(outcome_id, text, text, status, None, None)
+        base_action, effect_level, event_type = parts
+        return OutcomeInfo(outcome_id, text, base_action, status, event_type, effect_level)
+
+
+# Process-wide catalog shared by every compiled table.
+OUTCOMES = OutcomeCatalog()
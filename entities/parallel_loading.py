@@ -0,0 +1,86 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .sidecar import sidecar_is_fresh
+from .workbook_cache import WORKBOOK_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Each worker gets several chunks so that progress is reported more than
+# once per worker and a slow chunk does not hold the others up.
+CHUNKS_PER_WORKER = 4
+
+
+# The workbook opened by each worker process, see open_worker_workbook().
+_worker_workbook = None
+
+
+def open_worker_workbook(filepath):
+    """This function runs once in each worker process and opens the workbook,
+    so that opening it is not repeated for every chunk of worksheets."""
+    global _worker_workbook
+    _worker_workbook = pd.ExcelFile(filepath)
+
+
+def parse_sheets(sheet_names):
+    """This function parses a list of worksheets from the workbook opened by
+    open_worker_workbook() and returns them as a dict of pd.DataFrame."""
+    return {sheet_name: _worker_workbook.parse(sheet_name) for sheet_name in sheet_names}
+
+
+def load_all_combat_tables(filepath, max_workers=None, progress=None):
+    """
+    This function eagerly loads every worksheet of a combat workbook into
+    WORKBOOK_CACHE and returns them as a dict of pd.DataFrame. If the compiled
+    sidecar is fresh it is used directly. Otherwise the worksheets are split
+    into chunks that are parsed by a pool of worker processes, and the parsed
+    tables are sent back, installed in the cache and written to the sidecar.
+    :param filepath: str, required
+    :param max_workers: int, optional, defaults to the number of CPU cores
+    :param progress: callable, optional, called as progress(done, total) with
+        the number of worksheets loaded so far
+    :return: dict of pd.DataFrame
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if sidecar_is_fresh(filepath):
+        logger.debug("load_all_combat_tables: Using fresh sidecar for %s.", filepath)
+        sheet_names = WORKBOOK_CACHE.get_sheet_names(filepath)
+        # Keep every worksheet, as preload() does for a parsed workbook.
+        WORKBOOK_CACHE.max_sheets = max(WORKBOOK_CACHE.max_sheets, len(sheet_names))
+        tables = {}
+        for done, sheet_name in enumerate(sheet_names, start=1):
+            tables[sheet_name] = WORKBOOK_CACHE.get_sheet(filepath, sheet_name)
+            if progress is not None:
+                progress(done, len(sheet_names))
+        return tables
+
+    with pd.ExcelFile(filepath) as xls:
+        sheet_names = xls.sheet_names
+        total = len(sheet_names)
+        chunk_count = min(total, max_workers * CHUNKS_PER_WORKER)
+        parallel = max_workers > 1 and chunk_count > 1
+        tables = {}
+        if not parallel:
+            for sheet_name in sheet_names:
+                tables[sheet_name] = xls.parse(sheet_name)
+                if progress is not None:
+                    progress(len(tables), total)
+    if parallel:
+        chunks = [sheet_names[i::chunk_count] for i in range(chunk_count)]
+        logger.debug("load_all_combat_tables: Parsing %s worksheets in %s chunks with %s "
+                     "workers.", total, chunk_count, max_workers)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=open_worker_workbook,
+                                 initargs=(filepath,)) as executor:
+            futures = [executor.submit(parse_sheets, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                tables.update(future.result())
+                if progress is not None:
+                    progress(len(tables), total)
+        # Keep the workbook's own order of worksheets.
+        tables = {sheet_name: tables[sheet_name] for sheet_name in sheet_names}
+    WORKBOOK_CACHE.preload(filepath, tables)
+    return tables
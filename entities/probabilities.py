@@ -0,0 +1,120 @@
+import logging
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .diagnostics import PERFORMANCE
+from .outcomes import COMBAT_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# The exact distributions of one character's rolls, or the expected number of
+# combatants for a roster. action and targeting are pd.Series indexed by
+# outcome, combat_status a pd.Series indexed by COMBAT_STATUSES and joint a
+# pd.DataFrame with an action per row and a target per column. A field is
+# None when its table is missing or invalid or has no rows for the difficulty.
+OutcomeProbabilities = namedtuple('OutcomeProbabilities',
+                                  ['action', 'targeting', 'combat_status', 'joint'])
+
+
+def column_probabilities(column):
+    """
+    This function returns the exact probability of every Outcome of a compiled
+    column, summing the rows that share an Outcome. Outcomes keep the order they
+    first appear in the table.
+    :param column: CompiledColumn, required
+    :return: pd.Series of float indexed by outcome
+    """
+    return column.distribution().copy()
+
+
+def status_probabilities(column):
+    """
+    This function returns the exact probability of every combat status for a
+    compiled action column, from the status of each row worked out when the
+    table was compiled.
+    :param column: CompiledColumn, required
+    :return: pd.Series of float indexed by COMBAT_STATUSES
+    """
+    return pd.Series(column.status_distribution(), index=COMBAT_STATUSES)
+
+
+def character_columns(character):
+    """This function resolves a character's tables and returns its compiled action
+    and targeting columns for its difficulty, either of which is None if it cannot
+    be rolled."""
+    character.resolve_tables()
+    columns = []
+    for table in (character.compiled_action_table, character.compiled_targeting_table):
+        column = None
+        if table is not None:
+            column = table.columns.get(character.difficulty.strip())
+        columns.append(column)
+    return tuple(columns)
+
+
+def _distributions(action_column, targeting_column):
+    action = targeting = combat_status = joint = None
+    if action_column is not None:
+        action = column_probabilities(action_column)
+        combat_status = status_probabilities(action_column)
+    if targeting_column is not None:
+        targeting = column_probabilities(targeting_column)
+    if action is not None and targeting is not None:
+        # The action and the target are rolled independently.
+        joint = pd.DataFrame(np.outer(action.to_numpy(), targeting.to_numpy()),
+                             index=action.index, columns=targeting.index, copy=False)
+    return OutcomeProbabilities(action, targeting, combat_status, joint)
+
+
+@PERFORMANCE.timed('character_probabilities')
+def character_probabilities(character):
+    """
+    This function returns the exact probability of every action, target, combat
+    status and action and target pair for one character's next roll, worked out
+    from the ranges in its tables without rolling. The character's tables are
+    resolved if they are not already.
+    :param character: Character, required
+    :return: OutcomeProbabilities
+    """
+    return _distributions(*character_columns(character))
+
+
+@PERFORMANCE.timed('roster_probabilities')
+def roster_probabilities(characters):
+    """
+    This function returns the expected number of combatants in characters that
+    roll each action, target, combat status and action and target pair in one
+    event. Characters sharing a table and difficulty are worked out once.
+    Characters that cannot roll an action or a target add nothing to it.
+    :param characters: iterable of Character, required
+    :return: OutcomeProbabilities of expected counts, with None for any field no
+        character could roll
+    """
+    groups = {}
+    for character in characters:
+        action_column, targeting_column = character_columns(character)
+        key = (id(action_column), id(targeting_column))
+        if key in groups:
+            groups[key][1] += 1
+        else:
+            groups[key] = [_distributions(action_column, targeting_column), 1]
+
+    def total(field):
+        parts = [getattr(distributions, field) * count
+                 for distributions, count in groups.values()
+                 if getattr(distributions, field) is not None]
+        if not parts:
+            return None
+        if field == 'joint':
+            result = parts[0]
+            for part in parts[1:]:
+                result = result.add(part, fill_value=0.0)
+            return result.fillna(0.0)
+        return pd.concat(parts).groupby(level=0, sort=False).sum()
+
+    result = OutcomeProbabilities(*(total(field) for field in OutcomeProbabilities._fields))
+    if result.combat_status is not None:
+        result = result._replace(combat_status=result.combat_status.reindex(COMBAT_STATUSES))
+    return result
@@ -0,0 +1,67 @@
+import numpy as np
+
+# First element of the spawn key of each kind of stream, so that e.g. event 3
+# and combatant 3 never share a stream.
+EVENT_STREAM = 0
+COMBATANT_STREAM = 1
+TASK_STREAM = 2
+TRANSITION_STREAM = 3
+
+
+class RandomStreams:
+    """
+    This object derives every random number generator used in a run from one
+    master seed with np.random.SeedSequence, so a run can be repeated exactly by
+    giving the same seed. Without a seed, fresh entropy is drawn and can be read
+    back from the seed attribute to repeat the run later.
+
+    Streams are addressed by a key rather than handed out in order, which is
+    what SeedSequence.spawn() would do for the same key, so they do not depend
+    on how work is split up or on which process asks for them:
+
+    - event_generator(event) rolls every combatant in a roster for one event.
+      Row i of the roster always uses the i-th value drawn, however the rows are
+      divided between workers.
+    - combatant_generator(combatant) is a combatant's own stream, for code that
+      rolls one combatant at a time.
+    - task_generator(task) is for a numbered piece of parallel work. Keying it by
+      task rather than by worker process gives the same results on 1 core or 32.
+    - transition_generator(event) moves combatants to their stances for the
+      round after an event, see advance_stances().
+    :param seed: int, optional
+    """
+    def __init__(self, seed=None):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.seed = self.seed_sequence.entropy
+
+    def sequence(self, *key):
+        """This method returns the SeedSequence for a key, the same one that
+        spawning children along the key's path from the master would give."""
+        return np.random.SeedSequence(self.seed, spawn_key=key)
+
+    def generator(self, *key):
+        """This method returns a new np.random.Generator for a key."""
+        return np.random.Generator(np.random.PCG64(self.sequence(*key)))
+
+    def event_generator(self, event):
+        return self.generator(EVENT_STREAM, event)
+
+    def combatant_generator(self, combatant):
+        return self.generator(COMBATANT_STREAM, combatant)
+
+    def task_generator(self, task):
+        return self.generator(TASK_STREAM, task)
+
+    def transition_generator(self, event):
+        return self.generator(TRANSITION_STREAM, event)
+
+    def event_uniforms(self, event, kinds, size):
+        """
+        This method returns the uniform values in [0, 1) that decide an event for
+        a roster of size rows, one row of values per kind of roll.
+        :param event: int, required
+        :param kinds: int, required, e.g. 2 for action and targeting
+        :param size: int, required
+        :return: np.ndarray of float with shape (kinds, size)
+        """
+        return self.event_generator(event).random((kinds, size))
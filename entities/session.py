@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+from .compiled_tables import MAX_SHEET_NAME_LENGTH
+from .diagnostics import PERFORMANCE
+from .internal_objects import Character
+from .validation import VALIDATION_KEY, validate_sheet
+from .workbook_cache import WORKBOOK_CACHE
+
+logger = logging.getLogger(__name__)
+
+SESSION_VERSION = 1
+# Character attributes saved for each combatant, in this order.
+ROSTER_FIELDS = ['name', 'combat_role', 'role_variant', 'combat_stance', 'difficulty',
+                 'level']
+
+
+def cached_sheet_hash(filepath, sheet_name):
+    """This function returns sheet_hash() of a worksheet from
+    WorkbookCache.get_sheet_hashes(), which does not parse it. It raises
+    ValueError if the worksheet does not exist."""
+    hashes = WORKBOOK_CACHE.get_sheet_hashes(filepath)
+    if sheet_name not in hashes:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return hashes[sheet_name]
+
+
+def generator_state(rng):
+    """This function returns the state of a np.random.Generator as a dict that
+    can be written as JSON, or None without a generator."""
+    if rng is None:
+        return None
+    return {'bit_generator': type(rng.bit_generator).__name__,
+            'state': rng.bit_generator.state}
+
+
+def restore_generator(state):
+    """This function returns a np.random.Generator in the state saved by
+    generator_state(), or None."""
+    if state is None:
+        return None
+    bit_generator = getattr(np.random, state['bit_generator'])()
+    bit_generator.state = state['state']
+    return np.random.Generator(bit_generator)
+
+
+@PERFORMANCE.timed('session_snapshot')
+def session_snapshot(characters, active, combat_tables_filepath, event_counter=0,
+                     roster_state=None):
+    """
+    This function returns a session as a dict that can be written as JSON: each
+    combatant's settings, whether it is active and the state of its random
+    number generator, the event counter, and a fingerprint and the validation
+    errors of every combat table a combatant rolls on. The fingerprints let
+    restore_session() trust tables that have not changed since.
+    :param characters: list of Character, required
+    :param active: list of bool, required, one per character
+    :param combat_tables_filepath: str, required
+    :param event_counter: int, optional, defaults to 0
+    :param roster_state: dict, optional, anything else the roster needs back,
+        e.g. from RosterModel.stream_state()
+    :return: dict
+    """
+    sheet_names = set()
+    roster = []
+    for character, is_active in zip(characters, active):
+        roster.append([getattr(character, field) for field in ROSTER_FIELDS]
+                      + [bool(is_active), generator_state(character.rng)])
+        sheet_names.update(name[:MAX_SHEET_NAME_LENGTH]
+                           for name in (character.combat_action_table_name,
+                                        character.combat_targeting_table_name))
+    tables = {}
+    available = set(WORKBOOK_CACHE.get_sheet_names(combat_tables_filepath))
+    for sheet_name in sorted(sheet_names & available):
+        tables[sheet_name] = {'hash': cached_sheet_hash(combat_tables_filepath, sheet_name),
+                              'errors': validate_sheet(combat_tables_filepath, sheet_name)}
+    return {'version': SESSION_VERSION,
+            'combat_tables_filepath': os.path.abspath(combat_tables_filepath),
+            'event_counter': event_counter,
+            'roster_state': roster_state or {},
+            'fields': ROSTER_FIELDS + ['active', 'rng'],
+            'roster': roster,
+            'tables': tables}
+
+
+def write_session(filepath, snapshot):
+    """This function writes a session snapshot to filepath as compact JSON. It is
+    written to a temporary file first, so a failed save leaves any earlier
+    session intact."""
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+    os.replace(tmp_path, filepath)
+
+
+def read_session(filepath):
+    """This function reads a session snapshot written by write_session(). It
+    raises OSError if the file cannot be read and ValueError if it is not a
+    session this version can restore."""
+    with open(filepath) as f:
+        try:
+            snapshot = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{filepath} is not a session file: {e}")
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SESSION_VERSION:
+        raise ValueError(f"{filepath} is not a version {SESSION_VERSION} session file.")
+    return snapshot
+
+
+@PERFORMANCE.timed('restore_session')
+def restore_session(snapshot, combat_tables_filepath):
+    """
+    This function rebuilds the combatants of a session snapshot against the
+    combat tables workbook at combat_tables_filepath, usually the one the
+    session was saved with. Each combat table whose fingerprint still matches has
+    its saved validation result installed in WORKBOOK_CACHE, so it is not
+    validated again, and the active combatants are bound to their compiled
+    tables straight away. Tables that changed, or are gone, are listed and are
+    loaded and validated as usual.
+    :param snapshot: dict, required, from session_snapshot() or read_session()
+    :param combat_tables_filepath: str, required
+    :return: tuple of (list of Character, list of bool active, list of str changed
+        or missing worksheets)
+    """
+    available = set(WORKBOOK_CACHE.get_sheet_names(combat_tables_filepath))
+    changed = []
+    for sheet_name, table in snapshot['tables'].items():
+        if (sheet_name not in available
+                or cached_sheet_hash(combat_tables_filepath, sheet_name) != table['hash']):
+            changed.append(sheet_name)
+            continue
+        WORKBOOK_CACHE.set_derived(combat_tables_filepath, sheet_name, VALIDATION_KEY,
+                                   table['errors'])
+    if changed:
+        logger.info("restore_session: Worksheets changed since the session was saved: %s",
+                    changed)
+
+    fields = snapshot['fields']
+    characters = []
+    active = []
+    for row in snapshot['roster']:
+        values = dict(zip(fields, row))
+        character = Character(name=values['name'], combat_role=values['combat_role'],
+                              combat_stance=values['combat_stance'],
+                              difficulty=values['difficulty'],
+                              combat_tables_filepath=combat_tables_filepath,
+                              role_variant=values['role_variant'],
+                              individual_level=values['level'], lazy=True,
+                              rng=restore_generator(values['rng']))
+        if values['active']:
+            character.resolve_tables()
+        characters.append(character)
+        active.append(values['active'])
+    return characters, active, sorted(changed)
@@ -0,0 +1,93 @@
+import logging
+import threading
+
+from .compiled_tables import MAX_SHEET_NAME_LENGTH
+from .workbook_cache import WORKBOOK_CACHE
+
+logger = logging.getLogger(__name__)
+
+SHEET_INDEX_KEY = 'sheet_index'
+
+
+class SheetIndex:
+    """
+    This object indexes the worksheet names of a combat workbook so that a
+    combat table name can be looked up without asking the workbook for a
+    worksheet that may not exist. Excel cuts worksheet names to 31 characters,
+    so table names are looked up by their first 31 characters, the same way
+    Character.load_table() always has.
+
+    Two table names can be cut to the same worksheet name, and then there is no
+    telling which of them the worksheet is meant for. Every table name looked up
+    or passed to add_table_names() is remembered, and worksheet_name() refuses
+    a table name once another one is cut to the same worksheet name.
+    :param sheet_names: list of str, required
+    """
+    def __init__(self, sheet_names):
+        self.sheet_names = list(sheet_names)
+        self._names = frozenset(self.sheet_names)
+        # Worksheet name to the set of table names cut to it.
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def truncate(table_name):
+        """This static method returns the worksheet name Excel gives a table name."""
+        return table_name[:MAX_SHEET_NAME_LENGTH]
+
+    def add_table_names(self, table_names):
+        """This method remembers table names that are in use, e.g. every
+        combination of the configured roles, variants and stances, so that
+        collisions between them are found before either one is looked up."""
+        with self._lock:
+            for table_name in table_names:
+                if table_name:
+                    self._claims.setdefault(self.truncate(table_name), set()).add(table_name)
+
+    def collides(self, table_name):
+        """This method returns True if another table name in use is cut to the same
+        worksheet name as table_name."""
+        self.add_table_names([table_name])
+        with self._lock:
+            return len(self._claims[self.truncate(table_name)]) > 1
+
+    def worksheet_name(self, table_name):
+        """This method returns the name of the worksheet holding table_name, or None
+        if the workbook has no such worksheet or table_name collides with another
+        table name in use."""
+        sheet_name = self.truncate(table_name)
+        if sheet_name not in self._names:
+            return None
+        if self.collides(table_name):
+            logger.warning("SheetIndex.worksheet_name: %s is cut to %r, like %s. It is "
+                           "not used.", table_name, sheet_name,
+                           ', '.join(sorted(self._claims[sheet_name] - {table_name})))
+            return None
+        return sheet_name
+
+    def __contains__(self, table_name):
+        return self.truncate(table_name) in self._names
+
+    def __len__(self):
+        return len(self.sheet_names)
+
+    def collisions(self, table_names):
+        """
+        This method returns the table names that Excel's 31 character limit cuts to
+        the same worksheet name, whether or not that worksheet exists. Only one of
+        them can have a worksheet of its own, and a combatant rolling on any of the
+        others would silently roll on it.
+        :param table_names: iterable of str, required
+        :return: dict of worksheet name to sorted list of table names
+        """
+        groups = {}
+        for table_name in set(table_names):
+            groups.setdefault(self.truncate(table_name), []).append(table_name)
+        return {sheet_name: sorted(names) for sheet_name, names in sorted(groups.items())
+                if len(names) > 1}
+
+
+def sheet_index(filepath):
+    """This function returns the SheetIndex of the combat workbook at filepath,
+    built once for each version of the workbook in WORKBOOK_CACHE."""
+    return WORKBOOK_CACHE.get_workbook_derived(filepath, SHEET_INDEX_KEY, SheetIndex)
@@ -0,0 +1,276 @@
+import hashlib
+import logging
+import numbers
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = '.cache.npz'
+SIDECAR_VERSION = 3
+# Cell codes below zero do not refer to the interned string table.
+MISSING_CODE = -1
+INT_CODE = -2
+FLOAT_CODE = -3
+BOOL_CODE = -4
+
+
+def sidecar_path(filepath):
+    """This function returns the path of the compiled sidecar for a workbook,
+    which sits next to it, e.g. combat-tables.xlsx.cache.npz."""
+    return os.path.abspath(filepath) + SIDECAR_SUFFIX
+
+
+def sheet_hash(table: pd.DataFrame):
+    """This function returns a SHA-256 hex digest of a worksheet's headers and
+    cells, so two versions of a worksheet can be compared without keeping the
+    old one."""
+    digest = hashlib.sha256()
+    digest.update(repr([str(col) for col in table.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(table.astype(object), index=False)
+                  .to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def content_hash(filepath):
+    """This function returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SidecarWorkbook:
+    """
+    This object stands in for pd.ExcelFile when a workbook has been compiled.
+    Every worksheet is held as a matrix of integer codes into one interned
+    string table, so parsing a worksheet only builds a DataFrame from arrays
+    instead of reading the workbook with openpyxl.
+
+    Codes of zero or more index the string table. MISSING_CODE marks an empty
+    cell, and INT_CODE, FLOAT_CODE and BOOL_CODE mark cells that were numbers,
+    whose values are kept in a separate float array for that worksheet. Column
+    headers are coded the same way, so numeric headers keep their type. Any
+    other cell, such as a date or a time, is kept as its text.
+    :param source_hash: str, required
+    :param sheet_names: list of str, required
+    :param strings: np.ndarray of str, required
+    :param sheets: dict of tuple, required, (header codes, header values, cell
+        codes, values)
+    :param sheet_hashes: dict of str, required, sheet_hash() of each worksheet as
+        it was read from the workbook, so changed worksheets can be found without
+        parsing any of them
+    """
+    def __init__(self, source_hash, sheet_names, strings, sheets, sheet_hashes):
+        self.source_hash = source_hash
+        self.sheet_names = sheet_names
+        self.sheet_hashes = sheet_hashes
+        self.strings = strings
+        self._sheets = sheets
+        # Lookup array with the empty cell value appended so that missing
+        # cells can be resolved in the same fancy indexing pass.
+        self._lookup = np.empty(len(strings) + 1, dtype=object)
+        self._lookup[:len(strings)] = strings.tolist()
+        self._lookup[-1] = np.nan
+
+    @classmethod
+    def from_dataframes(cls, source_hash, tables):
+        """This class method interns the cells of a dict of worksheet
+        DataFrames, as returned by pd.read_excel(sheet_name=None)."""
+        interned = {}
+        sheets = {}
+        for sheet_name, table in tables.items():
+            header_codes = np.full(len(table.columns), MISSING_CODE, dtype=np.int32)
+            header_values = np.zeros(len(table.columns), dtype=np.float64)
+            for col_idx, col in enumerate(table.columns):
+                header_codes[col_idx], header_values[col_idx] = encode_cell(col, interned)
+            cell_codes = np.full(table.shape, MISSING_CODE, dtype=np.int32)
+            values = None
+            for col_idx, column in enumerate(table.columns):
+                for row_idx, item in enumerate(table[column].tolist()):
+                    code, value = encode_cell(item, interned)
+                    cell_codes[row_idx, col_idx] = code
+                    if code in (INT_CODE, FLOAT_CODE, BOOL_CODE):
+                        if values is None:
+                            values = np.zeros(table.shape, dtype=np.float64)
+                        values[row_idx, col_idx] = value
+            sheets[sheet_name] = (header_codes, header_values, cell_codes, values)
+        strings = np.array(list(interned), dtype=str)
+        sheet_hashes = {sheet_name: sheet_hash(table) for sheet_name, table in tables.items()}
+        return cls(source_hash, list(tables), strings, sheets, sheet_hashes)
+
+    @classmethod
+    def load(cls, path):
+        """This class method reads a sidecar written by save(). It returns None
+        if the file was written by a different SIDECAR_VERSION."""
+        with np.load(path, allow_pickle=False) as npz:
+            if int(npz['version']) != SIDECAR_VERSION:
+                return None
+            source_hash = str(npz['source_hash'])
+            sheet_names = npz['sheet_names'].tolist()
+            sheet_hashes = dict(zip(sheet_names, npz['sheet_hashes'].tolist()))
+            strings = decode_strings(npz['string_blob'], npz['string_offsets'])
+            sheets = {}
+            for idx, sheet_name in enumerate(sheet_names):
+                values_key = f'sheet{idx}_values'
+                values = npz[values_key] if values_key in npz.files else None
+                sheets[sheet_name] = (npz[f'sheet{idx}_headers'],
+                                      npz[f'sheet{idx}_header_values'],
+                                      npz[f'sheet{idx}_cells'], values)
+        return cls(source_hash, sheet_names, strings, sheets, sheet_hashes)
+
+    def save(self, path):
+        """This method writes the compiled workbook to path as an .npz file."""
+        blob, offsets = encode_strings(self.strings.tolist())
+        arrays = {'version': np.array(SIDECAR_VERSION),
+                  'source_hash': np.array(self.source_hash),
+                  'sheet_names': np.array(self.sheet_names, dtype=str),
+                  'sheet_hashes': np.array([self.sheet_hashes[sheet_name]
+                                            for sheet_name in self.sheet_names], dtype=str),
+                  'string_blob': blob,
+                  'string_offsets': offsets}
+        for idx, sheet_name in enumerate(self.sheet_names):
+            header_codes, header_values, cell_codes, values = self._sheets[sheet_name]
+            arrays[f'sheet{idx}_headers'] = header_codes
+            arrays[f'sheet{idx}_header_values'] = header_values
+            arrays[f'sheet{idx}_cells'] = cell_codes
+            if values is not None:
+                arrays[f'sheet{idx}_values'] = values
+        # Write to a temporary file first so that a reader never sees a
+        # partly written sidecar.
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def parse(self, sheet_name):
+        """This method returns a worksheet as a pd.DataFrame. Like
+        pd.ExcelFile.parse(), it raises ValueError if the worksheet does not
+        exist."""
+        if sheet_name not in self._sheets:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        header_codes, header_values, cell_codes, values = self._sheets[sheet_name]
+        columns = [self._decode(code, value)
+                   for code, value in zip(header_codes.tolist(), header_values.tolist())]
+        cells = self._lookup[np.where(cell_codes == MISSING_CODE, len(self.strings),
+                                      cell_codes)]
+        if values is not None:
+            for code, kind in ((INT_CODE, int), (FLOAT_CODE, float), (BOOL_CODE, bool)):
+                rows, cols = np.nonzero(cell_codes == code)
+                for row_idx, col_idx in zip(rows.tolist(), cols.tolist()):
+                    cells[row_idx, col_idx] = kind(values[row_idx, col_idx])
+        return pd.DataFrame(cells, columns=columns).infer_objects()
+
+    def _decode(self, code, value):
+        if code >= 0:
+            return str(self.strings[code])
+        if code == MISSING_CODE:
+            return np.nan
+        return {INT_CODE: int, FLOAT_CODE: float, BOOL_CODE: bool}[code](value)
+
+    def close(self):
+        """This method exists so that the workbook can be used like a
+        pd.ExcelFile. There is nothing to close."""
+        pass
+
+
+def encode_cell(item, interned):
+    """This function returns the code and numeric value of one cell or header for
+    SidecarWorkbook, adding text to interned, a dict of str to code. Cells that are
+    neither text nor numbers, such as dates and times, are interned as text."""
+    if isinstance(item, str):
+        return interned.setdefault(item, len(interned)), 0.0
+    if item is None or (not isinstance(item, numbers.Number) and pd.isna(item)):
+        return MISSING_CODE, 0.0
+    if isinstance(item, (bool, np.bool_)):
+        return BOOL_CODE, float(item)
+    if isinstance(item, numbers.Integral):
+        return INT_CODE, float(item)
+    if isinstance(item, numbers.Real):
+        if np.isnan(item):
+            return MISSING_CODE, 0.0
+        return FLOAT_CODE, float(item)
+    text = str(item)
+    return interned.setdefault(text, len(interned)), 0.0
+
+
+def encode_strings(strings):
+    """This function packs a list of strings into one UTF-8 byte array and the
+    offsets where each string ends, which is far smaller on disk than a
+    fixed-width NumPy string array when a few strings are long."""
+    encoded = [item.encode('utf-8') for item in strings]
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    offsets = np.cumsum([len(item) for item in encoded], dtype=np.int64)
+    return blob, offsets
+
+
+def decode_strings(blob, offsets):
+    """This function reverses encode_strings()."""
+    data = blob.tobytes()
+    starts = [0] + offsets[:-1].tolist()
+    strings = [data[start:end].decode('utf-8')
+               for start, end in zip(starts, offsets.tolist())]
+    return np.array(strings, dtype=str)
+
+
+def compile_workbook(filepath, source_hash=None):
+    """
+    This function parses every worksheet of an Excel workbook and writes the
+    compiled sidecar next to it. If the sidecar cannot be written, for example
+    because the folder is read only, the compiled workbook is still returned.
+    :param filepath: str, required
+    :param source_hash: str, optional, computed if not supplied
+    :return: SidecarWorkbook
+    """
+    if source_hash is None:
+        source_hash = content_hash(filepath)
+    logger.debug("compile_workbook: Compiling %s.", filepath)
+    tables = pd.read_excel(filepath, sheet_name=None)
+    workbook = SidecarWorkbook.from_dataframes(source_hash, tables)
+    try:
+        workbook.save(sidecar_path(filepath))
+    except OSError as e:
+        logger.warning("compile_workbook: Could not write sidecar for %s: %s", filepath, e)
+    return workbook
+
+
+def sidecar_is_fresh(filepath, source_hash=None):
+    """This function returns True if the sidecar for a workbook exists, was
+    written by this SIDECAR_VERSION and matches the workbook's content. Only
+    the small header arrays of the sidecar are read."""
+    path = sidecar_path(filepath)
+    if not os.path.exists(path):
+        return False
+    if source_hash is None:
+        source_hash = content_hash(filepath)
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            return (int(npz['version']) == SIDECAR_VERSION
+                    and str(npz['source_hash']) == source_hash)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def open_workbook(filepath):
+    """
+    This function returns the compiled form of a workbook. The sidecar is used
+    when its content hash matches the workbook, otherwise the workbook is
+    compiled again and the sidecar rewritten.
+    :param filepath: str, required
+    :return: SidecarWorkbook
+    """
+    source_hash = content_hash(filepath)
+    path = sidecar_path(filepath)
+    if os.path.exists(path):
+        try:
+            workbook = SidecarWorkbook.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("open_workbook: Ignoring unreadable sidecar %s: %s", path, e)
+            workbook = None
+        if workbook is not None and workbook.source_hash == source_hash:
+            logger.debug("open_workbook: Using sidecar %s.", path)
+            return workbook
+        logger.debug("open_workbook: Sidecar %s is stale.", path)
+    return compile_workbook(filepath, source_hash)
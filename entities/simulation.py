@@ -0,0 +1,173 @@
+import csv
+import logging
+
+import pandas as pd
+
+from .combatant_store import NO_RESULT, CombatantStore
+from .diagnostics import PERFORMANCE
+from .internal_objects import Character
+from .outcomes import COMBAT_STATUSES
+
+logger = logging.getLogger(__name__)
+
+ROSTER_COLUMNS = ['name', 'role', 'variant', 'stance', 'difficulty', 'level']
+
+
+def read_roster(roster_filepath):
+    """
+    This function reads a roster of combatants from a CSV file and returns one
+    dict per combatant with the keyword arguments of Character.update_status().
+    The file must have a header row with the columns in ROSTER_COLUMNS. The
+    variant and level columns may be left blank if role variants or surges and
+    lulls are not used.
+    :param roster_filepath: str, required
+    :return: list of dict
+    """
+    rows = []
+    with open(roster_filepath, newline='') as f:
+        reader = csv.DictReader(f)
+        missing = [col for col in ROSTER_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Roster {roster_filepath} is missing columns {missing}.")
+        for row in reader:
+            rows.append({'name': row['name'].strip(),
+                         'combat_role': row['role'].strip(),
+                         'combat_stance': row['stance'].strip(),
+                         'difficulty': row['difficulty'].strip(),
+                         'role_variant': row['variant'].strip() or None,
+                         'individual_level': row['level'].strip() or None})
+    return rows
+
+
+def load_roster(roster_filepath, combat_tables_filepath):
+    """
+    This function reads a roster with read_roster() and returns a list of
+    Character objects with their tables loaded.
+    :param roster_filepath: str, required
+    :param combat_tables_filepath: str, required
+    :return: list of Character
+    """
+    return [Character(combat_tables_filepath=combat_tables_filepath, **row)
+            for row in read_roster(roster_filepath)]
+
+
+def load_roster_store(roster_filepath, combat_tables_filepath, seed=None):
+    """
+    This function reads a roster with read_roster() into a CombatantStore with
+    every combatant active. Use it instead of load_roster() for large battles.
+    :param roster_filepath: str, required
+    :param combat_tables_filepath: str, required
+    :param seed: int, optional, see RandomStreams
+    :return: CombatantStore
+    """
+    store = CombatantStore(combat_tables_filepath, seed)
+    for row in read_roster(roster_filepath):
+        store.append(**row)
+    return store
+
+
+class SimulationCancelled(Exception):
+    """Raised by check_tables() when it is cancelled before it finishes."""
+
+
+@PERFORMANCE.timed('check_tables')
+def check_tables(characters, progress=None, cancel_event=None):
+    """
+    This function resolves the tables of every character, loading them if
+    needed, and counts the tables that are invalid or missing. It can run on a
+    worker thread: progress is called as progress(done, total) after each
+    character, and if cancel_event is set it stops and raises
+    SimulationCancelled. Each invalid table is listed once however many
+    characters use it.
+    :param characters: list of Character, required
+    :param progress: callable, optional
+    :param cancel_event: threading.Event, optional
+    :return: tuple of (int, int, list of str), the error count, the missing count
+        and the names of the invalid tables
+    """
+    error_ctr = 0
+    missing_ctr = 0
+    invalid_tables = []
+    total = len(characters)
+    for done, character in enumerate(characters, start=1):
+        if cancel_event is not None and cancel_event.is_set():
+            raise SimulationCancelled()
+        character.resolve_tables()
+        for table, table_name in ((character.combat_targeting_table,
+                                   character.combat_targeting_table_name),
+                                  (character.combat_action_table,
+                                   character.combat_action_table_name)):
+            # We need to check if a pd.DataFrame was added as each table.
+            if isinstance(table, pd.DataFrame):
+                continue
+            logger.debug("check_tables: %s for %s is %s.", table_name, character.name, table)
+            if table == "missing":
+                missing_ctr += 1
+            else:
+                error_ctr += 1
+                if table_name not in invalid_tables:
+                    invalid_tables.append(table_name)
+        if progress is not None:
+            progress(done, total)
+    return error_ctr, missing_ctr, invalid_tables
+
+
+@PERFORMANCE.timed('run_event')
+def run_event(characters, surge_lull_index=None):
+    """
+    This function runs one event for every character in the list, rolling an
+    action and a target for each. It returns one dict per character with the
+    keys name, action, target, combat_status and effect. The effect is the
+    text of the surge or lull that was rolled, or None. Characters with a
+    missing or invalid table are rolled as far as possible, as in the GUI.
+    :param characters: list of Character, required
+    :param surge_lull_index: SurgeLullIndex, optional
+    :return: list of dict
+    """
+    results = []
+    for character in characters:
+        character.roll_for_combat_action()
+        character.roll_for_combat_targeting()
+        effect = None
+        if character.action_id is not None and surge_lull_index is not None:
+            effect = surge_lull_index.lookup_id(character.action_id, character.level)
+        results.append({'name': character.name,
+                        'action': character.action,
+                        'target': character.target,
+                        'combat_status': character.combat_status,
+                        'effect': effect})
+    return results
+
+
+@PERFORMANCE.timed('run_store_event')
+def run_store_event(store, surge_lull_index=None):
+    """
+    This function runs the store's next event for every active combatant with
+    one vectorized roll, and returns the same list of dicts as run_event().
+    Effects are looked up once per distinct action and level rather than once
+    per combatant.
+    :param store: CombatantStore, required
+    :param surge_lull_index: SurgeLullIndex, optional
+    :return: list of dict
+    """
+    rows = store.active_rows()
+    store.roll(rows, event=store.next_event())
+    effects = {}
+    results = []
+    for row, action_code, target_code, status_code, level_code in zip(
+            rows.tolist(), store.action_codes(rows).tolist(),
+            store.target_codes(rows).tolist(), store.status_codes(rows).tolist(),
+            store.level_codes(rows).tolist()):
+        key = (action_code, level_code)
+        if key not in effects:
+            effect = None
+            if action_code != NO_RESULT and surge_lull_index is not None:
+                effect = surge_lull_index.lookup_id(action_code, store.levels[level_code])
+            effects[key] = effect
+        results.append({'name': store.names[row],
+                        'action': store.outcome(action_code),
+                        'target': store.outcome(target_code),
+                        'combat_status': COMBAT_STATUSES[status_code],
+                        'effect': effects[key]})
+    return results
+
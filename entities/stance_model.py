@@ -0,0 +1,297 @@
+import logging
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .diagnostics import PERFORMANCE
+from .internal_objects import Character
+from .outcomes import COMBAT_STATUSES
+from .probabilities import character_columns
+
+logger = logging.getLogger(__name__)
+
+# The expected number of combatants in each stance, and rolling each action,
+# target and combat status, in every round of a forecast. Each field is a
+# pd.DataFrame indexed by round, from 0 for the current stances, with one
+# column per stance or outcome. problems lists the tables that could not be
+# rolled on; combatants in those stances add nothing to the outcome tables.
+StanceForecast = namedtuple('StanceForecast', ['occupancy', 'action', 'targeting',
+                                               'combat_status', 'problems'])
+
+
+class TransitionModel:
+    """
+    This object is a Markov chain over combat stances, or over role variants,
+    giving the chance that a combatant in one state is in each state next
+    round. matrix[i, j] is the chance of moving from states[i] to states[j], and
+    every row sums to 1.
+
+    States that are not in the model, such as a stance the transition worksheet
+    leaves out, are kept for the whole fight.
+    :param states: list of str, required
+    :param matrix: np.ndarray of float, required, shape (len(states), len(states))
+    :param problems: list of str, optional
+    """
+    def __init__(self, states, matrix, problems=None):
+        self.states = list(states)
+        self.matrix = np.asarray(matrix, dtype=float)
+        self.problems = problems or []
+        self._index = {state: i for i, state in enumerate(self.states)}
+        self._cumulative = np.cumsum(self.matrix, axis=1)
+
+    @classmethod
+    def from_table(cls, table, known_states=None):
+        """
+        This class method reads a transition worksheet. The first column names the
+        state a combatant is in, and each other column, headed with a state, holds
+        the relative weight of moving to that state next round. Weights do not
+        have to add up to anything, blank cells are 0, and a row with no weight at
+        all keeps its state. Problems, such as weights that are not numbers or
+        states that are not in known_states, are collected in problems.
+        :param table: pd.DataFrame, required
+        :param known_states: list of str, optional, e.g. the Combat Stances
+        :return: TransitionModel
+        """
+        problems = []
+        first = table.columns[0]
+        table = table[table[first].notna()]
+        from_states = [str(state).strip() for state in table[first]]
+        to_states = [str(state).strip() for state in table.columns[1:]]
+        states = list(dict.fromkeys(from_states + to_states))
+        if len(set(from_states)) != len(from_states):
+            problems.append(f"Transitions from the same {str(first).strip()} are given more "
+                            f"than once. The last row is used.")
+        if known_states is not None:
+            known = {str(state).strip() for state in known_states}
+            for state in states:
+                if state not in known:
+                    problems.append(f"Transition state {state} is not a known "
+                                    f"{str(first).strip()}.")
+
+        weights = table[table.columns[1:]].apply(pd.to_numeric, errors='coerce')
+        bad = weights.isna() & table[table.columns[1:]].notna()
+        for column in weights.columns[bad.any()]:
+            problems.append(f"Transitions to {str(column).strip()} have weights that "
+                            f"are not numbers. They are treated as 0.")
+        weights = weights.fillna(0.0)
+        if (weights.to_numpy() < 0).any():
+            problems.append("Negative transition weights are treated as 0.")
+            weights = weights.clip(lower=0.0)
+
+        matrix = np.eye(len(states))
+        columns = [states.index(state) for state in to_states]
+        for state, row in zip(from_states, weights.to_numpy()):
+            i = states.index(state)
+            total = row.sum()
+            if total == 0:
+                problems.append(f"{state} has no transition weights. It is kept.")
+                continue
+            matrix[i] = 0.0
+            np.add.at(matrix[i], columns, row / total)
+        for problem in problems:
+            logger.warning("TransitionModel.from_table: %s", problem)
+        return cls(states, matrix, problems)
+
+    def __len__(self):
+        return len(self.states)
+
+    def index(self, state):
+        """This method returns the position of state in states, or None."""
+        return self._index.get(state)
+
+    def extended(self, states):
+        """This method returns a model that also holds every state in states that
+        this one does not, each kept for the whole fight."""
+        extra = [state for state in dict.fromkeys(states) if state not in self._index]
+        if not extra:
+            return self
+        size = len(self.states) + len(extra)
+        matrix = np.eye(size)
+        matrix[:len(self.states), :len(self.states)] = self.matrix
+        return TransitionModel(self.states + extra, matrix, self.problems)
+
+    def distribution(self, state, rounds):
+        """
+        This method returns the chance of being in each state in every round of a
+        fight that starts in state, one vector and matrix product per round.
+        :param state: str, required
+        :param rounds: int, required
+        :return: pd.DataFrame indexed by round with one column per state
+        """
+        model = self.extended([state])
+        vector = np.zeros(len(model))
+        vector[model.index(state)] = 1.0
+        rows = [vector]
+        for _ in range(rounds):
+            vector = vector @ model.matrix
+            rows.append(vector)
+        return pd.DataFrame(rows, columns=model.states).rename_axis('Round')
+
+    def step(self, state, rng):
+        """This method returns the state a combatant in state moves to next round,
+        drawn with rng. A state that is not in the model is kept.
+        :param state: str, required
+        :param rng: np.random.Generator, required
+        """
+        i = self._index.get(state)
+        if i is None:
+            return state
+        j = int(np.searchsorted(self._cumulative[i], rng.random(), side='right'))
+        # Rounding can leave the last cumulative value a little under 1.
+        return self.states[min(j, len(self.states) - 1)]
+
+    def sample_path(self, state, rounds, rng):
+        """This method returns the states of one sampled fight of rounds rounds,
+        starting with state."""
+        path = [state]
+        for _ in range(rounds):
+            path.append(self.step(path[-1], rng))
+        return path
+
+
+def build_transition_model(table, known_states=None):
+    """This function returns a TransitionModel read from a transition worksheet,
+    or None if the worksheet is not configured."""
+    if table is None:
+        return None
+    return TransitionModel.from_table(table, known_states)
+
+
+def _chain(characters, stance_model, variant_model):
+    """This function returns the states, transition matrix and a function giving
+    a character's starting state for the chain forecast_stances() runs. With a
+    variant model, a state is a stance and variant pair and both change each
+    round, independently. Otherwise a combatant keeps its own variant."""
+    stance_model = stance_model.extended(c.combat_stance for c in characters)
+    if variant_model is None:
+        states = [(stance, None) for stance in stance_model.states]
+        return states, stance_model.matrix, lambda c: stance_model.index(c.combat_stance)
+    variant_model = variant_model.extended(c.role_variant for c in characters)
+    states = [(stance, variant) for stance in stance_model.states
+              for variant in variant_model.states]
+    size = len(variant_model)
+    return (states, np.kron(stance_model.matrix, variant_model.matrix),
+            lambda c: stance_model.index(c.combat_stance) * size
+            + variant_model.index(c.role_variant))
+
+
+@PERFORMANCE.timed('stance_forecast')
+def forecast_stances(characters, stance_model, rounds, variant_model=None):
+    """
+    This function forecasts a fight of rounds rounds in which every combatant's
+    stance, and role variant if variant_model is given, changes each round as
+    the models say. It returns the expected number of combatants in each stance
+    and rolling each action, target and combat status in every round, worked out
+    exactly with one matrix product per round rather than by rolling.
+
+    Combatants sharing a role, difficulty and workbook, and a variant unless it
+    changes too, are forecast together, and only the tables of stances they can
+    reach are loaded.
+    :param characters: iterable of Character or CombatantProxy, required
+    :param stance_model: TransitionModel, required
+    :param rounds: int, required
+    :param variant_model: TransitionModel, optional
+    :return: StanceForecast
+    """
+    characters = list(characters)
+    states, matrix, start = _chain(characters, stance_model, variant_model)
+    groups = {}
+    for character in characters:
+        if variant_model is None:
+            key = (character.combat_role, character.role_variant, character.difficulty,
+                   character.combat_workbook_filepath)
+        else:
+            key = (character.combat_role, None, character.difficulty,
+                   character.combat_workbook_filepath)
+        if key not in groups:
+            groups[key] = np.zeros(len(states))
+        groups[key][start(character)] += 1
+
+    # occupancy[k, g, s] is the expected number of group g in state s in round k.
+    occupancy = np.zeros((rounds + 1, len(groups), len(states)))
+    if groups:
+        occupancy[0] = np.array(list(groups.values()))
+    for k in range(rounds):
+        occupancy[k + 1] = occupancy[k] @ matrix
+
+    outcomes = {'action': {}, 'targeting': {}}
+    action = {}
+    targeting = {}
+    statuses = {}
+    problems = []
+    reached = occupancy.sum(axis=0) > 0
+    for g, (role, variant, difficulty, filepath) in enumerate(groups):
+        for s in np.flatnonzero(reached[g]).tolist():
+            stance, state_variant = states[s]
+            probe = Character(name=f"{role} forecast", combat_role=role,
+                              combat_stance=stance, difficulty=difficulty,
+                              combat_tables_filepath=filepath,
+                              role_variant=state_variant if variant_model else variant,
+                              lazy=True)
+            action_column, targeting_column = character_columns(probe)
+            for kind, column, table_name, results in (
+                    ('action', action_column, probe.combat_action_table_name, action),
+                    ('targeting', targeting_column, probe.combat_targeting_table_name,
+                     targeting)):
+                if column is None:
+                    problem = f"{table_name} cannot be rolled for difficulty {difficulty}."
+                    if problem not in problems:
+                        problems.append(problem)
+                    continue
+                distribution = column.distribution()
+                for outcome in distribution.index:
+                    outcomes[kind].setdefault(outcome, len(outcomes[kind]))
+                results[(g, s)] = distribution
+                if kind == 'action':
+                    statuses[(g, s)] = column.status_distribution()
+
+    def expected(results, columns):
+        # The chance of each outcome in each state of each group, weighted by how
+        # many of the group are expected in that state each round.
+        table = np.zeros((len(groups), len(states), len(columns)))
+        for (g, s), distribution in results.items():
+            if isinstance(distribution, pd.Series):
+                table[g, s, [columns[outcome] for outcome in distribution.index]] = \
+                    distribution.to_numpy()
+            else:
+                table[g, s] = distribution
+        counts = np.einsum('kgs,gso->ko', occupancy, table)
+        return pd.DataFrame(counts, columns=list(columns)).rename_axis('Round')
+
+    labels = [stance if variant_model is None else f"{stance} / {state_variant}"
+              for stance, state_variant in states]
+    occupancy_table = pd.DataFrame(occupancy.sum(axis=1), columns=labels).rename_axis('Round')
+    return StanceForecast(
+        occupancy=occupancy_table.loc[:, occupancy_table.sum(axis=0) > 0],
+        action=expected(action, outcomes['action']),
+        targeting=expected(targeting, outcomes['targeting']),
+        combat_status=expected(statuses, {status: i for i, status
+                                          in enumerate(COMBAT_STATUSES)}),
+        problems=problems)
+
+
+def advance_stances(characters, stance_model, rng, variant_model=None):
+    """
+    This function moves every character on to the stance, and role variant if
+    variant_model is given, drawn for the next round, as the GM would with
+    Character.update_status(). Characters whose stance and variant stay the same
+    are left alone.
+    :param characters: iterable of Character or CombatantProxy, required
+    :param stance_model: TransitionModel, required
+    :param rng: np.random.Generator, required, e.g. RandomStreams.transition_generator()
+    :param variant_model: TransitionModel, optional
+    :return: list of (character, old stance, old variant) for each one that changed
+    """
+    changed = []
+    for character in characters:
+        stance = stance_model.step(character.combat_stance, rng)
+        variant = character.role_variant
+        if variant_model is not None:
+            variant = variant_model.step(variant, rng)
+        if stance == character.combat_stance and variant == character.role_variant:
+            continue
+        changed.append((character, character.combat_stance, character.role_variant))
+        character.update_status(character.name, character.combat_role, stance,
+                                character.difficulty, variant, character.level)
+    return changed
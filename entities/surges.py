@@ -0,0 +1,161 @@
+import logging
+
+import pandas as pd
+
+from .diagnostics import PERFORMANCE
+from .outcomes import OUTCOMES, split_action
+
+logger = logging.getLogger(__name__)
+
+EFFECT_LEVELS = ['Minor', 'Major']
+INDIVIDUAL_LEVEL = ['Low', 'Moderate', 'Advanced', 'Elite']
+EFFECT_COLUMNS = [f"{effect_level} {level}" for effect_level in EFFECT_LEVELS
+                  for level in INDIVIDUAL_LEVEL]
+# Event type, as written after the effect level in an action, and the
+# configuration worksheet it is looked up in.
+EVENT_WORKSHEETS = {'Surge': 'Combat Surges', 'Lull': 'Combat Lulls'}
+
+
+class SurgeLullIndex:
+    """
+    This object holds the Combat Surges and Combat Lulls worksheets compiled
+    into one dict keyed by (event type, base outcome, effect level, individual
+    level), e.g. ('Surge', 'Attack Main', 'Minor', 'Elite'), so looking up the
+    effect of a roll is a single dict access.
+
+    Problems with the worksheets, such as missing columns, blank or duplicate
+    outcomes and outcomes that are not in Combat Outcomes, are collected in
+    problems when the index is built rather than surfacing when a surge or lull
+    is rolled. Blank effect cells are left out of the index.
+    :param effects: dict of str, required
+    :param problems: list of str, optional
+    """
+    def __init__(self, effects, problems=None):
+        self.effects = effects
+        self.problems = problems or []
+
+    @classmethod
+    @PERFORMANCE.timed('build_surge_lull_index')
+    def from_tables(cls, combat_surges=None, combat_lulls=None, combat_outcomes=None):
+        """
+        This class method compiles the surge and lull worksheets, either of which
+        may be None if it is not configured.
+        :param combat_surges: pd.DataFrame, optional
+        :param combat_lulls: pd.DataFrame, optional
+        :param combat_outcomes: list of str, optional, the outcomes from the
+            Combat Outcomes worksheet to check the worksheets against
+        :return: SurgeLullIndex
+        """
+        effects = {}
+        problems = []
+        known = None
+        if combat_outcomes is not None:
+            known = {str(outcome).strip() for outcome in combat_outcomes}
+        for event_type, table in (('Surge', combat_surges), ('Lull', combat_lulls)):
+            if table is None:
+                continue
+            worksheet = EVENT_WORKSHEETS[event_type]
+            headers = {str(col).strip(): col for col in table.columns}
+            missing = [col for col in ['Outcome'] + EFFECT_COLUMNS if col not in headers]
+            if missing:
+                problems.append(f"{worksheet} is missing the columns {missing}.")
+            if 'Outcome' not in headers:
+                continue
+            seen = set()
+            for row, outcome in table[headers['Outcome']].items():
+                if not isinstance(outcome, str) or not outcome.strip():
+                    problems.append(f"{worksheet}, row {row + 2}: the Outcome is blank.")
+                    continue
+                outcome = outcome.strip()
+                if outcome in seen:
+                    problems.append(f"{worksheet}, row {row + 2}: {outcome!r} is listed "
+                                    f"more than once.")
+                    continue
+                seen.add(outcome)
+                if known is not None and outcome not in known:
+                    problems.append(f"{worksheet}, row {row + 2}: {outcome!r} is not in "
+                                    f"Combat Outcomes.")
+                for column in EFFECT_COLUMNS:
+                    if column not in headers:
+                        continue
+                    text = table.at[row, headers[column]]
+                    if pd.isna(text) or not str(text).strip():
+                        continue
+                    effect_level, level = column.split(' ')
+                    effects[(event_type, outcome, effect_level, level)] = str(text).strip()
+        for problem in problems:
+            logger.warning("SurgeLullIndex: %s", problem)
+        return cls(effects, problems)
+
+    def __len__(self):
+        return len(self.effects)
+
+    def text(self, event_type, outcome, effect_level, level):
+        """This method returns the text of one effect, or None if it is not
+        defined."""
+        return self.effects.get((event_type, outcome, effect_level, level))
+
+    @PERFORMANCE.timed('surge_lull_lookup')
+    def lookup(self, action, level):
+        """
+        This method returns the effect of a rolled action for an individual
+        level, written as e.g. 'Minor Surge: effect text', or None if the action
+        has no surge or lull or no effect is defined for it.
+        :param action: str, required
+        :param level: str, required, chosen from INDIVIDUAL_LEVEL
+        :return: str or None
+        """
+        parts = split_action(action)
+        if parts is None:
+            return None
+        base, effect_level, event_type = parts
+        text = self.effects.get((event_type, base, effect_level, level))
+        if text is None:
+            return None
+        return f"{effect_level} {event_type}: {text}"
+
+    @PERFORMANCE.timed('surge_lull_lookup')
+    def lookup_id(self, outcome_id, level):
+        """
+        This method returns the same as lookup() for an OUTCOMES ID, using the
+        base action, effect level and event type worked out when the outcome
+        was interned rather than splitting its text again.
+        :param outcome_id: int, required
+        :param level: str, required, chosen from INDIVIDUAL_LEVEL
+        :return: str or None
+        """
+        outcome = OUTCOMES[outcome_id]
+        if outcome.event_type is None:
+            return None
+        text = self.effects.get((outcome.event_type, outcome.base_action,
+                                 outcome.effect_level, level))
+        if text is None:
+            return None
+        return f"{outcome.effect_level} {outcome.event_type}: {text}"
+
+    def check_actions(self, actions, levels=INDIVIDUAL_LEVEL):
+        """
+        This method returns a problem for every action in a combat table that
+        names a surge or lull with no effect defined for some individual level,
+        or whose effect level is not Minor or Major. Actions such as
+        'Use/Defend' that do not end in a surge or lull are not checked.
+        :param actions: iterable of str, required
+        :param levels: list of str, optional, defaults to INDIVIDUAL_LEVEL
+        :return: list of str
+        """
+        problems = []
+        for action in sorted({a for a in actions if isinstance(a, str)}):
+            parts = split_action(action)
+            if parts is None:
+                continue
+            base, effect_level, event_type = parts
+            if effect_level not in EFFECT_LEVELS:
+                problems.append(f"Action {action!r} has effect level {effect_level!r}, "
+                                f"expected one of {EFFECT_LEVELS}.")
+                continue
+            missing = [level for level in levels
+                       if (event_type, base, effect_level, level) not in self.effects]
+            if missing:
+                problems.append(f"Action {action!r} has no {EVENT_WORKSHEETS[event_type]} "
+                                f"effect for {missing}.")
+        return problems
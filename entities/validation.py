@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from .workbook_cache import WORKBOOK_CACHE
+
+DIFFICULTY_VARIATIONS = ['A', 'B', 'C', 'D']
+COMBAT_TABLE_COLUMNS = DIFFICULTY_VARIATIONS + ['Outcome']
+# A single integer or two integers joined by a dash, e.g. '07' or '01-16'.
+TABLE_ITEM_PATTERN = r'^\s*(\d+)(?:-(\d+))?\s*$'
+VALIDATION_KEY = 'validation'
+# Integers written as zeros, e.g. '0' or '00', stand for this value.
+ZERO_VALUE = 100
+
+
+def table_value(digits: str):
+    """This function returns the integer written by a string of digits in a table
+    item, with integers written as zeros counting as ZERO_VALUE, as they do in
+    validate_combat_table()."""
+    value = int(digits)
+    return ZERO_VALUE if value == 0 else value
+
+
+def validate_combat_table(table: pd.DataFrame):
+    """
+    This function validates one combat action or targeting table and returns a
+    list of error messages, which is empty if the table is usable. The rules
+    are the ones described in the ReadMe and applied by Character.check_item()
+    and Character.check_series(), checked for every difficulty column at once
+    with vectorized string parsing:
+
+    - The columns must be A, B, C, D and Outcome, ignoring surrounding spaces.
+    - Every cell in A to D must be a dash, an integer or a 'low-high' range.
+    - Integers written as zeros count as ZERO_VALUE, 100, so '91-00' is a valid
+      range.
+    - A range's low value must be less than its high value.
+    - Ignoring dashes, each column must start at 1 and continue without gaps or
+      overlaps. A column of only dashes is unused and is not an error.
+    :param table: pd.DataFrame, required
+    :return: list of str
+    """
+    columns = [str(col).strip() for col in table.columns]
+    if columns != COMBAT_TABLE_COLUMNS:
+        return [f"Columns are {columns}, expected {COMBAT_TABLE_COLUMNS}."]
+
+    errors = []
+    for col, difficulty in zip(table.columns, DIFFICULTY_VARIATIONS):
+        series = table[col].astype(object)
+        used = series[series != '-']
+        if used.empty:
+            continue
+        parts = used.where(used.map(type) == str).str.extract(TABLE_ITEM_PATTERN)
+        malformed = parts[0].isna()
+        for row, item in used[malformed].items():
+            errors.append(f"Column {difficulty}, row {row + 2}: {item!r} is not a dash, "
+                          f"an integer or a range.")
+        if malformed.any():
+            continue
+
+        low = parts[0].astype(np.int64).to_numpy()
+        is_range = parts[1].notna().to_numpy()
+        high = parts[1].fillna('0').astype(np.int64).to_numpy()
+        low = np.where((low == 0) & ~is_range, ZERO_VALUE, low)
+        high = np.where(high == 0, ZERO_VALUE, high)
+        end = np.where(is_range, high, low)
+        previous = np.concatenate(([0], end[:-1]))
+        rows = used.index.to_numpy() + 2
+
+        for idx in np.nonzero(is_range & (low >= high))[0]:
+            errors.append(f"Column {difficulty}, row {rows[idx]}: range {used.iloc[idx]!r} "
+                          f"does not go from low to high.")
+        for idx in np.nonzero(low > previous + 1)[0]:
+            if low[idx] - previous[idx] == 2:
+                missing = f"value {previous[idx] + 1} is"
+            else:
+                missing = f"values {previous[idx] + 1} to {low[idx] - 1} are"
+            errors.append(f"Column {difficulty}, row {rows[idx]}: gap, {missing} missing.")
+        for idx in np.nonzero(low <= previous)[0]:
+            errors.append(f"Column {difficulty}, row {rows[idx]}: {used.iloc[idx]!r} "
+                          f"overlaps values up to {previous[idx]}.")
+    return errors
+
+
+def validate_sheet(filepath, sheet_name):
+    """This function returns the errors for one worksheet of a combat workbook.
+    The result is cached with the worksheet in WORKBOOK_CACHE, so each sheet is
+    validated only once no matter how many characters use it. It raises
+    ValueError if the worksheet does not exist."""
+    return WORKBOOK_CACHE.get_derived(filepath, sheet_name, VALIDATION_KEY,
+                                      validate_combat_table)
+
+
+def validate_workbook(filepath, sheet_names=None):
+    """
+    This function validates every combat table in a workbook, or only the ones
+    in sheet_names, and returns a report as a dict of worksheet name to a list
+    of error messages. Valid worksheets have an empty list. Worksheets with no
+    cells at all, such as placeholders, are left out of the report.
+    :param filepath: str, required
+    :param sheet_names: list of str, optional, defaults to every worksheet
+    :return: dict of list of str
+    """
+    if sheet_names is None:
+        sheet_names = WORKBOOK_CACHE.get_sheet_names(filepath)
+    report = {}
+    for sheet_name in sheet_names:
+        table = WORKBOOK_CACHE.get_sheet(filepath, sheet_name)
+        if table.shape == (0, 0):
+            continue
+        report[sheet_name] = validate_sheet(filepath, sheet_name)
+    return report
+
+
+def validate_surge_lull_actions(filepath, surge_lull_index, sheet_names=None):
+    """
+    This function checks every surge and lull action in a combat workbook
+    against a SurgeLullIndex and returns the problems found, including the ones
+    found when the index was built. Worksheets without an Outcome column are
+    left out, as validate_workbook() reports them already.
+    :param filepath: str, required
+    :param surge_lull_index: SurgeLullIndex, required
+    :param sheet_names: list of str, optional, defaults to every worksheet
+    :return: list of str
+    """
+    if sheet_names is None:
+        sheet_names = WORKBOOK_CACHE.get_sheet_names(filepath)
+    actions = set()
+    for sheet_name in sheet_names:
+        table = WORKBOOK_CACHE.get_sheet(filepath, sheet_name)
+        for col in table.columns:
+            if str(col).strip() == 'Outcome':
+                actions.update(table[col].tolist())
+    return surge_lull_index.problems + surge_lull_index.check_actions(actions)
+
+
+def format_report(report, checks=None):
+    """This function turns a report from validate_workbook() into text with one
+    line per error, grouped by worksheet, followed by a summary line. Problems
+    from checks that are not about one worksheet, such as
+    validate_surge_lull_actions(), are given in checks, a dict of check name to
+    list of str, and listed after the worksheets with a summary line of their own."""
+    lines = []
+    invalid = 0
+    for sheet_name, errors in report.items():
+        if not errors:
+            continue
+        invalid += 1
+        lines.append(f"{sheet_name}:")
+        lines.extend(f"    {error}" for error in errors)
+    lines.append(f"{len(report)} worksheets validated, {invalid} invalid.")
+    if checks:
+        for name, problems in checks.items():
+            if problems:
+                lines.append(f"{name}:")
+                lines.extend(f"    {problem}" for problem in problems)
+        failed = sum(1 for problems in checks.values() if problems)
+        lines.append(f"{len(checks)} other checks run, {failed} with problems.")
+    return '\n'.join(lines)
+
+
+def non_string_cells(table: pd.DataFrame):
+    """This function returns a list of (column, value) pairs for every cell in
+    a configuration table that is not text, checking one column at a time."""
+    result = []
+    for col in table.columns:
+        series = table[col].astype(object)
+        bad = series[series.map(type) != str]
+        result.extend((col, value) for value in bad.tolist())
+    return result
@@ -0,0 +1,286 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from .diagnostics import PERFORMANCE
+from .sidecar import SidecarWorkbook, content_hash, open_workbook, sheet_hash, sidecar_path
+
+DEFAULT_MAX_SHEETS = 256
+# Name of the sheet hashes kept with each worksheet when there is no sidecar.
+HASH_KEY = 'sheet_hash'
+
+
+class WorkbookCache:
+    """
+    This object keeps opened Excel workbooks and the worksheets parsed from
+    them so that every Character and every combat window can share them
+    instead of re-reading the workbook for each table.
+
+    Workbooks are keyed by their absolute path, modification time and size.
+    When any of those change on disk, the old workbook and every worksheet
+    parsed from it are dropped and the file is opened again. Parsed
+    worksheets are kept in least recently used order and the oldest are
+    evicted once more than max_sheets are held.
+
+    With use_sidecar, workbooks are opened through their compiled sidecar
+    (see entities.sidecar), which is rebuilt automatically when the content
+    of the workbook changes. Otherwise they are read with pd.ExcelFile.
+
+    Values derived from a worksheet, such as its validation result, can be
+    kept with it through get_derived() and are dropped whenever the worksheet
+    is. Values derived from the list of worksheet names, such as the sheet
+    index, are kept with the workbook through get_workbook_derived().
+
+    Worksheets returned by this cache are shared between all callers and
+    must not be modified in place. The cache can be used from more than one
+    thread, e.g. to prefetch worksheets in the background. Workbooks are opened,
+    worksheets parsed and derived values computed without holding the cache's
+    lock, so a thread reading the workbook does not hold up threads reading
+    cached worksheets.
+    :param max_sheets: int, optional, defaults to DEFAULT_MAX_SHEETS
+    :param use_sidecar: bool, optional, defaults to True
+    """
+    def __init__(self, max_sheets=DEFAULT_MAX_SHEETS, use_sidecar=True):
+        self.max_sheets = max_sheets
+        self.use_sidecar = use_sidecar
+        self._workbooks = {}
+        self._sheets = OrderedDict()
+        self._derived = {}
+        self._workbook_derived = {}
+        self._lock = threading.RLock()
+        # One lock per workbook path, held while it is opened or one of its
+        # worksheets parsed. See _open() and _get_sheet().
+        self._path_locks = {}
+
+    @staticmethod
+    def workbook_key(filepath):
+        """This static method returns the key used to identify the current
+        version of a workbook on disk: its absolute path, modification time
+        in nanoseconds and size in bytes."""
+        path = os.path.abspath(filepath)
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def get_workbook(self, filepath):
+        """This method returns the opened workbook for filepath, opening it again
+        if the file has changed since it was last opened.
+        :param filepath: str, required
+        :return: SidecarWorkbook or pd.ExcelFile
+        """
+        key, xls = self._open(filepath)
+        return xls
+
+    def get_sheet_names(self, filepath):
+        """This method returns the list of worksheet names in filepath without
+        parsing any of the worksheets."""
+        key, xls = self._open(filepath)
+        return xls.sheet_names
+
+    def get_sheet(self, filepath, sheet_name):
+        """This method returns the worksheet sheet_name from filepath as a
+        pd.DataFrame, parsing it only if it is not already cached. Like
+        pd.read_excel(), it raises ValueError if the worksheet does not exist.
+        :param filepath: str, required
+        :param sheet_name: str, required
+        :return: pd.DataFrame
+        """
+        key, xls = self._open(filepath)
+        return self._get_sheet(key, xls, sheet_name)
+
+    def get_sheet_hashes(self, filepath):
+        """This method returns sheet_hash() of every worksheet in filepath as a dict
+        of worksheet name to str. With use_sidecar they were saved when the sidecar
+        was built and no worksheet is parsed. Otherwise every worksheet is parsed
+        and its hash kept with it."""
+        key, xls = self._open(filepath)
+        hashes = getattr(xls, 'sheet_hashes', None)
+        if hashes is not None:
+            return dict(hashes)
+        return {sheet_name: self.get_derived(filepath, sheet_name, HASH_KEY, sheet_hash)
+                for sheet_name in xls.sheet_names}
+
+    def get_derived(self, filepath, sheet_name, name, factory):
+        """This method returns a value computed from a worksheet by calling
+        factory(table), computing it only once for each version of the workbook.
+        Like get_sheet(), it raises ValueError if the worksheet does not exist.
+        :param filepath: str, required
+        :param sheet_name: str, required
+        :param name: str, required, identifies the kind of derived value
+        :param factory: callable, required, takes the pd.DataFrame
+        :return: the value returned by factory
+        """
+        key, xls = self._open(filepath)
+        table = self._get_sheet(key, xls, sheet_name)
+        with self._lock:
+            derived = self._derived.get((key, sheet_name), {})
+            if name in derived:
+                return derived[name]
+        # The factory runs without the lock, so other threads are not held up
+        # by it. If two threads compute the same value, the first one is kept.
+        value = factory(table)
+        with self._lock:
+            if (key, sheet_name) not in self._sheets:
+                # The worksheet was evicted meanwhile, and its values with it.
+                return value
+            return self._derived.setdefault((key, sheet_name), {}).setdefault(name, value)
+
+    def get_workbook_derived(self, filepath, name, factory):
+        """This method returns a value computed from the worksheet names of a
+        workbook by calling factory(sheet_names), computing it only once for each
+        version of the workbook. No worksheet is parsed.
+        :param filepath: str, required
+        :param name: hashable, required, identifies the kind of derived value
+        :param factory: callable, required, takes the list of str
+        :return: the value returned by factory
+        """
+        key, xls = self._open(filepath)
+        with self._lock:
+            derived = self._workbook_derived.setdefault(key, {})
+            if name in derived:
+                return derived[name]
+        value = factory(xls.sheet_names)
+        with self._lock:
+            return self._workbook_derived.setdefault(key, {}).setdefault(name, value)
+
+    def set_derived(self, filepath, sheet_name, name, value):
+        """This method installs a value derived from a worksheet elsewhere, for
+        example a validation result saved with a session, so get_derived() returns
+        it without calling its factory. A value already held is kept. Like
+        get_sheet(), it raises ValueError if the worksheet does not exist."""
+        key, xls = self._open(filepath)
+        self._get_sheet(key, xls, sheet_name)
+        with self._lock:
+            if (key, sheet_name) in self._sheets:
+                self._derived.setdefault((key, sheet_name), {}).setdefault(name, value)
+
+    def preload(self, filepath, tables):
+        """This method installs worksheets that were parsed elsewhere, for example
+        by load_all_combat_tables(), as the current version of filepath. The cache
+        grows to hold at least every worksheet of the workbook. With use_sidecar,
+        the sidecar is rebuilt from them so the next session does not have to parse
+        the workbook at all.
+        :param filepath: str, required
+        :param tables: dict of pd.DataFrame, required, every worksheet in the workbook
+        """
+        key = self.workbook_key(filepath)
+        path = key[0]
+        if self.use_sidecar:
+            xls = SidecarWorkbook.from_dataframes(content_hash(path), tables)
+            try:
+                xls.save(sidecar_path(path))
+            except OSError:
+                # The sidecar is only a speed up for the next session.
+                pass
+        else:
+            xls = pd.ExcelFile(path)
+        with self._lock:
+            # Every worksheet of the workbook is wanted, so none of them should be
+            # evicted as soon as it is installed.
+            self.max_sheets = max(self.max_sheets, len(tables))
+            self._drop_workbook(path)
+            self._workbooks[path] = (key, xls)
+            for sheet_name, table in tables.items():
+                self._sheets[(key, sheet_name)] = table
+            self._evict()
+
+    def clear(self):
+        """This method closes every cached workbook and drops all parsed
+        worksheets."""
+        with self._lock:
+            for key, xls in self._workbooks.values():
+                xls.close()
+            self._workbooks.clear()
+            self._sheets.clear()
+            self._derived.clear()
+            self._workbook_derived.clear()
+
+    def _get_sheet(self, key, xls, sheet_name):
+        # Like _open(), a worksheet is parsed without holding self._lock, so one
+        # thread parsing does not hold up threads reading cached worksheets. Only
+        # one thread parses from each workbook at a time, as a pd.ExcelFile cannot
+        # be shared. Callers must not hold self._lock.
+        sheet_key = (key, sheet_name)
+        with self._lock:
+            cached = self._cached_sheet(sheet_key)
+            if cached is not None:
+                return cached
+            if sheet_name not in xls.sheet_names:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+            path_lock = self._path_lock(key[0])
+        with path_lock:
+            with self._lock:
+                cached = self._cached_sheet(sheet_key)
+                if cached is not None:
+                    # Another thread parsed it while this one waited.
+                    return cached
+            with PERFORMANCE.timer('parse_sheet'):
+                table = xls.parse(sheet_name)
+            with self._lock:
+                entry = self._workbooks.get(key[0])
+                if entry is not None and entry[0] == key:
+                    # Worksheets of a version replaced meanwhile are not kept.
+                    self._sheets[sheet_key] = table
+                    self._evict()
+                return table
+
+    def _cached_sheet(self, sheet_key):
+        table = self._sheets.get(sheet_key)
+        if table is not None:
+            self._sheets.move_to_end(sheet_key)
+        return table
+
+    def _path_lock(self, path):
+        return self._path_locks.setdefault(path, threading.Lock())
+
+    def _evict(self):
+        while len(self._sheets) > self.max_sheets:
+            evicted_key, evicted_table = self._sheets.popitem(last=False)
+            self._derived.pop(evicted_key, None)
+
+    def _drop_workbook(self, path):
+        entry = self._workbooks.pop(path, None)
+        if entry is None:
+            return
+        old_key, old_xls = entry
+        old_xls.close()
+        self._workbook_derived.pop(old_key, None)
+        for sheet_key in [k for k in self._sheets if k[0] == old_key]:
+            del self._sheets[sheet_key]
+            self._derived.pop(sheet_key, None)
+
+    def _open(self, filepath):
+        # Opening a workbook hashes the file and may parse all of it, so it is done
+        # without holding self._lock, letting other threads use worksheets that are
+        # already cached. Only one thread opens each path at a time. Callers must
+        # not hold self._lock.
+        key = self.workbook_key(filepath)
+        path = key[0]
+        with self._lock:
+            entry = self._workbooks.get(path)
+            if entry is not None and entry[0] == key:
+                return entry
+            path_lock = self._path_lock(path)
+        with path_lock:
+            with self._lock:
+                entry = self._workbooks.get(path)
+                if entry is not None and entry[0] == key:
+                    # Another thread opened it while this one waited.
+                    return entry
+            with PERFORMANCE.timer('open_workbook'):
+                if self.use_sidecar:
+                    xls = open_workbook(path)
+                else:
+                    xls = pd.ExcelFile(path)
+            with self._lock:
+                # The workbook is new or changed on disk. Anything parsed from an
+                # old version is stale.
+                self._drop_workbook(path)
+                entry = (key, xls)
+                self._workbooks[path] = entry
+                return entry
+
+
+# Process-wide cache shared by every Character and combat window.
+WORKBOOK_CACHE = WorkbookCache()
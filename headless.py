@@ -0,0 +1,166 @@
+"""
+Headless combat simulation runner. It uses the same workbooks as the GUI but
+never imports PySide6, so it runs on machines without a display.
+
+Example:
+    python headless.py --roster roster.csv --events 100 --output results.csv
+    python headless.py --validate
+    python headless.py --roster roster.csv --monte-carlo 100000 --rounds 10
+"""
+import argparse
+import atexit
+import csv
+import sys
+
+from entities import (PERFORMANCE, build_surge_lull_index, configure_logging,
+                      configure_performance, format_report, load_all_combat_tables,
+                      load_configuration_tables, load_roster_store, run_store_event,
+                      sheet_availability, simulate_encounters, validate_surge_lull_actions,
+                      validate_workbook)
+
+CONFIGURATION_FILEPATH = 'data/configuration-tables.xlsx'
+COMBAT_TABLES_FILEPATH = 'data/combat-tables.xlsx'
+RESULT_COLUMNS = ['event', 'name', 'action', 'target', 'combat_status', 'effect']
+
+
+def run_headless(roster_filepath, events, output,
+                 config_filepath=CONFIGURATION_FILEPATH,
+                 combat_tables_filepath=COMBAT_TABLES_FILEPATH, seed=None):
+    """
+    This function loads the configuration tables and the roster, runs the
+    requested number of events and writes one CSV row per combatant per event
+    to output. The same seed and roster always give the same results.
+    :param roster_filepath: str, required
+    :param events: int, required
+    :param output: file object opened for text writing, required
+    :param config_filepath: str, optional, defaults to CONFIGURATION_FILEPATH
+    :param combat_tables_filepath: str, optional, defaults to COMBAT_TABLES_FILEPATH
+    :param seed: int, optional, defaults to fresh entropy, which is written to stderr
+    :return: int, the number of result rows written
+    """
+    required_config_dfs, optional_config_dfs = load_configuration_tables(config_filepath)
+    surge_lull_index = build_surge_lull_index(required_config_dfs, optional_config_dfs)
+    store = load_roster_store(roster_filepath, combat_tables_filepath, seed)
+    if seed is None:
+        print(f"Seed: {store.streams.seed}", file=sys.stderr)
+    writer = csv.DictWriter(output, fieldnames=RESULT_COLUMNS)
+    writer.writeheader()
+    rows = 0
+    for event in range(1, events + 1):
+        for result in run_store_event(store, surge_lull_index):
+            result['event'] = event
+            writer.writerow(result)
+            rows += 1
+    return rows
+
+
+def run_monte_carlo(roster_filepath, encounters, rounds, output,
+                    combat_tables_filepath=COMBAT_TABLES_FILEPATH, seed=None,
+                    max_workers=None):
+    """
+    This function runs encounters of several rounds for the roster with
+    simulate_encounters(), writes one CSV row per combatant and outcome with the
+    number of times it was rolled to output, and writes the surge and lull
+    summary to stderr. The same seed and roster always give the same counts,
+    however many workers are used.
+    :param roster_filepath: str, required
+    :param encounters: int, required
+    :param rounds: int, required, events per encounter
+    :param output: file object opened for text writing, required
+    :param combat_tables_filepath: str, optional, defaults to COMBAT_TABLES_FILEPATH
+    :param seed: int, optional, defaults to fresh entropy, which is written to stderr
+    :param max_workers: int, optional, defaults to the number of CPU cores
+    :return: MonteCarloResult
+    """
+    store = load_roster_store(roster_filepath, combat_tables_filepath, seed)
+    if seed is None:
+        print(f"Seed: {store.streams.seed}", file=sys.stderr)
+    result = simulate_encounters(store, encounters, rounds, max_workers)
+    result.long_table().to_csv(output, index=False)
+    print(result.format_summary(), file=sys.stderr)
+    return result
+
+
+def table_name_problems(combat_tables_filepath, required_config_dfs, optional_config_dfs):
+    """This function returns the combat table names of the configured roles,
+    variants and stances that Excel's 31 character limit cuts to the same
+    worksheet name."""
+    def first_column(df):
+        return None if df is None else df[df.columns[0]].tolist()
+    return sheet_availability(combat_tables_filepath,
+                              first_column(required_config_dfs['Combat Roles']),
+                              first_column(optional_config_dfs['Combat Role Variations']),
+                              first_column(required_config_dfs['Combat Stances'])).problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run combat simulations without the GUI.")
+    parser.add_argument('--roster',
+                        help="CSV file with columns name, role, variant, stance, "
+                             "difficulty and level.")
+    parser.add_argument('--events', type=int, default=1,
+                        help="Number of events to run. Defaults to 1.")
+    parser.add_argument('--output', default=None,
+                        help="File to write the CSV results to. Defaults to stdout.")
+    parser.add_argument('--config', default=CONFIGURATION_FILEPATH,
+                        help=f"Configuration workbook. Defaults to {CONFIGURATION_FILEPATH}.")
+    parser.add_argument('--combat-tables', default=COMBAT_TABLES_FILEPATH,
+                        help=f"Combat tables workbook. Defaults to {COMBAT_TABLES_FILEPATH}.")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Master seed for the random rolls, to repeat a run exactly.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Load every combat table up front with this many processes, "
+                             "and run --monte-carlo with as many. Use 0 for one per CPU "
+                             "core, the default for --monte-carlo.")
+    parser.add_argument('--monte-carlo', type=int, default=None, metavar='ENCOUNTERS',
+                        help="Run this many encounters and write how often each combatant "
+                             "rolled each outcome instead of every roll.")
+    parser.add_argument('--rounds', type=int, default=1,
+                        help="Events in each --monte-carlo encounter. Defaults to 1.")
+    parser.add_argument('--validate', action='store_true',
+                        help="Validate every combat table and every surge and lull they "
+                             "name, print a report and exit.")
+    parser.add_argument('--debug', action='store_true',
+                        help="Write every diagnostic message to stderr.")
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='FILE',
+                        help="Time every phase and write a summary to stderr, and to "
+                             "FILE as JSON if given.")
+    args = parser.parse_args(argv)
+    configure_logging(args.debug)
+    if args.profile is not None:
+        configure_performance(True, args.profile or None)
+        atexit.register(lambda: print(PERFORMANCE.format_summary(), file=sys.stderr))
+
+    if args.workers is not None:
+        load_all_combat_tables(args.combat_tables, max_workers=args.workers or None)
+    if args.validate:
+        report = validate_workbook(args.combat_tables)
+        required_config_dfs, optional_config_dfs = load_configuration_tables(args.config)
+        surge_lull_index = build_surge_lull_index(required_config_dfs, optional_config_dfs)
+        checks = {'Combat Surges and Lulls':
+                  validate_surge_lull_actions(args.combat_tables, surge_lull_index),
+                  'Combat Table Names':
+                  table_name_problems(args.combat_tables, required_config_dfs,
+                                      optional_config_dfs)}
+        print(format_report(report, checks))
+        return 1 if any(report.values()) or any(checks.values()) else 0
+    if not args.roster:
+        parser.error("--roster is required unless --validate is used.")
+    if args.monte_carlo is not None:
+        def run(output):
+            run_monte_carlo(args.roster, args.monte_carlo, args.rounds, output,
+                            args.combat_tables, args.seed, args.workers or None)
+    else:
+        def run(output):
+            run_headless(args.roster, args.events, output, args.config,
+                         args.combat_tables, args.seed)
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            run(output)
+    else:
+        run(sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
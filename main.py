@@ -1,16 +1,26 @@
-import pandas as pd
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QFileDialog,
                                QMessageBox, QApplication, QMainWindow, QStatusBar,
                                QLabel, QHBoxLayout)
-from classes import ConfigurationWindow, CombatModelerWindow
+from PySide6.QtCore import QThreadPool
+from classes import (ConfigurationWindow, CombatModelerWindow, DiagnosticsWindow,
+                     TableLoadWorker, WorkbookWatcher)
+from entities import (configure_logging, configure_performance, non_string_cells,
+                      sidecar_is_fresh, WORKBOOK_CACHE)
+import logging
 import sys
 import os
 
+logger = logging.getLogger(__name__)
+
 CONFIGURATION_FILEPATH = 'data/configuration-tables.xlsx'
 COMBAT_TABLES_FILEPATH = 'data/combat-tables.xlsx'
 REQUIRED_WORKSHEETS = ['Combat Outcomes', 'Combat Roles', 'Combat Stances',
                        'Combat Targeting Summary']
-OPTIONAL_WORKSHEETS = ['Combat Role Variations', 'Combat Surges', 'Combat Lulls']
+OPTIONAL_WORKSHEETS = ['Combat Role Variations', 'Combat Surges', 'Combat Lulls',
+                       'Combat Stance Transitions', 'Combat Variant Transitions']
+# First column of each transition worksheet. The other columns hold weights.
+TRANSITION_WORKSHEETS = {'Combat Stance Transitions': 'Stance',
+                         'Combat Variant Transitions': 'Role Variant'}
 DIFFICULTY_VARIATIONS = ['A', 'B', 'C', 'D']
 INDIVIDUAL_LEVEL = ['Low', 'Moderate', 'Advanced', 'Elite']
 
@@ -28,9 +38,17 @@ class StartupWindow(QMainWindow):
         self.optional_config_dfs = None
         self.config_window = None
         self.combat_window = None
+        self.diagnostics_window = None
+        self.config_status_label = None
+        self.config_watcher = None
+        self.buttons = []
+        self.load_worker = None
         self.init_ui()
         self.load_configuration_tables()
         self.validate_tables()
+        if os.path.exists(self.config_path):
+            self.config_watcher = WorkbookWatcher(self.config_path, self)
+            self.config_watcher.changed.connect(self.reload_configuration_tables)
 
     def init_ui(self):
         self.setWindowTitle('Combat Modeler')
@@ -40,9 +58,11 @@ class StartupWindow(QMainWindow):
         show_button = QPushButton("Show Configuration Tables")
         show_button.clicked.connect(self.show_configuration_tables)
         reload_config_button = QPushButton("Reload Configuration Tables")
-        reload_config_button.clicked.connect(self.load_configuration_tables)
+        reload_config_button.clicked.connect(self.reload_configuration_tables)
         start_button = QPushButton("Start Combat")
         start_button.clicked.connect(self.start_combat_window)
+        diagnostics_button = QPushButton("Show Diagnostics")
+        diagnostics_button.clicked.connect(self.show_diagnostics)
         exit_button = QPushButton("Exit")
         exit_button.clicked.connect(self.exit_app)
         self.setCentralWidget(QWidget(self))
@@ -51,44 +71,66 @@ class StartupWindow(QMainWindow):
         self.vbox.addWidget(show_button)
         self.vbox.addWidget(reload_config_button)
         self.vbox.addWidget(start_button)
+        self.vbox.addWidget(diagnostics_button)
         self.vbox.addWidget(exit_button)
+        # Disabled while the combat tables are loading in the background.
+        self.buttons = [show_button, reload_config_button, start_button, diagnostics_button,
+                        exit_button]
 
         # Create status bar.
         self.statusbar = QStatusBar()
         self.setStatusBar(self.statusbar)
+        self.config_status_label = QLabel()
+        self.statusbar.addWidget(self.config_status_label)
 
     def load_configuration_tables(self):
         if os.path.exists(self.config_path):
-            # Load Excel sheets into pandas DataFrames
-            xls = pd.ExcelFile(self.config_path)
+            # Load Excel sheets into pandas DataFrames. WORKBOOK_CACHE reads the
+            # compiled sidecar when it is fresh and rebuilds it when it is not.
             required_worksheets = REQUIRED_WORKSHEETS
             optional_worksheets = OPTIONAL_WORKSHEETS
             self.required_config_dfs = {}
             self.optional_config_dfs = {}
             for worksheet in required_worksheets:
                 try:
-                    self.required_config_dfs[worksheet] = pd.read_excel(xls, worksheet)
+                    self.required_config_dfs[worksheet] = WORKBOOK_CACHE.get_sheet(
+                        self.config_path, worksheet)
                 except ValueError:
                     QMessageBox.critical(self, "Error", f"Required {worksheet} not found in"
                                                         f" {self.config_path}")
-            print(f"self.required_config_dfs: {self.required_config_dfs}")
-            config_found_label = QLabel('Config loaded Successfully. ')
-            self.statusbar.addWidget(config_found_label)
+            logger.debug("self.required_config_dfs: %s", self.required_config_dfs)
+            status = 'Config loaded Successfully. '
 
             for worksheet in optional_worksheets:
                 try:
-                    self.optional_config_dfs[worksheet] = pd.read_excel(xls, worksheet)
-                    optional_config_loaded_label = QLabel(f'Loaded Optional {worksheet}. ')
-                    self.statusbar.addWidget(optional_config_loaded_label)
+                    self.optional_config_dfs[worksheet] = WORKBOOK_CACHE.get_sheet(
+                        self.config_path, worksheet)
+                    status += f'Loaded Optional {worksheet}. '
                 except ValueError:
                     self.optional_config_dfs[worksheet] = None
-            print(f"optional_config_dfs: {self.optional_config_dfs}")
+            logger.debug("optional_config_dfs: %s", self.optional_config_dfs)
+            # One label is reused so reloading does not add more of them.
+            self.config_status_label.setText(status)
 
         else:
             QMessageBox.critical(self, 'Fatal Error',
                                  'Required Configuration file, configuration-tables.xlsx not '
                                  'found in /data')
 
+    def reload_configuration_tables(self, changed=None):
+        """This method reloads the configuration workbook, either when it is edited
+        on disk or when Reload Configuration Tables is clicked, and passes it on to
+        an open combat window, which keeps its roster and event log.
+        :param changed: list of str, optional, the worksheets the watcher found changed
+        """
+        logger.debug("StartupWindow.reload_configuration_tables: Changed: %s", changed)
+        self.load_configuration_tables()
+        self.validate_tables()
+        if (self.combat_window is not None
+                and len(self.required_config_dfs) == len(REQUIRED_WORKSHEETS)):
+            self.combat_window.reload_configuration(self.required_config_dfs,
+                                                    self.optional_config_dfs)
+
     def validate_tables(self):
         # One error is enough to stop this software from working properly.
         # str.strip() is used to reduce the impact of typos in header columns.
@@ -97,33 +139,31 @@ class StartupWindow(QMainWindow):
             worksheet = self.required_config_dfs[title]
             if len(worksheet.columns) != 2:
                 errors += 1
-                print(f"StartupWindow.validate_tables: Required {title} has the wrong "
-                      f"number of columns.")
+                logger.warning("StartupWindow.validate_tables: Required %s has the wrong "
+                               "number of columns.", title)
             if worksheet.columns[1].strip() != 'Description':
                 errors += 1
-                print(f"StartupWindow.validate_tables: Required {title} is missing "
-                      f"'Description' column.")
+                logger.warning("StartupWindow.validate_tables: Required %s is missing "
+                               "'Description' column.", title)
             if title == "Combat Outcomes" or title == "Combat Targeting Summary":
                 if worksheet.columns[0].strip() != 'Outcome':
                     errors += 1
-                    print(f"StartupWindow.validate_tables: Required {title} is missing "
-                          f"'Outcome' column.")
+                    logger.warning("StartupWindow.validate_tables: Required %s is missing "
+                                   "'Outcome' column.", title)
             elif title == "Combat Roles" or title == "Combat Stances":
                 if worksheet.columns[0].strip() != 'Role':
                     errors += 1
-                    print(f"StartupWindow.validate_tables: Required {title} is missing "
-                          f"'Role' column.")
+                    logger.warning("StartupWindow.validate_tables: Required %s is missing "
+                                   "'Role' column.", title)
             else:
                 # There is an extra table loaded that is not required.
                 errors += 1
-                print(f"StartupWindow.validate_tables: {title} in required tables "
-                      f"is extraneous.")
-            for col in worksheet.columns:
-                for idx in worksheet.index:
-                    if not isinstance(worksheet[col][idx], str):
-                        errors += 1
-                        print(f"StartupWindow.validate_tables: Required {title} has column "
-                              f"{worksheet[col][idx]} that is not a string.")
+                logger.warning("StartupWindow.validate_tables: %s in required tables is "
+                               "extraneous.", title)
+            for col, value in non_string_cells(worksheet):
+                errors += 1
+                logger.warning("StartupWindow.validate_tables: Required %s has column %s "
+                               "with %s that is not a string.", title, col, value)
             if errors > 0:
                 error_msg = f"Format of required configuration worksheet, {title}, is invalid."
                 QMessageBox.critical(self, 'Fatal Error', error_msg)
@@ -137,44 +177,50 @@ class StartupWindow(QMainWindow):
                 if title == "Combat Role Variations":
                     if len(worksheet.columns) != 2:
                         errors += 1
-                        print(f"StartupWindow.validate_tables: Optional {title} has the wrong "
-                              f"number of columns.")
+                        logger.warning("StartupWindow.validate_tables: Optional %s has the "
+                                       "wrong number of columns.", title)
                     else:
                         df_cols = [col.strip() for col in worksheet.columns]
                         if df_cols != ['Role Variant', 'Description']:
                             errors += 1
-                            print(f"StartupWindow.validate_tables: Optional {title} has "
-                                  f"incorrect columns {df_cols}.")
-                    for col in worksheet.columns:
-                        for idx in worksheet.index:
-                            if not isinstance(worksheet[col][idx], str):
-                                errors += 1
-                                print(f"StartupWindow.validate_tables: Optional {title} has "
-                                      f"column {worksheet[col][idx]} that is not a string.")
+                            logger.warning("StartupWindow.validate_tables: Optional %s has "
+                                           "incorrect columns %s.", title, df_cols)
+                    for col, value in non_string_cells(worksheet):
+                        errors += 1
+                        logger.warning("StartupWindow.validate_tables: Optional %s has "
+                                       "column %s with %s that is not a string.", title,
+                                       col, value)
+                elif title in TRANSITION_WORKSHEETS:
+                    # The weights are numbers, and are checked when the
+                    # transitions are read by the combat window.
+                    if (len(worksheet.columns) < 2 or str(worksheet.columns[0]).strip()
+                            != TRANSITION_WORKSHEETS[title]):
+                        errors += 1
+                        logger.warning("StartupWindow.validate_tables: Optional %s is "
+                                       "missing '%s' column or weights.", title,
+                                       TRANSITION_WORKSHEETS[title])
                 else:
                     # This is either a Combat Surges or Lulls table.
                     # Construct the list of columns.
                     cols = ['Outcome']
                     min_lvls = [f"Minor {level}" for level in INDIVIDUAL_LEVEL]
-                    print(f"StartupWindow.validate_tables: min_lvls: {min_lvls}.")
+                    logger.debug("StartupWindow.validate_tables: min_lvls: %s.", min_lvls)
                     maj_lvls = [f"Major {level}" for level in INDIVIDUAL_LEVEL]
-                    print(f"StartupWindow.validate_tables: maj_lvls: {maj_lvls}.")
+                    logger.debug("StartupWindow.validate_tables: maj_lvls: %s.", maj_lvls)
                     cols.extend(min_lvls)
                     cols.extend(maj_lvls)
-                    print(f"StartupWindow.validate_tables: cols: {cols}")
+                    logger.debug("StartupWindow.validate_tables: cols: %s", cols)
                     df_cols = [col.strip() for col in worksheet.columns]
-                    print(f"StartupWindow.validate_tables: df_cols: {df_cols}")
+                    logger.debug("StartupWindow.validate_tables: df_cols: %s", df_cols)
                     if cols != df_cols:
                         errors += 1
-                        print(f"StartupWindow.validate_tables: cols and df_cols are not "
-                              f"equal in Combat Surge/Lull table {title}")
-                    for col in worksheet.columns:
-                        for idx in worksheet.index:
-                            if not isinstance(worksheet[col][idx], str):
-                                errors += 1
-                                print(f"StartupWindow.validate_tables: Combat Surge/Lull "
-                                      f"table {title} has a column {worksheet[col][idx]} "
-                                      f"that is not a string.")
+                        logger.warning("StartupWindow.validate_tables: cols and df_cols are "
+                                       "not equal in Combat Surge/Lull table %s", title)
+                    for col, value in non_string_cells(worksheet):
+                        errors += 1
+                        logger.warning("StartupWindow.validate_tables: Combat Surge/Lull "
+                                       "table %s has column %s with %s that is not a "
+                                       "string.", title, col, value)
             if errors > 0:
                 error_msg = f"Format of optional configuration worksheet, {title}, is invalid."
                 QMessageBox.critical(self, 'Fatal Error', error_msg)
@@ -185,16 +231,70 @@ class StartupWindow(QMainWindow):
         self.config_window.exec()
 
     def start_combat_window(self):
+        # Characters load their tables lazily, so with a fresh sidecar opening
+        # the window only builds widgets. Otherwise the workbook is parsed up
+        # front on a worker thread, across all CPU cores, and the sidecar is
+        # rebuilt before the window opens.
+        if self.load_worker is not None:
+            return
+        if sidecar_is_fresh(COMBAT_TABLES_FILEPATH):
+            self.open_combat_window()
+            return
+        self.set_loading(True)
+        self.load_worker = TableLoadWorker(COMBAT_TABLES_FILEPATH)
+        self.load_worker.signals.progress.connect(self.show_load_progress)
+        self.load_worker.signals.finished.connect(self.load_finished)
+        self.load_worker.signals.failed.connect(self.load_failed)
+        QThreadPool.globalInstance().start(self.load_worker)
+
+    def open_combat_window(self):
         self.combat_window = CombatModelerWindow(self.required_config_dfs,
                                                  self.optional_config_dfs,
                                                  COMBAT_TABLES_FILEPATH)
         self.combat_window.show()
 
+    def set_loading(self, loading):
+        """This method disables the buttons while the combat tables are loading, so
+        a second load or window cannot be started and the program cannot exit
+        under the worker."""
+        for button in self.buttons:
+            button.setEnabled(not loading)
+
+    def load_finished(self):
+        self.load_worker = None
+        self.set_loading(False)
+        self.statusbar.showMessage("Loaded the combat tables.", 3000)
+        self.open_combat_window()
+
+    def load_failed(self, message):
+        self.load_worker = None
+        self.set_loading(False)
+        QMessageBox.critical(self, 'Error', f"Could not load the combat tables: {message}")
+
+    def show_diagnostics(self):
+        self.diagnostics_window = DiagnosticsWindow(self)
+        self.diagnostics_window.exec()
+
+    def show_load_progress(self, done, total):
+        self.statusbar.showMessage(f"Loaded {done} of {total} combat tables.", 3000)
+
     def exit_app(self):
         sys.exit()
 
 
 if __name__ == "__main__":
+    # --debug turns on the detailed diagnostics. Qt does not know the option,
+    # so it is removed before the arguments are handed to QApplication.
+    debug = '--debug' in sys.argv
+    if debug:
+        sys.argv.remove('--debug')
+    configure_logging(debug)
+    # --profile collects performance counters from the start, and
+    # --profile=FILE also writes them to FILE as JSON on exit.
+    profile = [arg for arg in sys.argv if arg == '--profile' or arg.startswith('--profile=')]
+    for arg in profile:
+        sys.argv.remove(arg)
+    configure_performance(bool(profile), profile[-1].partition('=')[2] if profile else None)
     sys.argv += ['-platform', 'windows:darkmode=2']
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.synthetic import generate
+from entities import COMPILED_TABLES, WORKBOOK_CACHE
+
+# A small scale, so the workbooks are written in well under a second.
+TEST_SCALE = {'roles': 2, 'variants': 1, 'stances': 2, 'rows': 6, 'outcomes': 5,
+              'combatants': 12, 'seed': 3}
+
+
+@pytest.fixture(scope='session')
+def workbooks(tmp_path_factory):
+    """The configuration workbook, combat tables workbook and roster written by
+    benchmarks.synthetic, shared by every test that only reads them."""
+    return generate(str(tmp_path_factory.mktemp('workbooks')), TEST_SCALE)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # The process-wide caches would otherwise carry worksheets between tests.
+    yield
+    WORKBOOK_CACHE.clear()
+    COMPILED_TABLES.clear()
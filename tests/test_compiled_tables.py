@@ -0,0 +1,60 @@
+import random
+
+import pandas as pd
+import pytest
+
+from entities import Character, CompiledTable, validate_combat_table
+from entities.compiled_tables import upper_bound
+
+# Each column ends on an all-zero value, which counts as 100, and column C has
+# a lone 0 as its last row.
+EDGE_TABLE = pd.DataFrame({'A': ['01-50', '51-99', '00'],
+                           'B': ['01', '02-90', '91-00'],
+                           'C': ['01-98', '99', '0'],
+                           'D': ['-', '-', '-'],
+                           'Outcome': ['Low', 'Middle', 'High']})
+
+
+def expected_results(table, difficulty, monkeypatch):
+    """Rolls every value on the DataFrame with determine_result_from_table() and
+    returns the outcome of each roll."""
+    character = Character.__new__(Character)
+    filtered = table[[difficulty, 'Outcome']]
+    filtered = filtered[filtered[difficulty] != '-']
+    results = {}
+    for roll in range(1, 101):
+        monkeypatch.setattr(random, 'randint', lambda low, high, roll=roll: roll)
+        results[roll] = character.determine_result_from_table(filtered, difficulty)
+    return results
+
+
+@pytest.mark.parametrize('item, value', [('0', 100), ('00', 100), ('91-00', 100),
+                                         ('07', 7), ('01-16', 16)])
+def test_upper_bound(item, value):
+    assert upper_bound(item) == value
+
+
+def test_edge_table_is_valid():
+    assert validate_combat_table(EDGE_TABLE) == []
+
+
+@pytest.mark.parametrize('difficulty', ['A', 'B', 'C'])
+def test_lookup_matches_dataframe_on_edge_rows(difficulty, monkeypatch):
+    column = CompiledTable.from_dataframe('Edge', EDGE_TABLE).columns[difficulty]
+    expected = expected_results(EDGE_TABLE, difficulty, monkeypatch)
+    assert column.max_val == 100
+    assert {roll: column.lookup(roll) for roll in expected} == expected
+    assert column.lookup(100) == 'High'
+
+
+def test_unused_difficulty_is_not_compiled():
+    assert 'D' not in CompiledTable.from_dataframe('Edge', EDGE_TABLE).columns
+
+
+def test_lookup_matches_dataframe_on_synthetic_tables(workbooks, monkeypatch):
+    tables = pd.read_excel(workbooks[1], sheet_name=None)
+    for sheet_name, table in list(tables.items())[:4]:
+        compiled = CompiledTable.from_dataframe(sheet_name, table)
+        for difficulty, column in compiled.columns.items():
+            expected = expected_results(table, difficulty, monkeypatch)
+            assert {roll: column.lookup(roll) for roll in expected} == expected
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from entities import load_roster_store, simulate_encounters
+from entities import monte_carlo
+
+ENCOUNTERS = 40
+ROUNDS = 3
+
+
+@pytest.fixture
+def small_tasks(monkeypatch):
+    # Tasks of a few encounters each, so the encounters are split between
+    # several tasks and workers.
+    monkeypatch.setattr(monte_carlo, 'TASK_ROLLS', 64)
+
+
+def simulate(workbooks, max_workers, seed=11):
+    store = load_roster_store(workbooks[2], workbooks[1], seed)
+    return simulate_encounters(store, ENCOUNTERS, ROUNDS, max_workers=max_workers)
+
+
+def assert_same_result(result, other):
+    for name in ('action_counts', 'target_counts', 'status_counts',
+                 'surges_per_encounter', 'lulls_per_encounter'):
+        np.testing.assert_array_equal(getattr(result, name), getattr(other, name))
+
+
+def test_plan_splits_encounters(small_tasks):
+    tasks = monte_carlo.plan_tasks(ENCOUNTERS, ROUNDS, 12)
+    assert len(tasks) > 1
+    assert sum(tasks) == ENCOUNTERS
+
+
+def test_same_counts_for_any_number_of_workers(workbooks, small_tasks):
+    result = simulate(workbooks, max_workers=1)
+    assert_same_result(result, simulate(workbooks, max_workers=2))
+    assert_same_result(result, simulate(workbooks, max_workers=3))
+
+
+def test_every_roll_is_counted(workbooks, small_tasks):
+    result = simulate(workbooks, max_workers=2)
+    rolls = ENCOUNTERS * ROUNDS
+    assert (result.action_counts.sum(axis=1) == rolls).all()
+    assert (result.target_counts.sum(axis=1) == rolls).all()
+    assert result.surges_per_encounter.sum() == ENCOUNTERS
+
+
+def test_seed_changes_counts(workbooks, small_tasks):
+    result = simulate(workbooks, max_workers=1, seed=11)
+    other = simulate(workbooks, max_workers=1, seed=12)
+    assert not np.array_equal(result.action_counts, other.action_counts)
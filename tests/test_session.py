@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+
+from entities import load_roster, read_session, restore_session, session_snapshot, write_session
+from entities.session import ROSTER_FIELDS
+
+
+@pytest.fixture
+def session(workbooks, tmp_path):
+    """A saved session of the synthetic roster, every other combatant active and
+    each with its own random number generator part way through its stream."""
+    characters = load_roster(workbooks[2], workbooks[1])
+    for i, character in enumerate(characters):
+        character.rng = np.random.default_rng(i)
+        character.rng.random(i)
+    active = [i % 2 == 0 for i in range(len(characters))]
+    snapshot = session_snapshot(characters, active, workbooks[1], event_counter=7,
+                                roster_state={'seed': 5})
+    path = str(tmp_path / 'session.json')
+    write_session(path, snapshot)
+    return characters, active, snapshot, path
+
+
+def test_read_session_returns_what_was_written(session):
+    characters, active, snapshot, path = session
+    # JSON has no tuples, so compare with the snapshot as JSON would give it back.
+    assert read_session(path) == json.loads(json.dumps(snapshot))
+
+
+def test_restore_session_rebuilds_the_roster(session, workbooks):
+    characters, active, snapshot, path = session
+    restored, restored_active, changed = restore_session(read_session(path), workbooks[1])
+    assert changed == []
+    assert restored_active == active
+    for character, copy in zip(characters, restored):
+        assert ([getattr(copy, field) for field in ROSTER_FIELDS]
+                == [getattr(character, field) for field in ROSTER_FIELDS])
+        # The restored stream carries on where the saved one stopped.
+        assert copy.rng.random() == character.rng.random()
+
+
+def test_restore_session_lists_changed_worksheets(session, workbooks):
+    characters, active, snapshot, path = session
+    saved = read_session(path)
+    sheet_name = sorted(saved['tables'])[0]
+    saved['tables'][sheet_name]['hash'] = 'edited'
+    restored, restored_active, changed = restore_session(saved, workbooks[1])
+    assert changed == [sheet_name]
+
+
+def test_read_session_refuses_other_files(tmp_path):
+    path = tmp_path / 'other.json'
+    path.write_text('{"version": 0}')
+    with pytest.raises(ValueError):
+        read_session(str(path))
+    path.write_text('not json')
+    with pytest.raises(ValueError):
+        read_session(str(path))
@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from entities import sidecar
+from entities.sidecar import compile_workbook, open_workbook, sidecar_is_fresh, sidecar_path
+
+
+@pytest.fixture
+def workbook(workbooks, tmp_path):
+    """A copy of the synthetic combat tables workbook that a test may edit."""
+    path = str(tmp_path / 'combat-tables.xlsx')
+    shutil.copy(workbooks[1], path)
+    return path
+
+
+def edit_first_outcome(path, text):
+    wb = openpyxl.load_workbook(path)
+    wb[wb.sheetnames[0]].cell(row=2, column=5).value = text
+    wb.save(path)
+
+
+def test_missing_sidecar_is_stale(workbook):
+    assert not os.path.exists(sidecar_path(workbook))
+    assert not sidecar_is_fresh(workbook)
+
+
+def test_compiled_sidecar_is_fresh(workbook):
+    compile_workbook(workbook)
+    assert sidecar_is_fresh(workbook)
+
+
+def test_edited_workbook_makes_sidecar_stale(workbook):
+    compile_workbook(workbook)
+    edit_first_outcome(workbook, 'Edited Outcome')
+    assert not sidecar_is_fresh(workbook)
+    compiled = open_workbook(workbook)
+    assert sidecar_is_fresh(workbook)
+    assert compiled.parse(compiled.sheet_names[0])['Outcome'].iloc[0] == 'Edited Outcome'
+
+
+def test_sidecar_of_another_version_is_stale(workbook, monkeypatch):
+    compile_workbook(workbook)
+    monkeypatch.setattr(sidecar, 'SIDECAR_VERSION', sidecar.SIDECAR_VERSION + 1)
+    assert not sidecar_is_fresh(workbook)
+
+
+def test_unreadable_sidecar_is_stale_and_rebuilt(workbook):
+    with open(sidecar_path(workbook), 'wb') as f:
+        f.write(b'not a sidecar')
+    assert not sidecar_is_fresh(workbook)
+    open_workbook(workbook)
+    assert sidecar_is_fresh(workbook)
+
+
+def test_sidecar_matches_workbook(workbook):
+    compile_workbook(workbook)
+    compiled = open_workbook(workbook)
+    tables = pd.read_excel(workbook, sheet_name=None)
+    assert compiled.sheet_names == list(tables)
+    for sheet_name, table in tables.items():
+        pd.testing.assert_frame_equal(compiled.parse(sheet_name), table)
@@ -0,0 +1,67 @@
+import os
+import shutil
+
+import pytest
+
+from entities.workbook_cache import WorkbookCache
+
+
+@pytest.fixture(params=[True, False], ids=['sidecar', 'excel'])
+def cache(request):
+    cache = WorkbookCache(use_sidecar=request.param)
+    yield cache
+    cache.clear()
+
+
+@pytest.fixture
+def workbook(workbooks, tmp_path):
+    """A copy of the synthetic combat tables workbook that a test may touch."""
+    path = str(tmp_path / 'combat-tables.xlsx')
+    shutil.copy(workbooks[1], path)
+    return path
+
+
+def test_unchanged_workbook_is_cached(cache, workbook):
+    sheet_name = cache.get_sheet_names(workbook)[0]
+    table = cache.get_sheet(workbook, sheet_name)
+    assert cache.get_sheet(workbook, sheet_name) is table
+    assert cache.get_derived(workbook, sheet_name, 'rows', len) == len(table)
+
+
+def test_new_mtime_drops_worksheets(cache, workbook):
+    sheet_name = cache.get_sheet_names(workbook)[0]
+    table = cache.get_sheet(workbook, sheet_name)
+    cache.get_derived(workbook, sheet_name, 'rows', len)
+    stat = os.stat(workbook)
+    os.utime(workbook, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = cache.get_sheet(workbook, sheet_name)
+    assert reloaded is not table
+    assert reloaded.equals(table)
+    assert cache.get_derived(workbook, sheet_name, 'rows', lambda t: 'recomputed') == 'recomputed'
+
+
+def test_new_size_drops_worksheets(cache, workbook):
+    sheet_name = cache.get_sheet_names(workbook)[0]
+    table = cache.get_sheet(workbook, sheet_name)
+    stat = os.stat(workbook)
+    with open(workbook, 'ab') as f:
+        # Trailing bytes after the zip archive are ignored when it is read.
+        f.write(b'\0' * 16)
+    os.utime(workbook, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.workbook_key(workbook)[2] != stat.st_size
+    assert cache.get_sheet(workbook, sheet_name) is not table
+
+
+def test_missing_worksheet_raises(cache, workbook):
+    with pytest.raises(ValueError):
+        cache.get_sheet(workbook, 'No Such Worksheet')
+
+
+def test_eviction_keeps_max_sheets(workbook):
+    cache = WorkbookCache(max_sheets=2, use_sidecar=False)
+    sheet_names = cache.get_sheet_names(workbook)[:3]
+    first = cache.get_sheet(workbook, sheet_names[0])
+    for sheet_name in sheet_names[1:]:
+        cache.get_sheet(workbook, sheet_name)
+    assert cache.get_sheet(workbook, sheet_names[0]) is not first
+    cache.clear()